@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+"""
+Benchmark of precomp_manip.ClazMethodTables.
+Builds the tables for a synthetic class hierarchy, which has deep chains of
+inheritance, wide fan-out and interfaces implemented by many classes,
+and reports the elapsed time.
+"""
+
+__author__ = 'Toshihiro Kamiya <kamiya@mbj.nifty.com>'
+__status__ = 'experimental'
+
+import os.path as p
+import random
+import sys
+import time
+
+sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'src'))
+
+import precomp_manip as pm
+
+COMMON_METHODS = ["toString:()Ljava/lang/String;", "hashCode:()I", "run:()V", "accept:(Ljava/lang/Object;)V"]
+
+def gen_hierarchy(class_count, depth, interface_count, seed):
+    rnd = random.Random(seed)
+    clazs = ["p/C%d" % i for i in xrange(class_count)]
+    claz2deriving = {}
+    claz2methods = {}
+    levels = [[clazs[0]]]
+    for i, c in enumerate(clazs[1:]):
+        # extends a class in one of the levels, making chains of inheritance as deep as 'depth'
+        level = min(len(levels) - 1, rnd.randrange(depth))
+        claz2deriving.setdefault(rnd.choice(levels[level]), []).append(c)
+        if level + 1 == len(levels):
+            levels.append([])
+        levels[level + 1].append(c)
+    interfaces = ["p/I%d" % i for i in xrange(interface_count)]
+    for c in clazs:
+        for _ in xrange(rnd.randrange(3)):
+            claz2deriving.setdefault(rnd.choice(interfaces), []).append(c)
+    for c in clazs:
+        ms = rnd.sample(COMMON_METHODS, rnd.randint(0, len(COMMON_METHODS)))
+        ms.extend("m%d:()V" % rnd.randrange(class_count) for _ in xrange(5))
+        claz2methods[c] = ms
+    for c in interfaces:
+        claz2methods[c] = rnd.sample(COMMON_METHODS, 2)
+    return claz2methods, claz2deriving
+
+def main(argv):
+    from argparse import ArgumentParser
+    psr = ArgumentParser(description='Benchmark of building class-method tables of a class hierarchy')
+    psr.add_argument('-c', '--class-count', action='store', type=int, default=20000)
+    psr.add_argument('-d', '--depth', action='store', type=int, default=200)
+    psr.add_argument('-i', '--interface-count', action='store', type=int, default=50)
+    psr.add_argument('--seed', action='store', type=int, default=1)
+    psr.add_argument('-r', '--repeat', action='store', type=int, default=3)
+    args = psr.parse_args(argv[1:])
+
+    claz2methods, claz2deriving = gen_hierarchy(args.class_count, args.depth, args.interface_count, args.seed)
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), args.depth * 4))
+
+    best = None
+    for _ in xrange(args.repeat):
+        start_time = time.time()
+        pm.ClazMethodTables(claz2methods, claz2deriving, lambda c, m: False)
+        elapsed = time.time() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    print "classes: %d, interfaces: %d, max depth: %d" % (args.class_count, args.interface_count, args.depth)
+    print "best of %d: %.3f seconds" % (args.repeat, best)
+
+if __name__ == '__main__':
+    main(sys.argv)
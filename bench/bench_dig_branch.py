@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+"""
+Benchmark of gen_ngram.gen_code_ngrams on branch-heavy code.
+Generates n-grams of a synthetic method, which has a sequence of if blocks 
+(each of which calls the same method, e.g. if (debug) log(...);) separated by runs of 
+invocations and followed by a run of invocations, with and without pruning the states already dug, and reports the elapsed times 
+(and checks the n-grams are the same).
+With an option --large, also generates n-grams of a large method having thousands of if blocks 
+(only with pruning), and calculates the block entrance cells reachable from each node of
+a synthetic generated-parser-like method (the one of bench_precompile.py), which is done 
+before digging a method.
+"""
+
+__author__ = 'Toshihiro Kamiya <kamiya@mbj.nifty.com>'
+__status__ = 'experimental'
+
+import os.path as p
+import sys
+import time
+
+sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'src'))
+
+import gen_ngram as gn
+import precomp_manip as pm
+import bench_precompile
+
+def gen_ope_list(block_count, run_length, tail_length):
+    ope_list = []
+    def invoke(name):
+        ope_list.append(('invokestatic', ('#1',), '// Method p/Lib.%s:()V' % name))
+    for b in xrange(block_count):
+        index = len(ope_list)
+        ope_list.append(('iload_1', (), None))
+        ope_list.append(('ifeq', (str(index + 3),), None))
+        invoke("log")
+        for i in xrange(run_length):
+            invoke("run%d_%d" % (b, i))
+    for i in xrange(tail_length):
+        invoke("tail%d" % i)
+    ope_list.append(('return', (), None))
+    return ope_list
+
+def bench_large(block_count, parser_size, ngram_size):
+    claz_method_tables = pm.ClazMethodTables({}, {}, lambda c, m: False)
+    ope_list = gen_ope_list(block_count, 1, 8)
+    precomp = pm.precompile_code('p/Main', ope_list, claz_method_tables=claz_method_tables)
+    start_time = time.time()
+    found_ngrams = gn.gen_code_ngrams('p/Main', 'main:()V', {'main:()V': {'p/Main': precomp}}, ngram_size)
+    elapsed = time.time() - start_time
+    print "large method, blocks: %d, instructions: %d, n-grams: %d, prune_seen_states=True: %.3f seconds" % \
+            (block_count, len(ope_list), gn.format_ngrams(found_ngrams).count('\n\n'), elapsed)
+
+    ope_list = bench_precompile.gen_ope_list(parser_size, 1)
+    precomp = pm.precompile_code('p/Parser', ope_list, claz_method_tables=claz_method_tables)
+    start_time = time.time()
+    precomp.reachable_bent_mask(precomp.start_node)
+    elapsed = time.time() - start_time
+    print "parser-like method, instructions: %d, block entrance cells: %d, reachable block entrance cells: %.3f seconds" % \
+            (len(ope_list), sum(precomp.bents), elapsed)
+
+def main(argv):
+    from argparse import ArgumentParser
+    psr = ArgumentParser(description='Benchmark of generating n-grams of a branch-heavy method')
+    psr.add_argument('-b', '--block-count', action='store', type=int, default=16,
+            help='number of if blocks of the synthetic method')
+    psr.add_argument('-l', '--run-length', action='store', type=int, default=0,
+            help='number of invocations between if blocks')
+    psr.add_argument('-t', '--tail-length', action='store', type=int, default=8,
+            help='number of invocations after the if blocks')
+    psr.add_argument('-n', '--ngram-size', action='store', type=int, default=6)
+    psr.add_argument('--large', action='store_true',
+            help='also run the cases of large methods')
+    psr.add_argument('--large-block-count', action='store', type=int, default=5000,
+            help='number of if blocks of the large method')
+    psr.add_argument('--parser-size', action='store', type=int, default=20000,
+            help='number of instructions of the parser-like method')
+    args = psr.parse_args(argv[1:])
+
+    ope_list = gen_ope_list(args.block_count, args.run_length, args.tail_length)
+    precomp = pm.precompile_code('p/Main', ope_list, claz_method_tables=pm.ClazMethodTables({}, {}, lambda c, m: False))
+    method2claz2precomp = {'main:()V': {'p/Main': precomp}}
+
+    texts = []
+    for prune_seen_states in (True, False):
+        start_time = time.time()
+        found_ngrams = gn.gen_code_ngrams('p/Main', 'main:()V', method2claz2precomp, args.ngram_size,
+                prune_seen_states=prune_seen_states)
+        elapsed = time.time() - start_time
+        texts.append(gn.format_ngrams(found_ngrams))
+        print "prune_seen_states=%s: %.3f seconds" % (prune_seen_states, elapsed)
+    print "blocks: %d, n-grams: %d, same: %s" % (args.block_count, texts[0].count('\n\n'), texts[0] == texts[1])
+    if args.large:
+        bench_large(args.large_block_count, args.parser_size, args.ngram_size)
+
+if __name__ == '__main__':
+    main(sys.argv)
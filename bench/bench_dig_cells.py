@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+"""
+Microbenchmark of the dig of gen_ngram.gen_code_ngrams.
+Generates n-grams of a synthetic chain of methods, each of which has an if block
+(if (debug) log(...);), a call of the next method in the chain and a run of library method calls,
+and reports the elapsed time, the number of cells dug (counted in another run)
+and the cost per cell. With a long chain and a large max call depth,
+the calls are expanded deeper than the recursion limit of Python.
+"""
+
+__author__ = 'Toshihiro Kamiya <kamiya@mbj.nifty.com>'
+__status__ = 'experimental'
+
+import os.path as p
+import sys
+import time
+
+sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'src'))
+
+import gen_ngram as gn
+import precomp_manip as pm
+
+class CountingList(list):
+    count = 0
+
+    def __getitem__(self, i):
+        CountingList.count += 1
+        return list.__getitem__(self, i)
+
+def gen_ope_list(i, chain_length, pre_length, post_length):
+    ope_list = []
+    def invoke(name):
+        ope_list.append(('invokestatic', ('#1',), '// Method %s:()V' % name))
+    for k in xrange(pre_length):
+        invoke("p/Lib.pre%d_%d" % (i, k))
+    index = len(ope_list)
+    ope_list.append(('iload_1', (), None))
+    ope_list.append(('ifeq', (str(index + 3),), None))
+    invoke("p/Lib.log")
+    if i + 1 < chain_length:
+        invoke("p/Chain.m%d" % (i + 1))
+    for k in xrange(post_length):
+        invoke("p/Lib.post%d_%d" % (i, k))
+    ope_list.append(('return', (), None))
+    return ope_list
+
+def main(argv):
+    from argparse import ArgumentParser
+    psr = ArgumentParser(description='Microbenchmark of digging a chain of method calls')
+    psr.add_argument('-c', '--chain-length', action='store', type=int, default=200,
+            help='number of methods in the chain')
+    psr.add_argument('-p', '--pre-length', action='store', type=int, default=0,
+            help='number of library method calls before the if block of each method')
+    psr.add_argument('-l', '--post-length', action='store', type=int, default=4,
+            help='number of library method calls after the call of the next method')
+    psr.add_argument('-n', '--ngram-size', action='store', type=int, default=6)
+    psr.add_argument('--max-call-depth', action='store', type=int, default=400)
+    psr.add_argument('-r', '--repeat', action='store', type=int, default=3)
+    args = psr.parse_args(argv[1:])
+
+    claz_method_tables = pm.ClazMethodTables({}, {}, lambda c, m: False)
+    method2claz2precomp = {}
+    for i in xrange(args.chain_length):
+        precomp = pm.precompile_code('p/Chain', gen_ope_list(i, args.chain_length, args.pre_length, args.post_length),
+                claz_method_tables=claz_method_tables)
+        method2claz2precomp['m%d:()V' % i] = {'p/Chain': precomp}
+
+    def gen_ngrams():
+        return gn.gen_code_ngrams('p/Chain', 'm0:()V', method2claz2precomp, args.ngram_size,
+                max_call_depth=args.max_call_depth)
+
+    best = None
+    for _ in xrange(args.repeat):
+        start_time = time.time()
+        found_ngrams = gen_ngrams()
+        elapsed = time.time() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    text = gn.format_ngrams(found_ngrams)
+
+    # count the cells dug, as lookups of the commands of the cells
+    cmds_list = []
+    for c2p in method2claz2precomp.itervalues():
+        for precomp in c2p.itervalues():
+            precomp.superblocks()
+            cmds_list.append((precomp, precomp.cmds))
+            precomp.cmds = CountingList(precomp.cmds)
+    CountingList.count = 0
+    assert gn.format_ngrams(gen_ngrams()) == text
+    cell_count = CountingList.count
+    for precomp, cmds in cmds_list:
+        precomp.cmds = cmds
+
+    print "chain length: %d, n-grams: %d" % (args.chain_length, text.count('\n\n'))
+    print "best of %d: %.3f seconds, cells: %d, %.2f usec/cell" % (args.repeat, best, cell_count, best * 1e6 / cell_count)
+
+if __name__ == '__main__':
+    main(sys.argv)
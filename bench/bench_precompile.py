@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+"""
+Benchmark of precomp_manip.precompile_code.
+Precompiles a synthetic large method, which resembles generated code such as
+parsers and state machines (runs of branches, switches, goto chains and
+repeated invocations), and reports the elapsed time.
+"""
+
+__author__ = 'Toshihiro Kamiya <kamiya@mbj.nifty.com>'
+__status__ = 'experimental'
+
+import os.path as p
+import random
+import sys
+import time
+
+sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'src'))
+
+import precomp_manip as pm
+
+METHOD_COMMENTS = ["// Method p/Lexer.next:()I", "// Method p/Lexer.peek:()I", "// Method p/Parser.reduce:(I)V"]
+
+def gen_ope_list(size, seed):
+    rnd = random.Random(seed)
+    ope_list = []
+    for index in xrange(size - 1):
+        r = rnd.random()
+        if r < 0.25:
+            ope_list.append(('invokestatic', ('#1',), METHOD_COMMENTS[(index // 8) % len(METHOD_COMMENTS)]))
+        elif r < 0.45:
+            ope_list.append(('ifeq', (str(rnd.randint(index + 1, min(size - 1, index + 64))),), None))
+        elif r < 0.55:
+            ope_list.append(('goto', (str(rnd.randint(max(0, index - 64), min(size - 1, index + 64))),), None))
+        elif r < 0.58:
+            dests = [rnd.randint(index + 1, min(size - 1, index + 256)) for _ in xrange(4)]
+            ope_list.append(('tableswitch', tuple((str(v), str(d)) for v, d in enumerate(dests)), None))
+        else:
+            ope_list.append(('iload_1', (), None))
+    ope_list.append(('return', (), None))
+    return ope_list
+
+def main(argv):
+    from argparse import ArgumentParser
+    psr = ArgumentParser(description='Benchmark of precompiling a large method')
+    psr.add_argument('-s', '--size', action='store', type=int, default=50000,
+            help='number of instructions of the synthetic method')
+    psr.add_argument('--seed', action='store', type=int, default=1)
+    psr.add_argument('-r', '--repeat', action='store', type=int, default=3)
+    args = psr.parse_args(argv[1:])
+
+    ope_list = gen_ope_list(args.size, args.seed)
+    claz_method_tables = pm.ClazMethodTables({}, {}, lambda c, m: False)
+
+    best = None
+    for _ in xrange(args.repeat):
+        start_time = time.time()
+        pm.precompile_code('p/Parser', ope_list, claz_method_tables=claz_method_tables)
+        elapsed = time.time() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    print "instructions: %d" % len(ope_list)
+    print "best of %d: %.3f seconds" % (args.repeat, best)
+
+if __name__ == '__main__':
+    main(sys.argv)
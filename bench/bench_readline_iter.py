@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+"""
+Benchmark of _utilities.readline_iter.
+Makes a large file by repeating a text file (by default, the reference n-gram file of
+test/samplecode), and compares the throughput of readline_iter with the line-by-line
+decoding and escaping of each line.
+"""
+
+__author__ = 'Toshihiro Kamiya <kamiya@mbj.nifty.com>'
+__status__ = 'experimental'
+
+import os
+import os.path as p
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'src'))
+
+import _utilities as u
+
+DEFAULT_TEXT_FILE = p.join(p.dirname(p.abspath(__file__)), '..', 'test', 'samplecode', 'reference_data', 'ngram.txt')
+
+def line_by_line_readline_iter(filename):
+    with open(filename, "rb") as f:
+        for L in f:
+            yield u._quote_line(L)
+
+def measure(func, filename):
+    start_time = time.time()
+    lines = list(func(filename))
+    return time.time() - start_time, lines
+
+def main(argv):
+    from argparse import ArgumentParser
+    psr = ArgumentParser(description='Benchmark of reading lines of a file')
+    psr.add_argument('text_file', nargs='?', action='store', default=DEFAULT_TEXT_FILE)
+    psr.add_argument('-s', '--scale', action='store', type=int, default=2000,
+            help='times the text file is repeated')
+    args = psr.parse_args(argv[1:])
+
+    with open(args.text_file, "rb") as f:
+        text = f.read()
+    fd, filename = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for _ in xrange(args.scale):
+                f.write(text)
+        size = os.path.getsize(filename)
+        base_time, base_lines = measure(line_by_line_readline_iter, filename)
+        fast_time, fast_lines = measure(u.readline_iter, filename)
+    finally:
+        os.remove(filename)
+    assert fast_lines == base_lines
+    print "file: %.1f MB, %d lines" % (size / 1e6, len(base_lines))
+    print "line by line: %.3f seconds (%.1f MB/sec)" % (base_time, size / 1e6 / max(base_time, 1e-9))
+    print "readline_iter: %.3f seconds (%.1f MB/sec)" % (fast_time, size / 1e6 / max(fast_time, 1e-9))
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+"""
+Benchmark of asm_manip.split_into_method_iter.
+Parses all disassembled files in a directory (read into memory in advance)
+and reports the throughput in lines/second.
+"""
+
+__author__ = 'Toshihiro Kamiya <kamiya@mbj.nifty.com>'
+__status__ = 'experimental'
+
+import os.path as p
+import sys
+import time
+
+sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'src'))
+
+import asm_manip as am
+
+def main(argv):
+    from argparse import ArgumentParser
+    psr = ArgumentParser(description='Benchmark of parsing disassembled files')
+    psr.add_argument('asm_directory', action='store')
+    psr.add_argument('-r', '--repeat', action='store', type=int, default=3)
+    args = psr.parse_args(argv[1:])
+
+    file_lines = list(am.asm_filetext_iter(args.asm_directory))
+    line_count = sum(len(lines) for _, lines in file_lines)
+
+    best = None
+    for _ in xrange(args.repeat):
+        start_time = time.time()
+        for asmfile, lines in file_lines:
+            for _ in am.split_into_method_iter(asmfile, lines):
+                pass
+        elapsed = time.time() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    print "files: %d, lines: %d" % (len(file_lines), line_count)
+    print "best of %d: %.3f seconds (%.0f lines/sec)" % (args.repeat, best, line_count / max(best, 1e-9))
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -3,25 +3,159 @@
 __author__ = 'Toshihiro Kamiya <kamiya@mbj.nifty.com>'
 __status__ = 'experimental'
 
+import bz2
 import contextlib
+import itertools
+import os
+import Queue
+import re
 import sys
+import threading
 import urllib2
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None  # xz-compressed files are not supported
 
 ASCII_SYMBOLS_EXCEPT_FOR_PERCENT = " \t!\"#$&`()*+,-./:;<=>?@[\\]^_'{|}~"
 
+def _quote_line(L):
+    L = L.decode('utf-8').rstrip().encode('utf-8')
+    return urllib2.quote(L, safe=ASCII_SYMBOLS_EXCEPT_FOR_PERCENT)
+
+# a byte which is escaped by _quote_line, that is, other than tab and printable ASCII characters except for '%'
+_pat_byte_to_quote = re.compile(r'[^\t -$&-~]')
+
+READ_BLOCK_SIZE = 1 << 20
+
+def _block_iter(f, read):
+    while True:
+        block = read(f, READ_BLOCK_SIZE)
+        if not block:
+            break
+        yield block
+
+class CompressionError(ValueError):
+    pass
+
+# compression formats: pattern of the stream header, extensions
+# (the header of bz2 is followed by the magic of the first block, or of the end of an empty stream)
+_COMPRESSION_FORMATS = [
+    ('gzip', re.compile(r'\x1f\x8b\x08'), ('.gz',)),
+    ('bz2', re.compile(r'BZh[1-9](1AY&SY|\x17rE8P\x90)'), ('.bz2',)),
+    ('xz', re.compile(r'\xfd7zXZ\x00'), ('.xz',)),
+]
+_MAX_HEADER_LENGTH = 10
+COMPRESSED_FILE_EXTS = tuple(ext for _, _, exts in _COMPRESSION_FORMATS for ext in exts)
+
+def _new_decompressor(fmt):
+    if fmt == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif fmt == 'bz2':
+        return bz2.BZ2Decompressor()
+    else:
+        if lzma is None:
+            raise CompressionError("xz-compressed file requires module lzma (backports.lzma)")
+        return lzma.LZMADecompressor()
+
+def _new_compressor(fmt):
+    if fmt == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif fmt == 'bz2':
+        return bz2.BZ2Compressor()
+    else:
+        if lzma is None:
+            raise CompressionError("xz-compressed file requires module lzma (backports.lzma)")
+        return lzma.LZMACompressor()
+
+def compression_format_of_filename(filename):
+    for fmt, _, exts in _COMPRESSION_FORMATS:
+        if filename.endswith(exts):
+            return fmt
+    return None
+
+def decompressed_block_iter(blocks):
+    """
+    Iterate blocks of data, decompressing them when the data begins with 
+    a stream header of gzip, bz2 or xz (multiple concatenated streams are also decompressed).
+    """
+    blocks = iter(blocks)
+    head = ''
+    for block in blocks:
+        head += block
+        if len(head) >= _MAX_HEADER_LENGTH:
+            break
+    fmt = None
+    for f, pat_header, _ in _COMPRESSION_FORMATS:
+        if pat_header.match(head):
+            fmt = f
+            break
+    if fmt is None:
+        if head:
+            yield head
+        for block in blocks:
+            yield block
+        return
+
+    d = _new_decompressor(fmt)
+    for block in itertools.chain([head], blocks):
+        while block:
+            try:
+                data = d.decompress(block)
+            except EOFError:  # end of a stream (bz2), followed by another stream
+                d = _new_decompressor(fmt)
+                continue
+            if data:
+                yield data
+            block = d.unused_data
+            if block:
+                d = _new_decompressor(fmt)
+    data = d.flush() if hasattr(d, 'flush') else ''
+    if data:
+        yield data
+
 def readline_iter(filename):
+    """
+    Iterate lines of a file ('-' means stdin), with trailing white spaces removed and
+    the characters other than tab and printable ASCII ones (and '%') escaped with urllib2.quote.
+    The file is read by large blocks, and a line is escaped only when it contains such a character.
+    A compressed file (gzip, bz2 or xz) is decompressed transparently.
+    """
     if filename != '-':
         with open(filename, "rb") as f:
-            for L in f:
-                L = L.decode('utf-8').rstrip().encode('utf-8')
-                L = urllib2.quote(L, safe=ASCII_SYMBOLS_EXCEPT_FOR_PERCENT)
+            for L in line_iter(decompressed_block_iter(_block_iter(f, lambda f, size: f.read(size)))):
                 yield L
     else:
-        for L in sys.stdin:
-            L = L.decode('utf-8').rstrip().encode('utf-8')
-            L = urllib2.quote(L, safe=ASCII_SYMBOLS_EXCEPT_FOR_PERCENT)
+        # os.read returns data as soon as available, not waiting a whole block from a pipe
+        for L in line_iter(decompressed_block_iter(_block_iter(sys.stdin.fileno(), os.read))):
             yield L
 
+def line_iter(blocks):
+    """
+    Iterate lines of a text given as blocks (strings), processing each line as readline_iter does.
+    """
+    search_byte_to_quote = _pat_byte_to_quote.search
+    rest = ''
+    for block in blocks:
+        lines = block.split('\n')
+        lines[0] = rest + lines[0]
+        rest = lines.pop()
+        for L in lines:
+            s = L.rstrip()
+            if search_byte_to_quote(s):
+                s = _quote_line(L)
+            yield s
+    if rest:
+        s = rest.rstrip()
+        if search_byte_to_quote(s):
+            s = _quote_line(rest)
+        yield s
+
 def sort_uniq(lst):
     lst.sort()
     if len(lst) <= 1:
@@ -30,6 +164,94 @@ def sort_uniq(lst):
     dummy = None if lst[0] is not None else 1
     return [item for item, prev_item in zip(lst, [dummy] + lst) if item != prev_item]
 
+class CompressingWriter(object):
+    """
+    A file-like object which compresses the written data into a file.
+    The data is compressed and written by a background thread, in chunks of chunk_size bytes.
+    """
+
+    def __init__(self, f, fmt, chunk_size=1 << 20):
+        self._f = f
+        self._compressor = _new_compressor(fmt)
+        self._chunk_size = chunk_size
+        self._buf = []
+        self._buf_len = 0
+        self._queue = Queue.Queue(maxsize=4)
+        self._error = None
+        self._thread = threading.Thread(target=self._compress_chunks)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _compress_chunks(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                break
+            if self._error is not None:
+                continue  # just drain the queue
+            try:
+                self._f.write(self._compressor.compress(chunk))
+            except Exception as e:
+                self._error = e
+
+    def write(self, s):
+        s = str(s)
+        self._buf.append(s)
+        self._buf_len += len(s)
+        if self._buf_len >= self._chunk_size:
+            self._put_buf()
+
+    def _put_buf(self):
+        if self._error is not None:
+            raise self._error
+        if self._buf:
+            self._queue.put(''.join(self._buf))
+            self._buf = []
+            self._buf_len = 0
+
+    def flush(self):
+        pass
+
+    def close(self):
+        try:
+            self._put_buf()
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+        self._f.write(self._compressor.flush())
+        self._f.close()
+
+def open_output(filename):
+    """
+    Opens a file to write. When the extension of the file name is .gz, .bz2 or .xz,
+    returns a CompressingWriter, which compresses the data in a background thread.
+    """
+    fmt = compression_format_of_filename(filename)
+    f = open(filename, "wb")
+    if fmt is None:
+        return f
+    return CompressingWriter(f, fmt)
+
+@contextlib.contextmanager
+def stdout_to(filename):
+    """
+    Redirects sys.stdout to a file (see open_output) within a with block.
+    When filename is None or '-', sys.stdout is not changed.
+    """
+    if filename is None or filename == '-':
+        yield
+        return
+    f = open_output(filename)
+    saved_stdout = sys.stdout
+    sys.stdout = f
+    try:
+        yield
+    finally:
+        sys.stdout = saved_stdout
+        f.close()
+
 @contextlib.contextmanager
 def auto_pop(lst):
     original_length = len(lst)
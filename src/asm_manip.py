@@ -7,11 +7,19 @@ javap's disassembled file manipulation.
 __author__ = 'Toshihiro Kamiya <kamiya@mbj.nifty.com>'
 __status__ = 'experimental'
 
+import collections
+import hashlib
+import marshal
+import mmap
+import multiprocessing
 import os
 import re
+import tempfile
+import threading
 
-from _utilities import readline_iter
+from _utilities import readline_iter, line_iter, COMPRESSED_FILE_EXTS
 
+import ope_manip as om
 import type_formatter as tf
 
 def indent_width(L):
@@ -20,17 +28,148 @@ def indent_width(L):
             return i
     return 0
 
+ASM_FILE_EXTS = (".asm",) + tuple(".asm" + ext for ext in COMPRESSED_FILE_EXTS)
+ASM_PACK_INDEX_EXT = ".idx"
+ASM_PACK_SEPARATOR = "!/"
+
+def is_asm_pack(path):
+    """
+    Returns True when path is a packed asm file (written by AsmPackWriter), 
+    which consists of a data file (path) and an index file (path + ".idx").
+    """
+    return os.path.isfile(path) and os.path.isfile(path + ASM_PACK_INDEX_EXT)
+
+class AsmPackWriter(object):
+    """
+    Writer of a packed asm file, an append-only data file of disassembled texts 
+    and an index file, each line of which is "name<tab>offset<tab>length".
+    When a name is written twice, the latter one is effective.
+    Thread safe.
+    """
+
+    def __init__(self, pack_file):
+        self._data = open(pack_file, "ab")
+        self._data.seek(0, os.SEEK_END)
+        self._index = open(pack_file + ASM_PACK_INDEX_EXT, "ab")
+        self._lock = threading.Lock()
+
+    def write(self, name, data):
+        with self._lock:
+            offset = self._data.tell()
+            self._data.write(data)
+            self._data.flush()
+            self._index.write("%s\t%d\t%d\n" % (name, offset, len(data)))
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+class AsmPack(object):
+    """
+    Reader of a packed asm file. The data file is memory-mapped.
+    """
+
+    def __init__(self, pack_file):
+        self.pack_file = pack_file
+        self._entries = {}
+        with open(pack_file + ASM_PACK_INDEX_EXT, "rb") as f:
+            for L in f:
+                name, offset, length = L.rstrip('\n').split('\t')
+                self._entries[name] = (int(offset), int(length))
+        with open(pack_file, "rb") as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._data = ''
+
+    def names(self):
+        # in the same order as asm_file_iter yields the files of a directory
+        return sorted(self._entries.iterkeys(), key=lambda name: name + ".asm")
+
+    def asmfile_of(self, name):
+        return self.pack_file + ASM_PACK_SEPARATOR + name + ".asm"
+
+    def data(self, name):
+        offset, length = self._entries[name]
+        return self._data[offset:offset + length]
+
+_opened_asm_packs = {}
+
+def open_asm_pack(pack_file):
+    pack = _opened_asm_packs.get(pack_file)
+    if pack is None:
+        pack = _opened_asm_packs[pack_file] = AsmPack(pack_file)
+    return pack
+
+def split_asm_pack_entry(asmfile):
+    """
+    Returns (pack_file, name) when asmfile is an entry of a packed asm file (such as 'corpus.pack!/a.B.asm'), 
+    otherwise None.
+    """
+    p = asmfile.rfind(ASM_PACK_SEPARATOR)
+    if p < 0 or not asmfile.endswith(".asm"):
+        return None
+    pack_file = asmfile[:p]
+    if pack_file not in _opened_asm_packs and not is_asm_pack(pack_file):
+        return None
+    return pack_file, asmfile[p + len(ASM_PACK_SEPARATOR):-len(".asm")]
+
 def asm_file_iter(asmdir):
+    """
+    Iterate disassembled files (including compressed ones, such as .asm.gz) in a directory, 
+    or entries of a packed asm file (see AsmPack).
+    """
+    if is_asm_pack(asmdir):
+        pack = open_asm_pack(asmdir)
+        for name in pack.names():
+            yield pack.asmfile_of(name)
+        return
     for root, dirs, files in os.walk(asmdir, topdown=True):
         dirs.sort()
         files.sort()
         for f in files:
-            if f.endswith(".asm"):
+            if f.endswith(ASM_FILE_EXTS):
                 yield os.path.join(root, f)
 
+def corpus_fingerprint(path):
+    """
+    Returns a hash of the names, sizes and mtimes of the files of a corpus, that is,
+    a directory (of disassembled files or class files), a packed asm file or a jar file.
+    """
+    path = os.path.abspath(path)
+    if os.path.isdir(path):
+        files = []
+        for root, dirs, fs in os.walk(path):
+            files.extend(os.path.join(root, f) for f in fs)
+        files.sort()
+    else:
+        files = [path]
+        if is_asm_pack(path):
+            files.append(path + ASM_PACK_INDEX_EXT)
+    h = hashlib.sha1()
+    for f in files:
+        st = os.stat(f)
+        h.update("%s\t%d\t%r\n" % (f.encode('utf-8') if isinstance(f, unicode) else f, st.st_size, st.st_mtime))
+    return h.hexdigest()
+
+def read_asm_file_data(asmfile):
+    pack_entry = split_asm_pack_entry(asmfile)
+    if pack_entry is not None:
+        pack_file, name = pack_entry
+        return open_asm_pack(pack_file).data(name)
+    with open(asmfile, "rb") as f:
+        return f.read()
+
+def asm_file_lines(asmfile):
+    pack_entry = split_asm_pack_entry(asmfile)
+    if pack_entry is not None:
+        pack_file, name = pack_entry
+        return list(line_iter([open_asm_pack(pack_file).data(name)]))
+    return list(readline_iter(asmfile))
+
 def asm_filetext_iter(asmdir):
     for asmfile in asm_file_iter(asmdir):
-        yield asmfile, list(readline_iter(asmfile))
+        yield asmfile, asm_file_lines(asmfile)
 
 def remove_generics_args(s):
     if re.match(r"^\s+((public|private|static|final)\s+)*(java.lang.String|char) .*$", s) and \
@@ -56,17 +195,26 @@ def remove_generics_args(s):
 
 COMPILED_FROM = 'COMPILED_FROM'
 METHOD_CODE = 'METHOD_CODE'
+METHOD_OPE_LIST = 'METHOD_OPE_LIST'  # yielded by classfile_manip, in place of METHOD_CODE
 INHERITANCE = 'INHERITANCE'
 
+_method_attribute = frozenset("public|private|protected|final|abstract|synchronized|static".split('|'))
+_typ = r'(\w|[.$\[\]])+'
+_pat_compiled_from = re.compile(r'^Compiled from\s+"(?P<file>[^"]+)"')
+_pat_class = re.compile(r'^((public|private|final|abstract|strictfp) +)*class +(?P<id>TYP) +({|extends|implements)'.replace('TYP', _typ))
+_pat_interface = re.compile(r'^((public|private|abstract|strictfp) +)*interface +(?P<id>TYP) +({|extends)'.replace('TYP', _typ))
+_pat_static = re.compile(r'^  static +{};$')
+_pat_method = re.compile(r'^  ((public|private|protected|final|abstract|synchronized|static) +)*(?P<retv>TYP) +(?P<name>[\w$]+)[(](?P<args>((TYP, )*TYP)?)[)](;| +throws)'.replace('TYP', _typ))
+_pat_ctor = re.compile(r'^  ((public|private|protected) +)*(?P<name>TYP)[(](?P<args>((TYP, )*TYP)?)[)](;| +throws)'.replace('TYP', _typ))
+
 def split_into_method_iter(asmfile, lines):
-    method_attribute = frozenset("public|private|protected|final|abstract|synchronized|static".split('|'))
-    pat_compiled_from = re.compile(r'^Compiled from\s+"(?P<file>[^"]+)"')
-    typ = r'(\w|[.$\[\]])+'
-    pat_class = re.compile(r'^((public|private|final|abstract|strictfp) +)*class +(?P<id>TYP) +({|extends|implements)'.replace('TYP', typ))
-    pat_interface = re.compile(r'^((public|private|abstract|strictfp) +)*interface +(?P<id>TYP) +({|extends)'.replace('TYP', typ))
-    pat_static = re.compile(r'^  static +{};$')
-    pat_method = re.compile(r'^  ((public|private|protected|final|abstract|synchronized|static) +)*(?P<retv>TYP) +(?P<name>[\w$]+)[(](?P<args>((TYP, )*TYP)?)[)](;| +throws)'.replace('TYP', typ))
-    pat_ctor = re.compile(r'^  ((public|private|protected) +)*(?P<name>TYP)[(](?P<args>((TYP, )*TYP)?)[)](;| +throws)'.replace('TYP', typ))
+    method_attribute = _method_attribute
+    pat_compiled_from = _pat_compiled_from
+    pat_class = _pat_class
+    pat_interface = _pat_interface
+    pat_static = _pat_static
+    pat_method = _pat_method
+    pat_ctor = _pat_ctor
 
     def pack(class_name, method_sig, method_body):
         if class_name == None:
@@ -79,24 +227,29 @@ def split_into_method_iter(asmfile, lines):
     class_name, method_sig, method_body = None, None, None
 
     def scan_extends_and_implements(L):
-        fields = re.split('{| extends | implements ', L)
-        fields = filter(None, [f.strip() for f in fields])
-        lf = len(fields)
-        if lf == 1:
-            return (), ()
-        elif lf == 2:
-            return (fields[1].strip(), ), ()
-        elif lf == 3:
-            return (fields[1].strip(), ), tuple(filter(None, [i.strip() for i in fields[2].split(',')]))
-        else:
-            assert False
+        decl = L.split('{')[0]
+        exts, imps = (), ()
+        p = decl.find(' implements ')
+        if p >= 0:
+            imps = tuple(filter(None, [i.strip() for i in decl[p + len(' implements '):].split(',')]))
+            decl = decl[:p]
+        p = decl.find(' extends ')
+        if p >= 0:
+            exts = tuple(filter(None, [e.strip() for e in decl[p + len(' extends '):].split(',')]))
+        return exts, imps
     
     for ln, L in enumerate(lines):
         if not L: continue # skip empty lines
-        L = remove_generics_args(L)
+        if '<' in L:  # remove_generics_args does not change a line without '<'
+            L = remove_generics_args(L)
 
-        iw = indent_width(L)
-        if iw == 0:
+        # lines are classified by indentation first, and only the declaration lines 
+        # (indentation 0 or 2) are matched with the regexes.
+        stripped = L.lstrip(' ')
+        iw = len(L) - len(stripped) if stripped else 0
+        if iw >= 4:
+            method_body.append(L)
+        elif iw == 0:
             m = pat_compiled_from.match(L)
             if m:
                 yield COMPILED_FROM, m.group('file')
@@ -108,8 +261,8 @@ def split_into_method_iter(asmfile, lines):
                         method_sig, method_body = None, None
                     class_name = m.group('id')
                     class_name = tf.format_sig_in_javap_comment_style(class_name, None, None, None)
-                    imps, exts = scan_extends_and_implements(L)
-                    yield INHERITANCE, (class_name, imps, exts)
+                    exts, imps = scan_extends_and_implements(L)
+                    yield INHERITANCE, (class_name, exts, imps)
                 else:
                     m = pat_interface.match(L)
                     if m:
@@ -117,12 +270,18 @@ def split_into_method_iter(asmfile, lines):
                             yield METHOD_CODE, pack(class_name, method_sig, method_body)
                             method_sig, method_body = None, None
                         class_name = None
+                        # the extended interfaces of an interface are recorded as its implementing interfaces
+                        interface_name = tf.format_sig_in_javap_comment_style(m.group('id'), None, None, None)
+                        exts, _ = scan_extends_and_implements(L)
+                        yield INHERITANCE, (interface_name, (), exts)
                     else:
                         if L.startswith("Compiled from ") or L == "}":
                             pass
                         else:
                             raise AssertionError("unexpected line: %s: %d: %s" % (asmfile, ln + 1, L))
         elif iw == 2:
+            if '(' not in L and '{' not in L:
+                continue  # a field, which matches none of pat_method, pat_ctor, pat_static
             m = pat_method.match(L)
             if m and m.group('retv') not in method_attribute:
                 if class_name and method_sig:
@@ -177,11 +336,118 @@ def split_method_body_to_code_and_tables(method_body_lines):
 
 ASM_FILE = 'ASM_FILE'
 
-def get_asm_info_iter(asm_dir):
+def asm_file_info_iter(asmfile):
+    """
+    Iterate each method definition of a disassembled file.
+    Yielded values are the same as get_asm_info_iter yields, starting with (ASM_FILE, asmfile).
+    """
+    yield ASM_FILE, asmfile
+    for typ, values in split_into_method_iter(asmfile, asm_file_lines(asmfile)):
+        if typ in (COMPILED_FROM, INHERITANCE):
+            yield typ, values
+        elif typ == METHOD_CODE:
+            claz_sig, body = values
+            code, exception_table, linenum_table = split_method_body_to_code_and_tables(body)
+            yield typ, (claz_sig, code, exception_table, linenum_table)
+        else:
+            assert False
+
+ASM_CACHE_VERSION = 2
+
+_pat_linenum = re.compile(r'^\s+line\s+(\d+):\s+(\d+)$')
+
+def method_code_to_ope_list(values):
+    """
+    Converts values of a METHOD_CODE record into the ones of a METHOD_OPE_LIST record.
+    Returns None when the code or the line number table can not be parsed.
+    """
+    claz_sig, code, exception_table, linenum_table = values
+    try:
+        ope_list = om.body_text_to_ope_list(code, claz_sig)
+    except Exception:
+        return None  # the error will be reported when the caller parses the code
+    ltbl = []
+    for L in linenum_table:
+        m = _pat_linenum.match(L)
+        if not m:
+            return None
+        ltbl.append((int(m.group(1)), int(m.group(2))))
+    return claz_sig, ope_list, exception_table, ltbl
+
+def cached_asm_file_records(asmfile, cache_dir):
+    """
+    Returns a list of the records of a disassembled file, in which METHOD_CODE records 
+    are converted into METHOD_OPE_LIST ones (except for the ones failed to be parsed).
+    The records are cached in a (marshal) file in cache_dir, which is reused 
+    while the size and the mtime of the disassembled file are unchanged
+    (for an entry of a packed asm file, while the hash of the text is unchanged).
+    """
+    if split_asm_pack_entry(asmfile) is not None:
+        stamp = (ASM_CACHE_VERSION, hashlib.sha1(read_asm_file_data(asmfile)).hexdigest())
+    else:
+        st = os.stat(asmfile)
+        stamp = (ASM_CACHE_VERSION, st.st_size, st.st_mtime)
+    cache_file = os.path.join(cache_dir, hashlib.sha1(os.path.abspath(asmfile)).hexdigest() + ".marshal")
+    try:
+        with open(cache_file, "rb") as f:
+            cached_stamp, records = marshal.load(f)
+        if cached_stamp == stamp:
+            return [(ASM_FILE, asmfile)] + records
+    except (IOError, EOFError, ValueError, TypeError):
+        pass
+
+    records = []
+    for typ, values in asm_file_info_iter(asmfile):
+        if typ == ASM_FILE:
+            continue
+        if typ == METHOD_CODE:
+            ope_list_values = method_code_to_ope_list(values)
+            if ope_list_values is not None:
+                typ, values = METHOD_OPE_LIST, ope_list_values
+        records.append((typ, values))
+    fd, temp_file = tempfile.mkstemp(suffix=".tmp", dir=cache_dir)
+    with os.fdopen(fd, "wb") as f:
+        marshal.dump((stamp, records), f)
+    os.rename(temp_file, cache_file)
+    return [(ASM_FILE, asmfile)] + records
+
+def _parse_asm_file_worker(args):
+    asmfile, cache_dir = args
+    if cache_dir is not None:
+        return cached_asm_file_records(asmfile, cache_dir)
+    return list(asm_file_info_iter(asmfile))
+
+def parallel_asm_info_iter(asm_dir, jobs, prefetch_per_job=4, cache_dir=None):
+    """
+    Same as get_asm_info_iter, but the files are read and parsed by a pool of 'jobs' processes.
+    Up to jobs * prefetch_per_job files are read ahead, and the records are yielded
+    in the same order as asm_file_iter.
+    """
+    pool = multiprocessing.Pool(jobs)
+    try:
+        window = collections.deque()
+        max_window = max(1, jobs * prefetch_per_job)
+        for asmfile in asm_file_iter(asm_dir):
+            window.append(pool.apply_async(_parse_asm_file_worker, ((asmfile, cache_dir),)))
+            if len(window) >= max_window:
+                for v in window.popleft().get():
+                    yield v
+        while window:
+            for v in window.popleft().get():
+                yield v
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def get_asm_info_iter(asm_dir, jobs=1, cache_dir=None):
     """
     Iterate each method definition of each disassembled file in 'asm_dir' directory.
+    When jobs > 1, the files are parsed in parallel (see parallel_asm_info_iter).
+    When cache_dir is given, the parsed records are cached in the directory 
+    and METHOD_OPE_LIST records are yielded in place of METHOD_CODE ones (see cached_asm_file_records).
     Yielded values
-       typ: ASM_FILE, COMPILED_FROM, METHOD_CODE, or INHERITANCE
+       typ: ASM_FILE, COMPILED_FROM, METHOD_CODE, METHOD_OPE_LIST, or INHERITANCE
        values: string or tuple
        
        when typ == ASM_FILE, values is a string, name of a disassembled file.
@@ -195,24 +461,30 @@ def get_asm_info_iter(asm_dir):
          exception table: exception table of the method (list of str)
          linenum_table: line number table (list of str)
 
+       when typ == METHOD_OPE_LIST, values is a tuple, which contains:
+         sig: signature of the method (str)
+         ope_list: operations of the method (list of tuple (opecode, operands, comment))
+         exception table: exception table of the method (list of str)
+         linenum_table: line number table (list of tuple (line number, index))
+
        when typ == INHERITANCE, values is a tuple, which contains:
          claz: (str)
          extends: its exntending classes (list of str, length is 0 or 1)
          implements: its implementing interfaces (list of str)
     """
 
-    def search_asmdir(asmdir):
-        for asmfile, lines in asm_filetext_iter(asmdir):
-            yield ASM_FILE, asmfile
-            for v in split_into_method_iter(asmfile, lines):
-                yield v
+    if cache_dir is not None and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
 
-    for typ, values in search_asmdir(asm_dir):
-        if typ in (ASM_FILE, COMPILED_FROM, INHERITANCE):
-            yield typ, values
-        elif typ == METHOD_CODE:
-            claz_sig, body = values
-            code, exception_table, linenum_table = split_method_body_to_code_and_tables(body)
-            yield typ, (claz_sig, code, exception_table, linenum_table)
+    if jobs > 1:
+        for v in parallel_asm_info_iter(asm_dir, jobs, cache_dir=cache_dir):
+            yield v
+        return
+
+    for asmfile in asm_file_iter(asm_dir):
+        if cache_dir is not None:
+            for v in cached_asm_file_records(asmfile, cache_dir):
+                yield v
         else:
-            assert False
+            for v in asm_file_info_iter(asmfile):
+                yield v
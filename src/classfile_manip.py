@@ -0,0 +1,482 @@
+#coding: utf-8
+
+"""
+Java class file manipulation.
+A reader of class files, which extracts the same information as
+asm_manip does from javap's disassembled files, without running javap.
+"""
+
+__author__ = 'Toshihiro Kamiya <kamiya@mbj.nifty.com>'
+__status__ = 'experimental'
+
+import os
+import struct
+import urllib2
+import zipfile
+
+from _utilities import ASCII_SYMBOLS_EXCEPT_FOR_PERCENT
+
+from asm_manip import COMPILED_FROM, METHOD_OPE_LIST, INHERITANCE
+import unzip_jar
+
+class ClassFileFormatError(ValueError):
+    pass
+
+CLASS_FILE = 'CLASS_FILE'
+
+_ACC_INTERFACE = 0x0200
+_ACC_MODULE = 0x8000
+
+# constant pool tags
+_CONSTANT_Utf8 = 1
+_CONSTANT_Integer = 3
+_CONSTANT_Float = 4
+_CONSTANT_Long = 5
+_CONSTANT_Double = 6
+_CONSTANT_Class = 7
+_CONSTANT_String = 8
+_CONSTANT_Fieldref = 9
+_CONSTANT_Methodref = 10
+_CONSTANT_InterfaceMethodref = 11
+_CONSTANT_NameAndType = 12
+_CONSTANT_MethodHandle = 15
+_CONSTANT_MethodType = 16
+_CONSTANT_Dynamic = 17
+_CONSTANT_InvokeDynamic = 18
+_CONSTANT_Module = 19
+_CONSTANT_Package = 20
+
+# operand kinds of byte-code instructions
+_NONE, _S1, _S2, _LV, _CP1, _CP2, _IINC, _BR2, _BR4, _NEWARRAY, _MULTIANEWARRAY, \
+    _INVOKEINTERFACE, _INVOKEDYNAMIC, _TABLESWITCH, _LOOKUPSWITCH, _WIDE = range(16)
+
+_OPCODES = {}  # opcode -> (name, operand kind)
+
+def _define_opcodes():
+    names = """
+        nop aconst_null iconst_m1 iconst_0 iconst_1 iconst_2 iconst_3 iconst_4 iconst_5
+        lconst_0 lconst_1 fconst_0 fconst_1 fconst_2 dconst_0 dconst_1 bipush sipush
+        ldc ldc_w ldc2_w iload lload fload dload aload
+        iload_0 iload_1 iload_2 iload_3 lload_0 lload_1 lload_2 lload_3
+        fload_0 fload_1 fload_2 fload_3 dload_0 dload_1 dload_2 dload_3
+        aload_0 aload_1 aload_2 aload_3
+        iaload laload faload daload aaload baload caload saload
+        istore lstore fstore dstore astore
+        istore_0 istore_1 istore_2 istore_3 lstore_0 lstore_1 lstore_2 lstore_3
+        fstore_0 fstore_1 fstore_2 fstore_3 dstore_0 dstore_1 dstore_2 dstore_3
+        astore_0 astore_1 astore_2 astore_3
+        iastore lastore fastore dastore aastore bastore castore sastore
+        pop pop2 dup dup_x1 dup_x2 dup2 dup2_x1 dup2_x2 swap
+        iadd ladd fadd dadd isub lsub fsub dsub imul lmul fmul dmul
+        idiv ldiv fdiv ddiv irem lrem frem drem ineg lneg fneg dneg
+        ishl lshl ishr lshr iushr lushr iand land ior lor ixor lxor iinc
+        i2l i2f i2d l2i l2f l2d f2i f2l f2d d2i d2l d2f i2b i2c i2s
+        lcmp fcmpl fcmpg dcmpl dcmpg
+        ifeq ifne iflt ifge ifgt ifle if_icmpeq if_icmpne if_icmplt if_icmpge if_icmpgt if_icmple
+        if_acmpeq if_acmpne goto jsr ret tableswitch lookupswitch
+        ireturn lreturn freturn dreturn areturn return
+        getstatic putstatic getfield putfield
+        invokevirtual invokespecial invokestatic invokeinterface invokedynamic
+        new newarray anewarray arraylength athrow checkcast instanceof
+        monitorenter monitorexit wide multianewarray ifnull ifnonnull goto_w jsr_w
+        """.split()
+    kinds = {
+        'bipush': _S1, 'sipush': _S2,
+        'ldc': _CP1, 'ldc_w': _CP2, 'ldc2_w': _CP2,
+        'iinc': _IINC, 'newarray': _NEWARRAY, 'multianewarray': _MULTIANEWARRAY,
+        'invokeinterface': _INVOKEINTERFACE, 'invokedynamic': _INVOKEDYNAMIC,
+        'tableswitch': _TABLESWITCH, 'lookupswitch': _LOOKUPSWITCH, 'wide': _WIDE,
+        'goto_w': _BR4, 'jsr_w': _BR4,
+    }
+    for n in "iload lload fload dload aload istore lstore fstore dstore astore ret".split():
+        kinds[n] = _LV
+    for n in """getstatic putstatic getfield putfield invokevirtual invokespecial invokestatic
+            new anewarray checkcast instanceof""".split():
+        kinds[n] = _CP2
+    for n in """ifeq ifne iflt ifge ifgt ifle if_icmpeq if_icmpne if_icmplt if_icmpge if_icmpgt if_icmple
+            if_acmpeq if_acmpne goto jsr ifnull ifnonnull""".split():
+        kinds[n] = _BR2
+    for opcode, name in enumerate(names):
+        _OPCODES[opcode] = (name, kinds.get(name, _NONE))
+
+_define_opcodes()
+
+_NEWARRAY_TYPES = { 4: 'boolean', 5: 'char', 6: 'float', 7: 'double', 8: 'byte', 9: 'short', 10: 'int', 11: 'long' }
+
+def _quote(s):
+    # the same escaping as _utilities.readline_iter does for lines of disassembled files
+    return urllib2.quote(s, safe=ASCII_SYMBOLS_EXCEPT_FOR_PERCENT)
+
+def _decode_modified_utf8(b):
+    try:
+        return b.decode('utf-8')
+    except UnicodeDecodeError:
+        # modified UTF-8 of class files encodes U+0000 and supplementary characters differently
+        return b.replace('\xc0\x80', '\x00').decode('utf-8', 'replace')
+
+class _ConstantPool(object):
+    def __init__(self, data, pos):
+        count = struct.unpack_from('>H', data, pos)[0]
+        pos += 2
+        self.tags = tags = [None] * count
+        self.values = values = [None] * count
+        i = 1
+        while i < count:
+            tag = ord(data[pos])
+            pos += 1
+            tags[i] = tag
+            if tag == _CONSTANT_Utf8:
+                length = struct.unpack_from('>H', data, pos)[0]
+                pos += 2
+                values[i] = _decode_modified_utf8(data[pos:pos + length]).encode('utf-8')
+                pos += length
+            elif tag in (_CONSTANT_Class, _CONSTANT_String, _CONSTANT_MethodType, _CONSTANT_Module, _CONSTANT_Package):
+                values[i] = struct.unpack_from('>H', data, pos)[0]
+                pos += 2
+            elif tag in (_CONSTANT_Fieldref, _CONSTANT_Methodref, _CONSTANT_InterfaceMethodref,
+                    _CONSTANT_NameAndType, _CONSTANT_Dynamic, _CONSTANT_InvokeDynamic):
+                values[i] = struct.unpack_from('>HH', data, pos)
+                pos += 4
+            elif tag == _CONSTANT_Integer:
+                values[i] = struct.unpack_from('>i', data, pos)[0]
+                pos += 4
+            elif tag == _CONSTANT_Float:
+                values[i] = struct.unpack_from('>f', data, pos)[0]
+                pos += 4
+            elif tag == _CONSTANT_Long:
+                values[i] = struct.unpack_from('>q', data, pos)[0]
+                pos += 8
+                i += 1  # takes two entries
+            elif tag == _CONSTANT_Double:
+                values[i] = struct.unpack_from('>d', data, pos)[0]
+                pos += 8
+                i += 1  # takes two entries
+            elif tag == _CONSTANT_MethodHandle:
+                values[i] = struct.unpack_from('>BH', data, pos)
+                pos += 3
+            else:
+                raise ClassFileFormatError("invalid constant pool tag: %d" % tag)
+            i += 1
+        self.end_pos = pos
+
+    def utf8(self, index):
+        if self.tags[index] != _CONSTANT_Utf8:
+            raise ClassFileFormatError("not a utf8 constant: #%d" % index)
+        return self.values[index]
+
+    def class_name(self, index):
+        if self.tags[index] != _CONSTANT_Class:
+            raise ClassFileFormatError("not a class constant: #%d" % index)
+        return self.utf8(self.values[index])
+
+    def name_and_type(self, index):
+        name_index, descriptor_index = self.values[index]
+        return self.utf8(name_index), self.utf8(descriptor_index)
+
+    def member_ref(self, index):
+        class_index, nat_index = self.values[index]
+        name, descriptor = self.name_and_type(nat_index)
+        return self.class_name(class_index), name, descriptor
+
+def _format_member_ref(claz, name, descriptor, this_claz):
+    # format a reference in the same way as javap's comment
+    if name in ('<init>', '<clinit>'):
+        name = '"%s"' % name
+    if claz == this_claz:
+        return _quote('%s:%s' % (name, descriptor))
+    if claz.startswith('['):
+        claz = '"%s"' % claz
+    return _quote('%s.%s:%s' % (claz, name, descriptor))
+
+_MEMBER_REF_KINDS = {
+    _CONSTANT_Fieldref: 'Field',
+    _CONSTANT_Methodref: 'Method',
+    _CONSTANT_InterfaceMethodref: 'InterfaceMethod',
+}
+
+def _format_cp_comment(cp, index, this_claz):
+    tag = cp.tags[index]
+    kind = _MEMBER_REF_KINDS.get(tag)
+    if kind is not None:
+        claz, name, descriptor = cp.member_ref(index)
+        return "// %s %s" % (kind, _format_member_ref(claz, name, descriptor, this_claz))
+    elif tag == _CONSTANT_Class:
+        return "// class %s" % _quote(cp.class_name(index))
+    elif tag == _CONSTANT_String:
+        return "// String %s" % _quote(cp.utf8(cp.values[index]))
+    elif tag in (_CONSTANT_Integer, _CONSTANT_Long):
+        return "// %s %d" % ('int' if tag == _CONSTANT_Integer else 'long', cp.values[index])
+    elif tag in (_CONSTANT_Float, _CONSTANT_Double):
+        return "// %s %r" % ('float' if tag == _CONSTANT_Float else 'double', cp.values[index])
+    return None
+
+def code_to_ope_list(code, cp, this_claz):
+    """
+    Decode byte code of a method and return a list of tuple (opecode, operands, comment),
+    in the same format as ope_manip.body_text_to_ope_list returns.
+    """
+    code = bytearray(code)
+    code_len = len(code)
+    ope_list = []
+    pc = 0
+    while pc < code_len:
+        opcode = code[pc]
+        name_kind = _OPCODES.get(opcode)
+        if name_kind is None:
+            raise ClassFileFormatError("invalid opcode %d at %d" % (opcode, pc))
+        name, kind = name_kind
+        operands = ()
+        comment = None
+        if kind == _NONE:
+            length = 1
+        elif kind == _S1:
+            operands = (str(struct.unpack_from('>b', code, pc + 1)[0]),)
+            length = 2
+        elif kind == _S2:
+            operands = (str(struct.unpack_from('>h', code, pc + 1)[0]),)
+            length = 3
+        elif kind == _LV:
+            operands = (str(code[pc + 1]),)
+            length = 2
+        elif kind == _CP1:
+            index = code[pc + 1]
+            operands = ('#%d' % index,)
+            comment = _format_cp_comment(cp, index, this_claz)
+            length = 2
+        elif kind == _CP2:
+            index = struct.unpack_from('>H', code, pc + 1)[0]
+            operands = ('#%d' % index,)
+            comment = _format_cp_comment(cp, index, this_claz)
+            length = 3
+        elif kind == _IINC:
+            operands = (str(code[pc + 1]), str(struct.unpack_from('>b', code, pc + 2)[0]))
+            length = 3
+        elif kind == _BR2:
+            operands = (str(pc + struct.unpack_from('>h', code, pc + 1)[0]),)
+            length = 3
+        elif kind == _BR4:
+            operands = (str(pc + struct.unpack_from('>i', code, pc + 1)[0]),)
+            length = 5
+        elif kind == _NEWARRAY:
+            operands = (_NEWARRAY_TYPES.get(code[pc + 1], str(code[pc + 1])),)
+            length = 2
+        elif kind == _MULTIANEWARRAY:
+            index = struct.unpack_from('>H', code, pc + 1)[0]
+            operands = ('#%d' % index, str(code[pc + 3]))
+            comment = _format_cp_comment(cp, index, this_claz)
+            length = 4
+        elif kind == _INVOKEINTERFACE:
+            index = struct.unpack_from('>H', code, pc + 1)[0]
+            operands = ('#%d' % index, str(code[pc + 3]))
+            comment = _format_cp_comment(cp, index, this_claz)
+            length = 5
+        elif kind == _INVOKEDYNAMIC:
+            index = struct.unpack_from('>H', code, pc + 1)[0]
+            operands = ('#%d' % index, '0')
+            length = 5
+        elif kind in (_TABLESWITCH, _LOOKUPSWITCH):
+            p = (pc + 4) & ~3  # skip padding
+            default = struct.unpack_from('>i', code, p)[0]
+            if kind == _TABLESWITCH:
+                low, high = struct.unpack_from('>ii', code, p + 4)
+                p += 12
+                offsets = struct.unpack_from('>%di' % (high - low + 1), code, p)
+                p += 4 * (high - low + 1)
+                cases = [(str(low + i), str(pc + o)) for i, o in enumerate(offsets)]
+            else:
+                npairs = struct.unpack_from('>i', code, p + 4)[0]
+                p += 8
+                pairs = struct.unpack_from('>%di' % (2 * npairs), code, p)
+                p += 8 * npairs
+                cases = [(str(pairs[i]), str(pc + pairs[i + 1])) for i in range(0, 2 * npairs, 2)]
+            cases.append(('default', str(pc + default)))
+            operands = cases
+            length = p - pc
+        elif kind == _WIDE:
+            name, _ = _OPCODES[code[pc + 1]]
+            index = struct.unpack_from('>H', code, pc + 2)[0]
+            if name == 'iinc':
+                operands = (str(index), str(struct.unpack_from('>h', code, pc + 4)[0]))
+                length = 6
+            else:
+                operands = (str(index),)
+                length = 4
+        else:
+            assert False
+
+        while len(ope_list) < pc:
+            ope_list.append(None)
+        ope_list.append((name, operands, comment))
+        pc += length
+
+    return ope_list
+
+def _parse_code_attribute(data, pos, cp, this_claz):
+    _max_stack, _max_locals, code_length = struct.unpack_from('>HHI', data, pos)
+    pos += 8
+    code = data[pos:pos + code_length]
+    pos += code_length
+    exception_table_length = struct.unpack_from('>H', data, pos)[0]
+    pos += 2
+    exception_table = []
+    for _ in range(exception_table_length):
+        start, end, handler, catch_type = struct.unpack_from('>HHHH', data, pos)
+        pos += 8
+        exception_table.append((start, end, handler, cp.class_name(catch_type) if catch_type else 'any'))
+    linenum_table = []
+    attributes_count = struct.unpack_from('>H', data, pos)[0]
+    pos += 2
+    for _ in range(attributes_count):
+        name_index, length = struct.unpack_from('>HI', data, pos)
+        pos += 6
+        if cp.utf8(name_index) == 'LineNumberTable':
+            table_length = struct.unpack_from('>H', data, pos)[0]
+            entries = struct.unpack_from('>%dH' % (2 * table_length), data, pos + 2)
+            linenum_table.extend((entries[i + 1], entries[i]) for i in range(0, 2 * table_length, 2))
+        pos += length
+    ope_list = code_to_ope_list(code, cp, this_claz)
+    return ope_list, exception_table, linenum_table
+
+def _to_dotted(claz):
+    return _quote(claz.replace('/', '.'))
+
+def split_into_method_iter(data):
+    """
+    Parse a class file (str) and iterate the records in the same way as
+    asm_manip.split_into_method_iter does for a javap's disassembled file,
+    except that each method is yielded as a METHOD_OPE_LIST record.
+
+    Note that signatures of methods are made from their descriptors,
+    so generic types are erased.
+    """
+    try:
+        magic, _minor, _major = struct.unpack_from('>IHH', data, 0)
+        if magic != 0xCAFEBABE:
+            raise ClassFileFormatError("not a class file")
+        cp = _ConstantPool(data, 8)
+        pos = cp.end_pos
+        access_flags, this_class, super_class, interfaces_count = struct.unpack_from('>HHHH', data, pos)
+        pos += 8
+        this_claz = cp.class_name(this_class)
+        super_claz = cp.class_name(super_class) if super_class else None
+        interfaces = [cp.class_name(i) for i in struct.unpack_from('>%dH' % interfaces_count, data, pos)]
+        pos += 2 * interfaces_count
+
+        fields_count = struct.unpack_from('>H', data, pos)[0]
+        pos += 2
+        for _ in range(fields_count):
+            pos += 6
+            attributes_count = struct.unpack_from('>H', data, pos)[0]
+            pos += 2
+            for _ in range(attributes_count):
+                pos += 6 + struct.unpack_from('>I', data, pos + 2)[0]
+
+        methods = []
+        methods_count = struct.unpack_from('>H', data, pos)[0]
+        pos += 2
+        for _ in range(methods_count):
+            _access, name_index, descriptor_index, attributes_count = struct.unpack_from('>HHHH', data, pos)
+            pos += 8
+            code_attribute_pos = None
+            for _ in range(attributes_count):
+                attr_name_index, length = struct.unpack_from('>HI', data, pos)
+                if cp.utf8(attr_name_index) == 'Code':
+                    code_attribute_pos = pos + 6
+                pos += 6 + length
+            methods.append((cp.utf8(name_index), cp.utf8(descriptor_index), code_attribute_pos))
+
+        source_file = None
+        attributes_count = struct.unpack_from('>H', data, pos)[0]
+        pos += 2
+        for _ in range(attributes_count):
+            attr_name_index, length = struct.unpack_from('>HI', data, pos)
+            if cp.utf8(attr_name_index) == 'SourceFile':
+                source_file = cp.utf8(struct.unpack_from('>H', data, pos + 6)[0])
+            pos += 6 + length
+    except (struct.error, IndexError, TypeError) as e:
+        raise ClassFileFormatError("broken class file: %s" % e)
+
+    if source_file is not None:
+        yield COMPILED_FROM, _quote(source_file)
+
+    if access_flags & _ACC_MODULE:
+        return
+
+    claz = _quote(this_claz)
+    # extending class and implementing interfaces (extended interfaces of an interface), 
+    # in the same form as asm_manip yields
+    extends = (_to_dotted(super_claz),) if super_claz not in (None, 'java/lang/Object') else ()
+    implements = tuple(_to_dotted(i) for i in interfaces)
+    yield INHERITANCE, (claz, extends, implements)
+
+    if access_flags & _ACC_INTERFACE:
+        return  # methods of an interface are not yielded by asm_manip, either
+
+    for name, descriptor, code_attribute_pos in methods:
+        if name == '<init>':
+            sig = '"<init>":%s' % descriptor
+        elif name == '<clinit>':
+            sig = '"static{}":()V'
+        else:
+            sig = '%s:%s' % (name, descriptor)
+        if code_attribute_pos is not None:
+            try:
+                ope_list, exception_table, linenum_table = _parse_code_attribute(data, code_attribute_pos, cp, this_claz)
+            except (struct.error, IndexError, TypeError) as e:
+                raise ClassFileFormatError("broken code attribute: %s.%s: %s" % (claz, sig, e))
+        else:
+            ope_list, exception_table, linenum_table = [], [], []
+        yield METHOD_OPE_LIST, ((claz, _quote(sig)), ope_list, exception_table, linenum_table)
+
+def is_jar_file(path):
+    return os.path.isfile(path) and zipfile.is_zipfile(path)
+
+def class_file_data_iter(path):
+    """
+    Iterate (name, data) of each class file in 'path',
+    which is a directory containing class files, a class file, or a jar file.
+    Class files in a jar file (including the ones in nested jars, e.g. WEB-INF/lib/*.jar)
+    are read directly from the jar file, without extracting them.
+    """
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path, topdown=True):
+            dirs.sort()
+            files.sort()
+            for f in files:
+                if f.endswith(".class"):
+                    class_file = os.path.join(root, f)
+                    with open(class_file, "rb") as inp:
+                        yield class_file, inp.read()
+    elif is_jar_file(path):
+        for nested_entries, entry, _, data in unzip_jar.class_entry_iter(path):
+            yield "!/".join((path,) + nested_entries + (entry,)), data
+    else:
+        with open(path, "rb") as inp:
+            yield path, inp.read()
+
+def get_class_info_iter(path):
+    """
+    Iterate each method definition of each class file in 'path',
+    which is a directory containing class files, a class file, or a jar file.
+    Yielded values
+       typ: CLASS_FILE, COMPILED_FROM, METHOD_OPE_LIST, or INHERITANCE
+       values: string or tuple
+
+       when typ == CLASS_FILE, values is a string, name of a class file.
+
+       when typ == METHOD_OPE_LIST, values is a tuple, which contains:
+         sig: signature of the method (str)
+         ope_list: operations of the method (list of tuple (opecode, operands, comment))
+         exception table: exception table of the method (list of tuple (start, end, handler, type))
+         linenum_table: line number table (list of tuple (line number, index))
+
+       when typ is COMPILED_FROM or INHERITANCE, values is the same as
+       asm_manip.get_asm_info_iter yields.
+    """
+    for class_file, data in class_file_data_iter(path):
+        yield CLASS_FILE, class_file
+        try:
+            for v in split_into_method_iter(data):
+                yield v
+        except ClassFileFormatError as e:
+            raise ClassFileFormatError("%s: %s" % (class_file, e))
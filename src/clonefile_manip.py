@@ -24,6 +24,7 @@ CMDLINE_OPTIONS = (
     ("exclude", [str], list),
     ("entry", [str], list),
     ("include-ctors", None, lambda: None),
+    ("cha-dispatch", None, lambda: None),
 #    ("bag-comparison", None, lambda: None),
 )
 
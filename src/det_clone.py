@@ -7,7 +7,7 @@ __status__ = 'experimental'
 import sys
 
 from enum_generator import EnumGenerator
-from _utilities import readline_iter, sort_uniq
+from _utilities import readline_iter, sort_uniq, stdout_to
 
 def read_ngram_iter(ngram_file):
     cur_opes, cur_locs, cur_deps = [], [], []
@@ -35,13 +35,18 @@ def gen_argpsr():
             help="n-gram file (generated by gen_ngram.py). specify '-' to read from stdin")
 #    psr.add_argument('--bag-comparison', action='store_true')
     psr.add_argument('--debug-keep-fanin-fanout-clone', action='store_true')
+    psr.add_argument('-o', '--output', action='store',
+            help="output file. compressed when the extension is .gz, .bz2 or .xz. (default is stdout.)")
     psr.add_argument('--version', action='version', version='%(prog)s ' + VERSION)
     return psr
 
 def main(argv):
     psr = gen_argpsr()
     args = psr.parse_args(argv[1:])
+    with stdout_to(args.output):
+        run(args)
 
+def run(args):
 #    bag_comparison = args.bag_comparison
     remove_fanin_fanout_clone = not args.debug_keep_fanin_fanout_clone
 
@@ -4,13 +4,15 @@
 __author__ = 'Toshihiro Kamiya <kamiya@mbj.nifty.com>'
 __status__ = 'experimental'
 
+import multiprocessing
+import os
 import re
 import sys
 
-from _utilities import sort_uniq
+from _utilities import sort_uniq, stdout_to
 
 import asm_manip as am
-import ope_manip as om
+import classfile_manip as cfm
 import type_formatter as tf
 import clonefile_manip as cm
 
@@ -140,7 +142,11 @@ def gen_argpsr():
     from argparse import ArgumentParser
     from _version_data import VERSION
     psr = ArgumentParser(description="Expand clone's each location to a trace")
-    psr.add_argument('-a', '--asm-directory', action='store')
+    grp = psr.add_mutually_exclusive_group(required=False)
+    grp.add_argument('-a', '--asm-directory', action='store',
+            help='directory of disassembled files, or a packed asm file made by run_disasm.py --pack')
+    grp.add_argument('--classes', action='store',
+            help='directory containing class files, or a jar file. the class files are read directly in place of disassembled files')
     psr.add_argument('clone_file', action='store',
             help="options and clones to be expanded. part of clone-index (generated by det_clone.py) or clone-linenum file (generated by tosl_clone.py). specify '-' to read from stdin")
     psr.add_argument('-t', '--loc-to-trace', action='store_true',
@@ -151,19 +157,30 @@ def gen_argpsr():
             help='add max-depth metric to each clone')
     psr.add_argument('-u', '--add-metric-unique-method', action='store_true',
             help='add unique-method count to each clone')
+    psr.add_argument('--asm-cache-dir', action='store',
+            help='directory to cache parsed disassembled files, which are reused while the files are unchanged')
+    psr.add_argument('-j', '--jobs', action='store', type=int, default=1,
+            help='number of worker processes parsing disassembled files and precompiling methods. =0 means the number of CPUs. (default is 1.)')
+    psr.add_argument('--precomp-cache-dir', action='store',
+            help='directory to cache precompiled code, which can be shared with gen_ngram.py')
+    psr.add_argument('-o', '--output', action='store',
+            help="output file. compressed when the extension is .gz, .bz2 or .xz. (default is stdout.)")
     psr.add_argument('--version', action='version', version='%(prog)s ' + VERSION)
     return psr
 
 def main(argv):
     psr = gen_argpsr()
     args = psr.parse_args(argv[1:])
+    with stdout_to(args.output):
+        run(args)
 
+def run(args):
     if not any([args.add_metric_clat, args.add_metric_max_depth, args.add_metric_unique_method, args.loc_to_trace]):
         sys.exit("no action specfield. specify one or more of options, -t, -c, -d and -u")
 
     code_ngram_needed = args.add_metric_clat or args.loc_to_trace
-    if code_ngram_needed and args.asm_directory is None:
-        sys.exit("such as option -t or -c requires option -a")
+    if code_ngram_needed and args.asm_directory is None and args.classes is None:
+        sys.exit("such as option -t or -c requires option -a or --classes")
 
     def itfunc():
         for sec, data in cm.read_clone_file_iter(args.clone_file):
@@ -183,49 +200,48 @@ def main(argv):
     exclude = clone_data_args.exclude
     allow_repetitive_ngram = clone_data_args.get("allow-repetitive-ngram")
     no_branch_ngram = clone_data_args.get("no-branch-ngram")
-
-    sig2code = {}
-    #sig2exceptiontable = {}
-    #sig2linenumbertable = {}
-
-    claz2deriving = {}  # claz -> list of the clazs that inherit it
-    for typ, values in am.get_asm_info_iter(args.asm_directory):
-        if typ == am.METHOD_CODE:
-            claz_sig, code, etbl, ltbl = values
-            sig2code[claz_sig] = tuple(code)
-            #sig2exceptiontable[sig] = etbl
-            #sig2linenumbertable[sig] = ltbl
-        elif typ == am.INHERITANCE:
-            claz, imps, exts = values
-            for e in exts:
-                claz2deriving.setdefault(e, []).append(claz)
-
-    sig2oplist = {}
-    for claz_sig, method_body in sorted(sig2code.iteritems()):
-        ol = om.body_text_to_ope_list(method_body, claz_sig)
-        sig2oplist[claz_sig] = ol
-    del sig2code
-
-    method2claz2code = ng.make_method2claz2code(sig2oplist)
-    del sig2oplist
-    claz2methods = ng.make_claz2methods(method2claz2code)
-
-    if exclude:
-        ng.exclude_clazs(method2claz2code, exclude)
-
-    if max_method_definition > 0:
-        ng.remove_too_many_definition_methods(method2claz2code, max_method_definition)
-
-    method2claz2precomp = {}
-    claz_method_tables = pm.ClazMethodTables(claz2methods, claz2deriving, ng.is_untracked_method_call)
-    for method, c2c in method2claz2code.iteritems():
-        for claz, ope_list in c2c.iteritems():
-            precomp = pm.precompile_code(claz, ope_list, 
-                    claz_method_tables=claz_method_tables,
-                    remove_repetition=not allow_repetitive_ngram)
-            method2claz2precomp.setdefault(method, {})[claz] = precomp
-    del claz_method_tables
-    del method2claz2code
+    cha_dispatch = clone_data_args.get("cha-dispatch")
+
+    corpus = args.classes if args.classes is not None else args.asm_directory
+    method2claz2precomp = None
+    if args.precomp_cache_dir is not None and corpus is not None:
+        if not os.path.isdir(args.precomp_cache_dir):
+            os.makedirs(args.precomp_cache_dir)
+        precomp_cache_key = pm.precomp_cache_key(am.corpus_fingerprint(corpus),
+                ng.precomp_cache_options('classes' if args.classes is not None else 'asm', 
+                        exclude, max_method_definition, allow_repetitive_ngram, 
+                        cha_dispatch=cha_dispatch))
+        method2claz2precomp = pm.load_precomp_cache(args.precomp_cache_dir, precomp_cache_key)
+
+    if method2claz2precomp is None:
+        jobs = args.jobs if args.jobs > 0 else multiprocessing.cpu_count()
+        if args.classes is not None:
+            info_it = cfm.get_class_info_iter(args.classes)
+        else:
+            info_it = am.get_asm_info_iter(args.asm_directory, jobs=jobs, cache_dir=args.asm_cache_dir)
+        claz2supers = {}
+        sig2oplist, claz2deriving = ng.read_sig2oplist_and_claz2deriving(info_it, claz2supers)
+
+        method2claz2code = ng.make_method2claz2code(sig2oplist)
+        del sig2oplist
+        claz2methods = ng.make_claz2methods(method2claz2code)
+
+        if exclude:
+            ng.exclude_clazs(method2claz2code, exclude)
+
+        if max_method_definition > 0:
+            ng.remove_too_many_definition_methods(method2claz2code, max_method_definition)
+
+        claz_hierarchy = pm.ClazHierarchy(claz2supers, claz2methods) if cha_dispatch else None
+        del claz2supers
+        claz_method_tables = pm.ClazMethodTables(claz2methods, claz2deriving, ng.is_untracked_method_call, 
+                claz_hierarchy=claz_hierarchy)
+        method2claz2precomp = ng.precompile_methods(method2claz2code, claz_method_tables, 
+                remove_repetition=not allow_repetitive_ngram, jobs=jobs)
+        del claz_method_tables
+        del method2claz2code
+        if args.precomp_cache_dir is not None and corpus is not None:
+            pm.store_precomp_cache(args.precomp_cache_dir, precomp_cache_key, method2claz2precomp)
 
     if ngram_size < 0:
         clone_data_args.delete("ngram-size")
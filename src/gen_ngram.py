@@ -8,12 +8,16 @@ import collections
 import os
 import sys
 import datetime
+import multiprocessing
+import weakref
 
-from _utilities import sort_uniq
+from _utilities import sort_uniq, stdout_to
 
 import asm_manip as am
+import classfile_manip as cfm
 import ope_manip as om
 import precomp_manip as pm
+import type_formatter as tf
 
 UNTRACKED_CLAZS = frozenset([
     "java/lang/StringBuilder", 
@@ -50,6 +54,14 @@ def to_ngram_tuples_iter(found_ngrams):
             # so two n-grams, which starts the same posision and the same depth but the distinct paths,
             # are not able to be distinguished in the output and look just duplication in the output.
 
+def format_ngrams(found_ngrams):
+    buf = []
+    for ngrams in to_ngram_tuples_iter(found_ngrams):
+        for ngram in ngrams:
+            buf.append(''.join("%s\t%s\t%d\n" % op_loc_dep for op_loc_dep in ngram))
+            buf.append('\n')
+    return ''.join(buf)
+
 def make_method2claz2code(sig2code):
     method2claz2code = {}
     for (claz, sig), code in sorted(sig2code.iteritems()):
@@ -63,34 +75,55 @@ def make_claz2methods(method2claz2code):
             claz2methods.setdefault(c, []).append(m)
     return claz2methods
 
+_frame_table = weakref.WeakValueDictionary()  # (claz_method, index, prev_frame) -> StackFrame
+_method_set_table = weakref.WeakValueDictionary()  # (methods of a caller frame, method) -> methods
+
+def _method_set(methods, method):
+    if method in methods:
+        return methods
+    key = methods, method
+    s = _method_set_table.get(key)
+    if s is None:
+        s = _method_set_table[key] = methods | frozenset([method])
+    return s
+
 class StackFrame(object):
-    def __init__(self, claz_method, index, prev_frame):
-        self.claz_method = claz_method
-        self.index = index
-        self.prev_frame = prev_frame
-        self.depth = 0 if prev_frame is None else prev_frame.depth + 1
-    
-    def __eq__(self, other):
-        return other is not None and \
-            self.claz_method == other.claz_method and self.index == other.index and \
-            self.depth == other.depth and self.prev_frame == other.prev_frame
+    """
+    A frame of a call stack. Frames are hash-consed, that is, StackFrame(claz_method, index, prev_frame)
+    returns the existing frame when called with equal arguments, so that equal call stacks are
+    the same object and are compared and hashed by identity.
+    methods is the (shared) set of the methods of the frames on the call stack.
+    """
+    __slots__ = ('claz_method', 'index', 'prev_frame', 'depth', 'methods', '__weakref__')
+
+    def __new__(cls, claz_method, index, prev_frame):
+        key = claz_method, index, prev_frame
+        self = _frame_table.get(key)
+        if self is None:
+            self = object.__new__(cls)
+            self.claz_method = claz_method
+            self.index = index
+            self.prev_frame = prev_frame
+            if prev_frame is None:
+                self.depth = 0
+                self.methods = _method_set(frozenset(), claz_method[1])
+            else:
+                self.depth = prev_frame.depth + 1
+                self.methods = _method_set(prev_frame.methods, claz_method[1])
+            _frame_table[key] = self
+        return self
 
     def __lt__(self, other):
-        if other is None:
-            return False
-        if self.claz_method < other.claz_method:
-            return True
-        elif self.claz_method == other.claz_method:
-            if self.index < other.index:
+        while self is not other:
+            if other is None:
+                return False
+            if self is None:
                 return True
-            elif self.index == other.index:
-                if self.depth < other.depth:
-                    return True
-                elif self.depth == other.depth:
-                    return self.prev_frame < other.prev_frame
-
-    def __hash__(self):
-        return hash(self.claz_method) + hash(self.index) + hash(self.depth)  # prev_frame is not used in hash computation
+            k, other_k = (self.claz_method, self.index, self.depth), (other.claz_method, other.index, other.depth)
+            if k != other_k:
+                return k < other_k
+            self, other = self.prev_frame, other.prev_frame
+        return False
 
     def copy(self, index=None):
         return StackFrame(self.claz_method, index if index is not None else self.index, self.prev_frame)
@@ -98,6 +131,21 @@ class StackFrame(object):
     def __repr__(self):
         return "StackFrame(%s,%s,*,depth=%d)" % (repr(self.claz_method), repr(self.index), self.depth)  # prev_frame is not printed
 
+class _DigActivation(object):
+    """
+    A dig of a method, or a return dig, on the explicit stack of CodeNgramGenerator._dig_method.
+    consts is a tuple of the values unchanged in the dig, branches is a stack of the paths to be dug,
+    and resume is the state of the INVOKE cell whose method calls are being dug, or None.
+    """
+    __slots__ = ('consts', 'prev_footmarks_frame', 'seen_states', 'branches', 'resume')
+
+    def __init__(self, consts, prev_footmarks_frame, seen_states, branches):
+        self.consts = consts
+        self.prev_footmarks_frame = prev_footmarks_frame
+        self.seen_states = seen_states
+        self.branches = branches
+        self.resume = None
+
 class CodeNgramGenerator:
     def __init__(self, method2claz2precomp):
         self.method2claz2precomp = method2claz2precomp
@@ -108,6 +156,9 @@ class CodeNgramGenerator:
         self.no_returning_execution_path = False
         self.use_undigg_method_list = False
         self.count_branch_in_surface_level = False
+        self.prune_seen_states = True
+        self.use_superblocks = True
+        self._superblock_tables = {}  # claz_method -> result of _superblock_table
         self.clear_temp()
     
     def clear_temp(self):
@@ -137,6 +188,13 @@ class CodeNgramGenerator:
         self._stack_already_printed_on_raise = False
         self._found_grams = {}  # head item -> set if tuple of tail items
             # here, head is the first item of ngram tail is the other items
+        # a state of dig includes cur_gram, in which removing a repetition may reveal items before 
+        # the last n-1 items. the states are pruned only while cur_gram is short, which is the case 
+        # just after a branch
+        if self.allow_repetitive_ngram:
+            self._state_gram_len, self._max_state_gram_len = self.ngram_size - 1, sys.maxint
+        else:
+            self._state_gram_len, self._max_state_gram_len = None, 2 * self.ngram_size
         
     def gen_ngrams(self, claz, method):
         self._setup_temp(claz, method)
@@ -144,100 +202,200 @@ class CodeNgramGenerator:
         self.clear_temp()
         return self._found_grams
 
-    def _dig_method(self, dig_count, cur_gram, claz_method, prev_frame, prev_footmarks_frame, 
-            start_cell=None, is_return_dig=False):
+    def _new_activation(self, dig_count, cur_gram, claz_method, prev_frame, prev_footmarks_frame, 
+            start_node=None, is_return_dig=False):
         if not is_return_dig:
             p = self.method2claz2precomp[claz_method[1]][claz_method[0]]
-            if start_cell is None:
-                start_cell = p.start_cell
-            cur_frame = StackFrame(claz_method, start_cell[0], prev_frame)
-            cur_footmarks_frame = [], prev_footmarks_frame
+            if start_node is None:
+                start_node = p.start_node
+            cur_frame = StackFrame(claz_method, p.indices[start_node], prev_frame)
+            cur_footmarks_frame = [0, prev_footmarks_frame]
         else:
             assert claz_method is None
-            assert start_cell is None
+            assert start_node is None
             cur_frame = prev_frame
             claz_method = cur_frame.claz_method
             p = self.method2claz2precomp[claz_method[1]][claz_method[0]]
-            start_cell = p.cells[cur_frame.index][1]
-            cur_footmarks_frame = prev_footmarks_frame[0][:], prev_footmarks_frame[1]
-        cur_block_entrance_cells = p.bent_cells
-        depth = cur_frame.depth
-        
+            start_node = p.nexts[p.node_of(cur_frame.index)]
+            cur_footmarks_frame = [prev_footmarks_frame[0], prev_footmarks_frame[1]]
+        superblocks, undiggables = self._superblock_table(claz_method, p) if self.use_superblocks else (None, None)
+        consts = (p, p.indices, p.nexts, p.cmds, p.args, p.bent_ordinals(), claz_method, cur_frame, superblocks, undiggables)
+        seen_states = set() if self.prune_seen_states else None
+            # states at block entrance cells, which have been dug in this frame
+        return _DigActivation(consts, prev_footmarks_frame, seen_states, 
+                [(dig_count, cur_gram, start_node, cur_footmarks_frame)])
+
+    def _dig_method(self, dig_count, cur_gram, claz_method, prev_frame, prev_footmarks_frame, start_node=None):
+        """
+        Digs the execution paths of the method, expanding the method calls.
+        A dig of a called method and a return dig (which continues the calling method after 
+        a RETURN of the called method) are pushed to an explicit stack of activations, in place of
+        recursive calls, and are done in the same order as recursive calls.
+        """
+        ngram_size = self.ngram_size
+        remove_repetition = None if self.allow_repetitive_ngram else self._remove_repetition
+        is_escaping, store_if_new_ngram = self._is_escaping, self._store_if_new_ngram
+        follow_branches = not self.no_branch_ngram
+        acts = [self._new_activation(dig_count, cur_gram, claz_method, prev_frame, prev_footmarks_frame, start_node)]
         try:
-            branches = []
-            def dig_branch(dig_count, cur_gram, cur_cell, cur_footmarks_frame):
+            while acts:
+                act = acts[-1]
+                p, indices, nexts, cmds, args, bent_ords, claz_method, cur_frame, superblocks, undiggables = act.consts
+                prev_frame = cur_frame.prev_frame
+                depth = cur_frame.depth
+                seen_states = act.seen_states
+                branches = act.branches
+                resumed = act.resume is not None
+                if resumed:
+                    # the method calls of an INVOKE cell, in the middle of digging
+                    dig_count, cur_gram, cur_node, cur_footmarks_frame, c_m, stk, callee_c_ms, ci = act.resume
+                    if ci < len(callee_c_ms):
+                        act.resume = (dig_count, cur_gram, cur_node, cur_footmarks_frame, c_m, stk, callee_c_ms, ci + 1)
+                        acts.append(self._new_activation(dig_count - 1, cur_gram[-ngram_size:], callee_c_ms[ci], 
+                                stk, cur_footmarks_frame))
+                        continue  # while acts
+                    act.resume = None
+                elif branches:
+                    dig_count, cur_gram, cur_node, cur_footmarks_frame = branches.pop()
+                else:
+                    acts.pop()
+                    continue  # while acts
                 footmarks = cur_footmarks_frame[0]
-                while True:
-                    index, next_cell, precomp_cmd, precomp_arg = cur_cell
-                    if index in cur_block_entrance_cells:
-                        if index in footmarks:
-                            break  # while True
-                        footmarks.append(index)
 
-                        # in deeper levels than the surface, branchs are counted 
-                        # in order to avoid interprting too complex control dependencies
-                        if self.count_branch_in_surface_level or depth > 0:
-                            if dig_count <= 0:
-                                break  # while True
-                            dig_count -= 1
-
-                    if precomp_cmd == pm.INVOKE:
-                        stk = cur_frame.copy(index)
-
-                        c_m = c, m = precomp_arg
-                        if cur_gram and dig_count > 0 and self._is_method_digg_target(c, m, cur_gram):
-                            c2p = self.method2claz2precomp.get(m)
-                            if c2p:
-                                cs = sorted(c2p.iterkeys()) if c is None else \
-                                        [c] if c in c2p else \
-                                        []
-                                for c2 in cs:
-                                    c2_m = (c2, m)
-                                    if not CodeNgramGenerator.is_recursion(c2_m, cur_frame):
-                                        self._dig_method(dig_count - 1, cur_gram[-self.ngram_size:], c2_m, stk, cur_footmarks_frame)
-
-                        cur_gram.append((c_m, stk))
-                        if self._remove_repetition(cur_gram) == 0 and  len(cur_gram) >= self.ngram_size:
-                            if self._is_escaping(cur_gram[-self.ngram_size][1]):
+                while True:
+                    if resumed:
+                        resumed = False
+                    else:
+                        index = indices[cur_node]
+                        precomp_cmd = cmds[cur_node]
+                        if bent_ords[cur_node] >= 0:
+                            bit = 1 << bent_ords[cur_node]
+                            if footmarks & bit:
                                 break  # while True
-                            cand_gram = tuple(cur_gram[-self.ngram_size:])
-                            if not self._store_if_new_ngram(cand_gram):
+                            if seen_states is not None and len(cur_gram) <= self._max_state_gram_len:
+                                # the rest of the dig depends on cur_gram and the footmarks of the block entrance cells 
+                                # reachable from here, not on the path to here
+                                sgl = self._state_gram_len
+                                gram = tuple(cur_gram) if sgl is None or len(cur_gram) <= sgl else tuple(cur_gram[len(cur_gram) - sgl:])
+                                state = (cur_node, dig_count, gram, 
+                                        p.reachable_bent_mask(cur_node) & footmarks, id(cur_footmarks_frame[1]))
+                                if state in seen_states:
+                                    break  # while True
+                                seen_states.add(state)
+                            footmarks |= bit
+                            cur_footmarks_frame[0] = footmarks
+
+                            # in deeper levels than the surface, branchs are counted 
+                            # in order to avoid interprting too complex control dependencies
+                            if self.count_branch_in_surface_level or depth > 0:
+                                if dig_count <= 0:
+                                    break  # while True
+                                dig_count -= 1
+
+                        if precomp_cmd == pm.INVOKE:
+                            if superblocks is not None and superblocks[cur_node] is not None and \
+                                    (dig_count <= 0 or undiggables[args[cur_node]]):
+                                # advance over the method calls of the superblock, which are not expanded, in one step
+                                sb, k = superblocks[cur_node]
+                                sb_nodes, sb_indices, sb_labels, sb_invoke_poss = sb
+                                sb_len = len(sb_nodes)
+                                stored = True
+                                while True:
+                                    cur_gram.append((sb_labels[k], StackFrame(claz_method, sb_indices[k], prev_frame)))
+                                    if (remove_repetition is None or remove_repetition(cur_gram) == 0) and len(cur_gram) >= ngram_size:
+                                        if is_escaping(cur_gram[-ngram_size][1]) or \
+                                                not store_if_new_ngram(tuple(cur_gram[-ngram_size:])):
+                                            stored = False
+                                            break  # while True
+                                    k += 1
+                                    if k == sb_len or dig_count > 0 and not undiggables[sb_invoke_poss[k]]:
+                                        break  # while True
+                                if not stored:
+                                    break  # while True
+                                cur_node = nexts[sb_nodes[-1]] if k == sb_len else sb_nodes[k]
+                                continue  # while True
+
+                            stk = StackFrame(claz_method, index, prev_frame)
+                            invoke_pos = args[cur_node]
+                            c_m = c, m = p.invokes[invoke_pos]
+                            if cur_gram and dig_count > 0 and self._is_method_digg_target(c, m, cur_gram):
+                                c2p = self.method2claz2precomp.get(m)
+                                if c2p:
+                                    callee_c_ms = [(c2, m) for c2 in self._callee_clazs(p, invoke_pos, c, m, c2p) \
+                                            if not CodeNgramGenerator.is_recursion((c2, m), cur_frame)]
+                                    if callee_c_ms:
+                                        act.resume = (dig_count, cur_gram, cur_node, cur_footmarks_frame, c_m, stk, callee_c_ms, 0)
+                                        break  # while True
+                        elif precomp_cmd == pm.RETURN:
+                            if self.no_returning_execution_path:
                                 break  # while True
-                    elif precomp_cmd == pm.RETURN:
-                        if self.no_returning_execution_path:
+                            if prev_frame is not None:
+                                acts.append(self._new_activation(dig_count, cur_gram, None, 
+                                        prev_frame, cur_footmarks_frame[1], is_return_dig=True))
                             break  # while True
-                        if cur_frame.prev_frame is not None:
-                            self._dig_method(dig_count, cur_gram, None, 
-                                    cur_frame.prev_frame, cur_footmarks_frame[1], is_return_dig=True)
-                        break  # while True
-                    elif precomp_cmd == pm.GOTO:
-                        if not self.no_branch_ngram:
-                            next_cell = precomp_arg
-                    elif precomp_cmd == pm.BRANCHS:
-                        if not self.no_branch_ngram:
-                            branches.extend((dig_count, cur_gram[-self.ngram_size:], dc, (footmarks[:], prev_footmarks_frame)) \
-                                    for dc in precomp_arg)
-                    elif precomp_cmd == pm.THROW:
-                        break  # while True
-                    else:
-                        assert False
-                    cur_cell = next_cell
-            dig_branch(dig_count, cur_gram, start_cell, cur_footmarks_frame)
-            while branches:
-                b = branches.pop()
-                dig_branch(*b)
+                        elif precomp_cmd == pm.GOTO:
+                            cur_node = args[cur_node] if follow_branches else nexts[cur_node]
+                            continue  # while True
+                        elif precomp_cmd == pm.BRANCHS:
+                            if follow_branches:
+                                branches.extend((dig_count, cur_gram[-ngram_size:], dc, [footmarks, act.prev_footmarks_frame]) \
+                                        for dc in p.branch_dests(cur_node))
+                            cur_node = nexts[cur_node]
+                            continue  # while True
+                        elif precomp_cmd == pm.THROW:
+                            break  # while True
+                        else:
+                            assert False
+
+                    # an INVOKE cell, of which the method calls have been dug
+                    cur_gram.append((c_m, stk))
+                    if (remove_repetition is None or remove_repetition(cur_gram) == 0) and len(cur_gram) >= ngram_size:
+                        if is_escaping(cur_gram[-ngram_size][1]):
+                            break  # while True
+                        if not store_if_new_ngram(tuple(cur_gram[-ngram_size:])):
+                            break  # while True
+                    cur_node = nexts[cur_node]
         except:
-            self._print_stack(cur_frame)
+            if acts:
+                self._print_stack(acts[-1].consts[7])
             raise
 
+    def _callee_clazs(self, p, invoke_pos, c, m, c2p):
+        """
+        Returns a list of the classes, into whose method m the method call of invoke_pos of p is expanded,
+        where c2p is a dict from class to precompiled code of the method m.
+        """
+        dispatch = p.dispatches[invoke_pos] if c is None and p.dispatches is not None else None
+        return [c2 for c2 in dispatch if c2 in c2p] if dispatch is not None else \
+                sorted(c2p.iterkeys()) if c is None else \
+                [c] if c in c2p else \
+                []
+
+    def _superblock_table(self, claz_method, p):
+        """
+        Returns a pair of p.superblocks() and a list parallel to p.invokes, of True for each method call
+        which is never expanded (e.g. a call of a library method) regardless of the state of dig,
+        or (None, None) when p has no superblock.
+        """
+        t = self._superblock_tables.get(claz_method)
+        if t is None:
+            superblocks = p.superblocks()
+            if not any(superblocks):
+                t = None, None
+            else:
+                undiggables = []
+                for invoke_pos, (c, m) in enumerate(p.invokes):
+                    c2p = self.method2claz2precomp.get(m)
+                    diggable = c2p and not (self.use_undigg_method_list and m in UNDIGGED_METHODS) and \
+                            not (c is None and m.endswith(":()V")) and self._callee_clazs(p, invoke_pos, c, m, c2p)
+                    undiggables.append(not diggable)
+                t = superblocks, undiggables
+            self._superblock_tables[claz_method] = t
+        return t
+
     @staticmethod
     def is_recursion(claz_method, frame):
-        method = claz_method[1]
-        while frame:
-            if method == frame.claz_method[1]:
-                return True
-            frame = frame.prev_frame
-        return False
+        return frame is not None and claz_method[1] in frame.methods
     
     def _store_if_new_ngram(self, cand_gram):
         assert len(cand_gram) >= 1
@@ -285,9 +443,8 @@ class CodeNgramGeneratorWStartIndices(CodeNgramGenerator):
         for start_index in start_indices:
             self._start_index = start_index
             claz2precomp = self.method2claz2precomp[method]
-            precomp_cells = claz2precomp[claz].cells
-            head_cell = precomp_cells[start_index]
-            self._dig_method(self._max_call_depth, [], (claz, method), None, None, head_cell)
+            head_node = claz2precomp[claz].node_of(start_index)
+            self._dig_method(self._max_call_depth, [], (claz, method), None, None, head_node)
         self.clear_temp()
         return self._found_grams
 
@@ -300,7 +457,7 @@ class CodeNgramGeneratorWStartIndices(CodeNgramGenerator):
 def gen_code_ngrams(claz, method, method2claz2precomp, ngram_size, start_indices=None,
         max_call_depth=-1, allow_repetitive_ngram=False, no_branch_ngram=False,
         no_returning_execution_path=False, use_undigg_method_list=False,
-        count_branch_in_surface_level=False):
+        count_branch_in_surface_level=False, prune_seen_states=True, use_superblocks=True):
     if start_indices:
         cng = CodeNgramGeneratorWStartIndices(method2claz2precomp)
     else:
@@ -312,11 +469,39 @@ def gen_code_ngrams(claz, method, method2claz2precomp, ngram_size, start_indices
     cng.no_returning_execution_path = no_returning_execution_path
     cng.use_undigg_method_list = use_undigg_method_list
     cng.count_branch_in_surface_level = count_branch_in_surface_level
+    cng.prune_seen_states = prune_seen_states
+    cng.use_superblocks = use_superblocks
     if start_indices:
         return cng.gen_ngrams(claz, method, start_indices)
     else:
         return cng.gen_ngrams(claz, method)
 
+_worker_context = None  # (method2claz2precomp, ngram_size, options), inherited by forked workers
+
+def _gen_code_ngrams_text_worker(claz_method):
+    method2claz2precomp, ngram_size, options = _worker_context
+    claz, method = claz_method
+    found_ngrams = gen_code_ngrams(claz, method, method2claz2precomp, ngram_size, **options)
+    return format_ngrams(found_ngrams)
+
+def gen_code_ngrams_text_iter(claz_method_list, method2claz2precomp, ngram_size, jobs, **options):
+    """
+    Generate n-grams of each (claz, method) in claz_method_list with a pool of 'jobs' processes,
+    and yield them as formatted text in the order of claz_method_list.
+    Workers pick up methods one by one, so a few huge methods do not block the others.
+    """
+    global _worker_context
+    _worker_context = method2claz2precomp, ngram_size, options
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for text in pool.imap(_gen_code_ngrams_text_worker, claz_method_list, chunksize=1):
+            yield text
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        _worker_context = None
+
 def identify_claz(method2claz2code, class_patterns):    
     exclude_clazs = frozenset([e for e in class_patterns if not e.endswith('/*')])
     exclude_packages = frozenset([e[:-1] for e in class_patterns if e.endswith('/*')])
@@ -390,20 +575,113 @@ def do_filtering_methods(write, method2claz2code, include_ctors, max_method_defi
         write("removed methods by option --max-definition=%d: %d\n" % \
                 (max_method_definition, len(too_many_definition_methods)))
 
+def read_sig2oplist_and_claz2deriving(info_it, claz2supers=None):
+    """
+    Returns sig2oplist and claz2deriving. When a dict claz2supers is given, it is filled with 
+    claz -> (its extending classes, its implementing interfaces), for pm.ClazHierarchy.
+    """
+    sig2oplist = {}
+    #sig2exceptiontable = {}
+    #sig2linenumbertable = {}
+
+    claz2deriving = {}  # claz -> list of the clazs that inherit it
+    for typ, values in info_it:
+        if typ == am.METHOD_CODE:
+            claz_sig, code, etbl, ltbl = values
+            sig2oplist[claz_sig] = om.OpeList(om.body_text_to_ope_list(code, claz_sig))
+            #sig2exceptiontable[sig] = etbl
+            #sig2linenumbertable[sig] = ltbl
+        elif typ == am.METHOD_OPE_LIST:
+            claz_sig, ope_list, etbl, ltbl = values
+            sig2oplist[claz_sig] = om.OpeList(ope_list)
+        elif typ == am.INHERITANCE:
+            claz, imps, exts = values
+            for e in exts:
+                claz2deriving.setdefault(e, []).append(claz)
+            if claz2supers is not None:
+                claz2supers[claz] = tuple(tf.format_sig_in_javap_comment_style(s, None, None, None) for s in imps), \
+                        tuple(tf.format_sig_in_javap_comment_style(s, None, None, None) for s in exts)
+    return sig2oplist, claz2deriving
+
+_precompile_context = None  # (method2claz2code, claz_method_tables, remove_repetition), inherited by forked workers
+
+def _precompile_method_worker(method):
+    method2claz2code, claz_method_tables, remove_repetition = _precompile_context
+    return [(claz, pm.precompile_code(claz, ope_list, 
+            claz_method_tables=claz_method_tables, 
+            remove_repetition=remove_repetition)) for claz, ope_list in method2claz2code[method].iteritems()]
+
+def precompile_methods(method2claz2code, claz_method_tables, remove_repetition, jobs=1):
+    """
+    Precompile code of each method. With jobs > 1, the methods are precompiled by a pool 
+    of 'jobs' processes, which share method2claz2code and claz_method_tables (read-only) 
+    with the parent process, and send back the (compact) precompiled code.
+    """
+    global _precompile_context
+    method2claz2precomp = {}
+    if jobs <= 1:
+        for method, c2c in method2claz2code.iteritems():
+            for claz, ope_list in c2c.iteritems():
+                precomp = pm.precompile_code(claz, ope_list, 
+                        claz_method_tables=claz_method_tables, 
+                        remove_repetition=remove_repetition)
+                method2claz2precomp.setdefault(method, {})[claz] = precomp
+        return method2claz2precomp
+
+    _precompile_context = method2claz2code, claz_method_tables, remove_repetition
+    pool = multiprocessing.Pool(jobs)
+    try:
+        methods = list(method2claz2code.iterkeys())
+        for method, claz_precomps in zip(methods, pool.imap(_precompile_method_worker, methods, chunksize=16)):
+            c2p = method2claz2precomp[method] = {}
+            for claz, precomp in claz_precomps:
+                c2p[claz] = precomp
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        _precompile_context = None
+    return method2claz2precomp
+
+def precomp_cache_options(source, excluded_class_patterns, max_method_definition, allow_repetitive_ngram, 
+        dispatch_optimization=True, cha_dispatch=False):
+    """
+    Returns the options affecting precompiled code (for pm.precomp_cache_key).
+    source is the kind of the input, 'asm' (disassembled files) or 'classes' (class files),
+    which make distinct signatures of some methods (e.g. generic methods).
+    """
+    return dict(source=source, exclude=sorted(set(excluded_class_patterns or [])), 
+            max_method_definition=max_method_definition if max_method_definition > 0 else -1,
+            allow_repetitive_ngram=bool(allow_repetitive_ngram),
+            dispatch_optimization=bool(dispatch_optimization),
+            cha_dispatch=bool(cha_dispatch))
+
 def gen_argpsr():
     from argparse import ArgumentParser
     from _version_data import VERSION
     psr = ArgumentParser(description='Generate n-grams of method calls')
-    psr.add_argument('-a', '--asm-directory', action='store', required=True)
-
+    grp = psr.add_mutually_exclusive_group(required=True)
+    grp.add_argument('-a', '--asm-directory', action='store',
+            help='directory of disassembled files, or a packed asm file made by run_disasm.py --pack')
+    grp.add_argument('--classes', action='store',
+            help='directory containing class files, or a jar file. the class files are read directly in place of disassembled files')
+
+    psr.add_argument('--asm-cache-dir', action='store',
+            help='directory to cache parsed disassembled files, which are reused while the files are unchanged')
+    psr.add_argument('--precomp-cache-dir', action='store',
+            help='directory to cache precompiled code, which is reused while the disassembled files (or class files) and the options are unchanged')
     psr.add_argument('-n', '--ngram-size', action='store', type=int, default=6)
     psr.add_argument('-v', '--verbose', action='store_true')
+    psr.add_argument('-j', '--jobs', action='store', type=int, default=1,
+            help='number of worker processes parsing disassembled files, precompiling methods and generating n-grams. =0 means the number of CPUs. (default is 1.)')
     psr.add_argument('--max-call-depth', action='store', type=int, default=-2,
             help='max depth in expanding method calls. negative number means scale factor to n-gram size. (default is -2, that is. 2 * n-gram size.)')
     psr.add_argument('--max-method-definition', action='store', type=int, default=-1,
             help='max method defintions for a signiture. =-1 means unlimited')
     psr.add_argument('--allow-repetitive-ngram', action='store_true')
     psr.add_argument('--no-branch-ngram', action='store_true')
+    psr.add_argument('--cha-dispatch', action='store_true',
+            help="dispatch a method call of unknown receiver only to the classes derived from the receiver's static type (class hierarchy analysis)")
 
     psr.add_argument('-e', '--exclude', action='append',
             help="specify class in fully-qualified name, e.g. org/myapp/MyClass$AInnerClass. a wildcard '*' can be used as class name, e.g. org/myapp/*")
@@ -424,6 +702,10 @@ def gen_argpsr():
     psr.add_argument('--debug-wo-leaf-class-dispatch-optimization', action='store_true')
     psr.add_argument('--debug-no-returning-execution-path', action='store_true')
     psr.add_argument('--debug-count-branch-in-surface-level', action='store_true')
+    psr.add_argument('--debug-wo-seen-state-pruning', action='store_true')
+    psr.add_argument('--debug-wo-superblocks', action='store_true')
+    psr.add_argument('-o', '--output', action='store',
+            help="output file. compressed when the extension is .gz, .bz2 or .xz. (default is stdout.)")
     psr.add_argument('--version', action='version', version='%(prog)s ' + VERSION)
     return psr
 
@@ -433,7 +715,10 @@ def is_untracked_method_call(c, m):
 def main(argv):
     psr = gen_argpsr()
     args = psr.parse_args(argv[1:])
+    with stdout_to(args.output):
+        run(args)
 
+def run(args):
     max_method_definition = max(-1, args.max_method_definition)
     excluded_class_patterns = frozenset(args.exclude if args.exclude else [])
     entry_class_patterns = frozenset(args.entry if args.entry else [])
@@ -441,60 +726,69 @@ def main(argv):
     verbose = args.verbose
     debug_wo_leaf_class_dispatch_optimization = args.debug_wo_leaf_class_dispatch_optimization
     debug_no_returning_execution_path = args.debug_no_returning_execution_path
+    jobs = args.jobs if args.jobs > 0 else multiprocessing.cpu_count()
 
     if verbose:
         def verbose_write(mes): sys.stderr.write("> %s" % mes)
     else:
         def verbose_write(mes): pass
 
-    if not os.path.isdir(args.asm_directory):
-        sys.exit("error: fail to access asm_directory: %s" % args.asm_directory)
-
-    sig2code = {}
-    #sig2exceptiontable = {}
-    #sig2linenumbertable = {}
-
-    claz2deriving = {}  # claz -> list of the clazs that inherit it
-    for typ, values in am.get_asm_info_iter(args.asm_directory):
-        if typ == am.METHOD_CODE:
-            claz_sig, code, etbl, ltbl = values
-            sig2code[claz_sig] = tuple(code)
-            #sig2exceptiontable[sig] = etbl
-            #sig2linenumbertable[sig] = ltbl
-        elif typ == am.INHERITANCE:
-            claz, imps, exts = values
-            for e in exts:
-                claz2deriving.setdefault(e, []).append(claz)
-
-    if args.mode_method_signature:
-        for claz_sig in sorted(sig2code.iterkeys()):
-            sys.stdout.write('%s.%s\n' % claz_sig.encode('utf-8'))
-    elif args.mode_method_body:
-        for claz_sig, method_body in sorted(sig2code.iteritems()):
-            ol = om.body_text_to_ope_list(method_body, claz_sig)
-            try:
-                om.verify_branch_ope(ol)
-            except om.InvalidOpe as e:
-                raise om.InvalidOpe("%s.%s: %s" % (claz_sig[0], claz_sig[1], str(e)))
-            sys.stdout.write('%s.%s\n' % claz_sig)
-            for L in om.format_ope_list(ol): #, fields=om.FORMAT_FIELD.OPE):
-                sys.stdout.write('%s\n' % L)
+    if args.classes is not None:
+        if not os.path.exists(args.classes):
+            sys.exit("error: fail to access classes: %s" % args.classes)
     else:
-        sig2oplist = {}
-        for claz_sig, method_body in sorted(sig2code.iteritems()):
-            ol = om.body_text_to_ope_list(method_body, claz_sig)
-            sig2oplist[claz_sig] = ol
-        del sig2code
+        if not (os.path.isdir(args.asm_directory) or am.is_asm_pack(args.asm_directory)):
+            sys.exit("error: fail to access asm_directory: %s" % args.asm_directory)
+
+    # the cached precompiled code includes ctors, which are removed after loading or precompiling it,
+    # in order to share the cache with exp_clone.py
+    use_precomp_cache = args.precomp_cache_dir is not None and \
+            not (args.mode_method_signature or args.mode_method_body or args.mode_diagnostic)
+    method2claz2precomp = None
+    if use_precomp_cache:
+        if not os.path.isdir(args.precomp_cache_dir):
+            os.makedirs(args.precomp_cache_dir)
+        precomp_cache_key = pm.precomp_cache_key(
+                am.corpus_fingerprint(args.classes if args.classes is not None else args.asm_directory),
+                precomp_cache_options('classes' if args.classes is not None else 'asm',
+                        excluded_class_patterns, max_method_definition, args.allow_repetitive_ngram,
+                        not debug_wo_leaf_class_dispatch_optimization, args.cha_dispatch))
+        method2claz2precomp = pm.load_precomp_cache(args.precomp_cache_dir, precomp_cache_key)
+        if method2claz2precomp is not None:
+            verbose_write("loaded precompiled code from cache\n")
+
+    if method2claz2precomp is None:
+        if args.classes is not None:
+            info_it = cfm.get_class_info_iter(args.classes)
+        else:
+            info_it = am.get_asm_info_iter(args.asm_directory, jobs=jobs, cache_dir=args.asm_cache_dir)
+        claz2supers = {}
+        sig2oplist, claz2deriving = read_sig2oplist_and_claz2deriving(info_it, claz2supers)
+
+        if args.mode_method_signature:
+            for claz_sig in sorted(sig2oplist.iterkeys()):
+                sys.stdout.write('%s.%s\n' % claz_sig)
+            return
+        elif args.mode_method_body:
+            for claz_sig, ol in sorted(sig2oplist.iteritems()):
+                try:
+                    om.verify_branch_ope(ol)
+                except om.InvalidOpe as e:
+                    raise om.InvalidOpe("%s.%s: %s" % (claz_sig[0], claz_sig[1], str(e)))
+                sys.stdout.write('%s.%s\n' % claz_sig)
+                for L in om.format_ope_list(ol): #, fields=om.FORMAT_FIELD.OPE):
+                    sys.stdout.write('%s\n' % L)
+            return
 
         method2claz2code = make_method2claz2code(sig2oplist)
         del sig2oplist
         claz2methods = make_claz2methods(method2claz2code)
 
         do_filtering_clazs(verbose_write, method2claz2code, excluded_class_patterns)
-        do_filtering_methods(verbose_write, method2claz2code, args.include_ctors, max_method_definition)
-        claz_method_list, claz_method_count = identify_target_claz_method(method2claz2code,entry_class_patterns)
+        do_filtering_methods(verbose_write, method2claz2code, args.include_ctors or use_precomp_cache, max_method_definition)
             
         if args.mode_diagnostic:
+            claz_method_list, claz_method_count = identify_target_claz_method(method2claz2code,entry_class_patterns)
             sys.stdout.write("classes: %d\n" % len(claz_method_count))
             sys.stdout.write("method bodies: %d\n" % sum(claz_method_count.itervalues()))
             m2ccount = collections.Counter()
@@ -507,54 +801,66 @@ def main(argv):
                 sys.stdout.write("  %4d %s\n" % (c, m))
             return
 
+        claz_hierarchy = pm.ClazHierarchy(claz2supers, claz2methods) if args.cha_dispatch else None
+        del claz2supers
         if debug_wo_leaf_class_dispatch_optimization:
             claz2methods = claz2deriving = None
-        method2claz2precomp = {}
-        claz_method_tables = pm.ClazMethodTables(claz2methods, claz2deriving, is_untracked_method_call)
-        for method, c2c in method2claz2code.iteritems():
-            for claz, ope_list in c2c.iteritems():
-#                 if claz == "org/gjt/sp/jedit/bufferio/BufferSaveRequest" and method == "run:()V":
-#                     assert True
-                precomp = pm.precompile_code(claz, ope_list, 
-                        claz_method_tables=claz_method_tables, 
-                        remove_repetition=not args.allow_repetitive_ngram)
-                method2claz2precomp.setdefault(method, {})[claz] = precomp
+        claz_method_tables = pm.ClazMethodTables(claz2methods, claz2deriving, is_untracked_method_call, 
+                claz_hierarchy=claz_hierarchy)
+        del claz_hierarchy
+        method2claz2precomp = precompile_methods(method2claz2code, claz_method_tables, 
+                remove_repetition=not args.allow_repetitive_ngram, jobs=jobs)
         del claz_method_tables
         del method2claz2code
-
-        sys.stdout.write("# --ngram-size=%d\n" % args.ngram_size)
-        sys.stdout.write("# --max-call-depth=%d\n" % args.max_call_depth)
-        sys.stdout.write("# --max-method-definition=%d\n" % max_method_definition)
-        if args.allow_repetitive_ngram:
-            sys.stdout.write("# --allow-repetitive-ngram\n")
-        if args.no_branch_ngram:
-            sys.stdout.write("# --no-branch-ngram\n")
-        if args.include_ctors:
-            sys.stdout.write("# --include-ctors\n")
-        for e in excluded_class_patterns:
-            sys.stdout.write("# --exclude=%s\n" % e)
-        for e in entry_class_patterns:
-            sys.stdout.write("# --entry=%s\n" % e)
-        sys.stdout.write('\n')
-        
-        prev_claz = None
-        for i, (claz, method) in enumerate(claz_method_list):
-            code = method2claz2precomp[method][claz]
-            if verbose and claz != prev_claz:
-                t = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                s = '%s (%d-%d of %d) %s\n' % (t, i+1, i+1 + claz_method_count[claz] - 1, len(claz_method_list), claz)
-                verbose_write(s.encode('utf-8'))
-            prev_claz = claz
-            found_ngrams = gen_code_ngrams(claz, method, method2claz2precomp, args.ngram_size, 
-                    max_call_depth=args.max_call_depth, allow_repetitive_ngram=args.allow_repetitive_ngram,
-                    no_branch_ngram=args.no_branch_ngram, no_returning_execution_path=debug_no_returning_execution_path,
-                    use_undigg_method_list=debug_wo_leaf_class_dispatch_optimization,
-                    count_branch_in_surface_level=args.debug_count_branch_in_surface_level)
-
-            for ngrams in to_ngram_tuples_iter(found_ngrams):  
-                for ngram in ngrams:
-                    sys.stdout.write(''.join("%s\t%s\t%d\n" % op_loc_dep for op_loc_dep in ngram))
-                    sys.stdout.write('\n')
+        if use_precomp_cache:
+            pm.store_precomp_cache(args.precomp_cache_dir, precomp_cache_key, method2claz2precomp)
+
+    if use_precomp_cache and not args.include_ctors:
+        ctors = exclude_ctors(method2claz2precomp)
+        verbose_write("removed ctors: %d\n" % len(ctors))
+    claz_method_list, claz_method_count = identify_target_claz_method(method2claz2precomp, entry_class_patterns)
+
+    sys.stdout.write("# --ngram-size=%d\n" % args.ngram_size)
+    sys.stdout.write("# --max-call-depth=%d\n" % args.max_call_depth)
+    sys.stdout.write("# --max-method-definition=%d\n" % max_method_definition)
+    if args.allow_repetitive_ngram:
+        sys.stdout.write("# --allow-repetitive-ngram\n")
+    if args.no_branch_ngram:
+        sys.stdout.write("# --no-branch-ngram\n")
+    if args.cha_dispatch:
+        sys.stdout.write("# --cha-dispatch\n")
+    if args.include_ctors:
+        sys.stdout.write("# --include-ctors\n")
+    for e in excluded_class_patterns:
+        sys.stdout.write("# --exclude=%s\n" % e)
+    for e in entry_class_patterns:
+        sys.stdout.write("# --entry=%s\n" % e)
+    sys.stdout.write('\n')
+    
+    ngram_options = dict(max_call_depth=args.max_call_depth, allow_repetitive_ngram=args.allow_repetitive_ngram,
+            no_branch_ngram=args.no_branch_ngram, no_returning_execution_path=debug_no_returning_execution_path,
+            use_undigg_method_list=debug_wo_leaf_class_dispatch_optimization,
+            count_branch_in_surface_level=args.debug_count_branch_in_surface_level,
+            prune_seen_states=not args.debug_wo_seen_state_pruning,
+            use_superblocks=not args.debug_wo_superblocks)
+    text_it = None
+    if jobs > 1:
+        text_it = gen_code_ngrams_text_iter(claz_method_list, method2claz2precomp, args.ngram_size, jobs, 
+                **ngram_options)
+
+    prev_claz = None
+    for i, (claz, method) in enumerate(claz_method_list):
+        if verbose and claz != prev_claz:
+            t = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            s = '%s (%d-%d of %d) %s\n' % (t, i+1, i+1 + claz_method_count[claz] - 1, len(claz_method_list), claz)
+            verbose_write(s.encode('utf-8'))
+        prev_claz = claz
+        if text_it is not None:
+            text = next(text_it)
+        else:
+            found_ngrams = gen_code_ngrams(claz, method, method2claz2precomp, args.ngram_size, **ngram_options)
+            text = format_ngrams(found_ngrams)
+        sys.stdout.write(text)
 
 if __name__ == '__main__':
     main(sys.argv)
@@ -6,6 +6,7 @@ __status__ = 'experimental'
 
 import sys
 
+from _utilities import stdout_to
 from enum_generator import EnumGenerator
 import clonefile_manip as cm
 
@@ -58,13 +59,18 @@ def gen_argpsr():
     psr = ArgumentParser(description='Merge multiple-depth clones. merge the clones having distinct depths but having the same starting position.')
     psr.add_argument('clone_index', action='store',
             help="clone-index file (generated by det-clone.py). specify '-' to read from stdin")
+    psr.add_argument('-o', '--output', action='store',
+            help="output file. compressed when the extension is .gz, .bz2 or .xz. (default is stdout.)")
     psr.add_argument('--version', action='version', version='%(prog)s ' + VERSION)
     return psr
 
 def main(argv):
     psr = gen_argpsr()
     args = psr.parse_args(argv[1:])
+    with stdout_to(args.output):
+        run(args)
 
+def run(args):
     clone_index_file = args.clone_index
 
     ope_enum = EnumGenerator()
@@ -8,6 +8,8 @@ to extract a list of operation from it.
 __author__ = 'Toshihiro Kamiya <kamiya@mbj.nifty.com>'
 __status__ = 'experimental'
 
+from array import array
+from bisect import bisect_left
 import re
 
 class OpeError(ValueError):
@@ -16,6 +18,106 @@ class OpeError(ValueError):
 class InvalidOpe(OpeError):
     pass
 
+# tables of interned opecodes and (operands, comment) pairs, shared by all OpeList objects
+_opecode_names = []
+_opecode_to_id = {}
+_args_table = []
+_args_to_id = {}
+
+def _intern_opecode(opecode):
+    i = _opecode_to_id.get(opecode)
+    if i is None:
+        i = _opecode_to_id[opecode] = len(_opecode_names)
+        _opecode_names.append(opecode)
+    return i
+
+def _intern_args(operands, comment):
+    key = (tuple(operands), type(operands), comment)  # operands of a switch is a list
+    i = _args_to_id.get(key)
+    if i is None:
+        i = _args_to_id[key] = len(_args_table)
+        _args_table.append((operands, comment))
+    return i
+
+class OpeList(object):
+    """
+    Compact (read-only) representation of an operation list, 
+    a list of tuple (opecode, operands, comment) padded with None, which body_text_to_ope_list returns.
+    The operations are stored in parallel arrays of offsets, ids of opecodes and
+    ids of interned (operands, comment) pairs, and an operation is looked up by an offset 
+    with binary search. Indexing and iteration behave as the original list does.
+    """
+    __slots__ = ('_len', '_offsets', '_opecode_ids', '_args_ids')
+
+    def __init__(self, ope_list):
+        self._len = len(ope_list)
+        self._offsets = array('i')
+        self._opecode_ids = array('H')
+        self._args_ids = array('i')
+        for index, ope in ope_iter(ope_list):
+            opecode, operands, comment = ope
+            self._offsets.append(index)
+            self._opecode_ids.append(_intern_opecode(opecode))
+            self._args_ids.append(_intern_args(operands, comment))
+
+    def __len__(self):
+        return self._len
+
+    def _ope_at(self, i):
+        operands, comment = _args_table[self._args_ids[i]]
+        return (_opecode_names[self._opecode_ids[i]], operands, comment)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(self._len))]
+        if index < 0:
+            index += self._len
+        if not (0 <= index < self._len):
+            raise IndexError("OpeList index out of range")
+        offsets = self._offsets
+        i = bisect_left(offsets, index)
+        if i < len(offsets) and offsets[i] == index:
+            return self._ope_at(i)
+        return None
+
+    def __iter__(self):
+        last = 0
+        for i, offset in enumerate(self._offsets):
+            for _ in xrange(last, offset):
+                yield None
+            yield self._ope_at(i)
+            last = offset + 1
+        for _ in xrange(last, self._len):
+            yield None
+
+    def __eq__(self, other):
+        if isinstance(other, OpeList):
+            return self._len == other._len and list(self.ope_iter()) == list(other.ope_iter())
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def ope_iter(self):
+        """
+        Iterate (offset, ope) of each operation, skipping the padding.
+        """
+        for i, offset in enumerate(self._offsets):
+            yield offset, self._ope_at(i)
+
+def ope_iter(ope_list):
+    """
+    Iterate (offset, ope) of each operation (other than None) in an operation list or an OpeList.
+    """
+    if isinstance(ope_list, OpeList):
+        return ope_list.ope_iter()
+    return ((index, ope) for index, ope in enumerate(ope_list) if ope is not None)
+
 def verify_branch_ope(ope_list):
     jump_ops = frozenset([
             "ifeq", "ifnull", "iflt", "ifle", "ifne", "ifnonull", "ifgt", "ifge",
@@ -23,9 +125,7 @@ def verify_branch_ope(ope_list):
             "goto", "gotow",
             "jsr", "jsr_w",
     ])
-    for index, ope in enumerate(ope_list):
-        if ope is None:
-            continue
+    for index, ope in ope_iter(ope_list):
         (opecode, operands, comment) = ope
         if opecode in jump_ops:
             dest_index = int(operands[0])
@@ -129,9 +229,7 @@ def format_ope_list(ope_list,
         fields=FORMAT_FIELD.ADDR | FORMAT_FIELD.OPE | FORMAT_FIELD.COMMENT):
     assert fields & FORMAT_FIELD.OPE
     lines = []; l_a = lines.append
-    for index, ope in enumerate(ope_list):
-        if ope is None:
-            continue
+    for index, ope in ope_iter(ope_list):
         (opecode, operands, comment) = ope
         if comment is None or (fields & FORMAT_FIELD.COMMENT) == 0:
             comment = ''
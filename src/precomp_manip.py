@@ -3,11 +3,19 @@
 __author__ = 'Toshihiro Kamiya <kamiya@mbj.nifty.com>'
 __status__ = 'experimental'
 
+from array import array
+from bisect import bisect_left
+import hashlib
+import itertools
+import marshal
+import os
 import re
 import sys
+import tempfile
 import collections
 
 from _utilities import sort_uniq
+from ope_manip import ope_iter
 
 _BRANCH_OPES = frozenset([
     "ifeq", "ifnull", "iflt", "ifle", "ifne", "ifnonnull", "ifgt", "ifge",
@@ -69,19 +77,107 @@ def get_claz_method_from_comment(comment, context_claz=None):
 THROW, RETURN, BRANCHS, GOTO, INVOKE = range(1, 5 + 1)
 #THROW, RETURN, BRANCHS, GOTO, INVOKE = "THROW", "RETURN", "BRANCHS", "GOTO", "INVOKE"
 
+def _merge_runs(runs):
+    runs.sort()
+    merged = []
+    for lo, hi in runs:
+        if merged and lo <= merged[-1][1]:
+            if hi > merged[-1][1]:
+                merged[-1] = (merged[-1][0], hi)
+        else:
+            merged.append((lo, hi))
+    return merged
+
+def _remove_from_runs(runs, i):
+    r = []
+    for lo, hi in runs:
+        if lo <= i < hi:
+            if lo < i:
+                r.append((lo, i))
+            if i + 1 < hi:
+                r.append((i + 1, hi))
+        else:
+            r.append((lo, hi))
+    return r
+
+def claz_hierarchy_closure(claz2deriving):
+    """
+    Calculates the indirect deriving classes of each class, without recursion.
+    Returns (id2claz, claz2id, id2runs), where the classes are numbered in post-order of 
+    depth-first search (in which the indirect deriving classes of a class in a tree-shaped 
+    hierarchy get consecutive ids), and id2runs[i] is a sorted list of ranges (lo, hi) 
+    of the ids of the indirect deriving classes of the class of id i.
+    Classes in a cycle are the indirect deriving classes of each other.
+    """
+    clazs = set(claz2deriving.iterkeys())
+    for ds in claz2deriving.itervalues():
+        clazs.update(ds)
+
+    # Tarjan's algorithm, which finds strongly connected components in post-order
+    index_of = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    sccs = []
+    for root in sorted(clazs):
+        if root in index_of:
+            continue  # for root
+        index_of[root] = lowlink[root] = len(index_of)
+        stack.append(root); on_stack.add(root)
+        work = [(root, iter(claz2deriving.get(root, ())))]
+        while work:
+            v, it = work[-1]
+            for w in it:
+                if w not in index_of:
+                    index_of[w] = lowlink[w] = len(index_of)
+                    stack.append(w); on_stack.add(w)
+                    work.append((w, iter(claz2deriving.get(w, ()))))
+                    break  # for w
+                elif w in on_stack:
+                    lowlink[v] = min(lowlink[v], index_of[w])
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    lowlink[u] = min(lowlink[u], lowlink[v])
+                if lowlink[v] == index_of[v]:
+                    scc = []
+                    while True:
+                        w = stack.pop(); on_stack.discard(w)
+                        scc.append(w)
+                        if w == v:
+                            break  # while True
+                    sccs.append(scc)
+    del index_of, lowlink
+
+    id2claz = []
+    claz2id = {}
+    id2runs = []
+    for scc in sccs:
+        scc_ids = range(len(id2claz), len(id2claz) + len(scc))
+        for c in scc:
+            claz2id[c] = len(id2claz)
+            id2claz.append(c)
+        runs = []
+        for c in scc:
+            for d in claz2deriving.get(c, ()):
+                di = claz2id[d]
+                if di < scc_ids[0]:
+                    runs.append((di, di + 1))
+                    runs.extend(id2runs[di])
+        if len(scc) > 1:
+            runs.append((scc_ids[0], scc_ids[-1] + 1))
+        runs = _merge_runs(runs)
+        for i in scc_ids:
+            id2runs.append(_remove_from_runs(runs, i) if len(scc) > 1 else runs)
+    return id2claz, claz2id, id2runs
+
 def claz2indirect_deriving(claz2deriving):
+    id2claz, claz2id, id2runs = claz_hierarchy_closure(claz2deriving)
     claz2indd = {}  # claz -> set of claz
-    def add(c, cindd, d):
-        if d == c:
-            return
-        cindd.add(d)
-        dds = claz2deriving.get(d)
-        if dds:
-            for dd in dds:
-                add(c, cindd, dd)
     for c, ds in claz2deriving.iteritems():
-        for d in ds:
-            add(c, claz2indd.setdefault(c, set()), d)
+        if ds:
+            claz2indd[c] = set(id2claz[i] for lo, hi in id2runs[claz2id[c]] for i in xrange(lo, hi))
     return claz2indd
 
 def claz2methods_defined_in_the_class_but_not_in_its_derivings(claz2methods, claz2indd):
@@ -99,13 +195,111 @@ def claz2methods_defined_in_the_class_but_not_in_its_derivings(claz2methods, cla
         claz2mdoins[c] = frozenset(mdoin)
     return claz2mdoins
 
+def claz2methods_defined_in_the_class_but_not_in_its_derivings_w_closure(claz2methods, claz2deriving):
+    """
+    Same as claz2methods_defined_in_the_class_but_not_in_its_derivings, but takes claz2deriving,
+    and checks whether the indirect deriving classes define each method with ranges of class ids 
+    (made by claz_hierarchy_closure) and sorted ids of the classes defining the method,
+    instead of set differences.
+    """
+    id2claz, claz2id, id2runs = claz_hierarchy_closure(claz2deriving)
+    method2defining_ids = {}
+    for c, ms in claz2methods.iteritems():
+        ci = claz2id.get(c)
+        if ci is not None:
+            for m in ms:
+                method2defining_ids.setdefault(m, []).append(ci)
+    for ids in method2defining_ids.itervalues():
+        ids.sort()
+
+    def defined_in_runs(m, runs):
+        ids = method2defining_ids[m]
+        if len(ids) == 1:
+            return False  # only in the class itself
+        for lo, hi in runs:
+            j = bisect_left(ids, lo)
+            if j < len(ids) and ids[j] < hi:
+                return True
+        return False
+
+    claz2mdoins = {}  # claz -> set of methods (which are only defined in claz)
+    for c, ms in claz2methods.iteritems():
+        ci = claz2id.get(c)
+        runs = id2runs[ci] if ci is not None else None
+        if not runs:
+            claz2mdoins[c] = frozenset(ms)
+        else:
+            claz2mdoins[c] = frozenset(m for m in ms if not defined_in_runs(m, runs))
+    return claz2mdoins
+
+class ClazHierarchy(object):
+    """
+    Class hierarchy analysis of dynamic dispatch.
+    Takes claz2supers (claz -> (its extending classes, its implementing interfaces),
+    the same as values of INHERITANCE records but in the form of claz of claz2methods;
+    for an interface, its extended interfaces are its implementing interfaces) 
+    and claz2methods, and finds the classes to which a method call is dispatched,
+    from the static type of the receiver.
+    """
+    def __init__(self, claz2supers, claz2methods):
+        self.recorded_clazs = frozenset(claz2supers.iterkeys())
+        claz2deriving = {}
+        self.claz2superclaz = {}
+        for c, (exts, imps) in claz2supers.iteritems():
+            claz2deriving.setdefault(c, [])
+            for s in exts + imps:
+                claz2deriving.setdefault(s, []).append(c)
+            if exts:
+                self.claz2superclaz[c] = exts[0]
+        self.id2claz, self.claz2id, self.id2runs = claz_hierarchy_closure(claz2deriving)
+        self.claz2methods = dict((c, frozenset(ms)) for c, ms in claz2methods.iteritems())
+        self._dispatch_memo = {}  # (static claz, method) -> tuple of clazs or None
+
+    def _nearest_defining_claz(self, claz, method):
+        visited = set()
+        while claz is not None and claz not in visited:
+            if method in self.claz2methods.get(claz, ()):
+                return claz
+            visited.add(claz)
+            claz = self.claz2superclaz.get(claz)
+        return None
+
+    def dispatch_candidates(self, static_claz, method):
+        """
+        Returns a sorted tuple of the classes, whose definition of the method is invoked 
+        by a method call of the static receiver type static_claz, that is, for static_claz 
+        and each of its (indirect) deriving classes, the class itself or its nearest superclass 
+        which defines the method.
+        Returns None when static_claz is not in claz2supers (e.g. a library class, whose deriving 
+        classes in the library are not known) or is java/lang/Object, where the method call may be 
+        dispatched to any class.
+        """
+        key = static_claz, method
+        r = self._dispatch_memo.get(key, False)
+        if r is not False:
+            return r
+        if static_claz not in self.recorded_clazs or static_claz == 'java/lang/Object':
+            r = None
+        else:
+            ci = self.claz2id[static_claz]
+            id2claz = self.id2claz
+            cands = set()
+            for c in itertools.chain([static_claz], (id2claz[i] for lo, hi in self.id2runs[ci] for i in xrange(lo, hi))):
+                d = self._nearest_defining_claz(c, method)
+                if d is not None:
+                    cands.add(d)
+            r = tuple(sorted(cands))
+        self._dispatch_memo[key] = r
+        return r
+
 class ClazMethodTables(object):
-    def __init__(self, claz2methods, claz2deriving, is_untracked_method_call):
+    def __init__(self, claz2methods, claz2deriving, is_untracked_method_call, claz_hierarchy=None):
         self.claz2methods = claz2methods
         self.claz2deriving = claz2deriving
-        claz2indd = claz2indirect_deriving(claz2deriving)
-        self.claz2ms_doiid = claz2methods_defined_in_the_class_but_not_in_its_derivings(claz2methods, claz2indd)
+        self.claz2ms_doiid = claz2methods_defined_in_the_class_but_not_in_its_derivings_w_closure(
+                claz2methods, claz2deriving)
         self.is_untracked_method_call = is_untracked_method_call
+        self.claz_hierarchy = claz_hierarchy
 
 def count_method_args(m):
     p = m.index(":(")
@@ -149,16 +343,16 @@ def precompile_ope_list_to_cell_array(claz, ope_list, claz_method_tables=None):
     claz2ms_doiid = claz_method_tables.claz2ms_doiid
     has_deriving_clazs = claz_method_tables.claz2deriving.get
     is_untracked_method_call = claz_method_tables.is_untracked_method_call
+    claz_hierarchy = claz_method_tables.claz_hierarchy
         
     ope_list_len = len(ope_list)
     cells = [[index, None, None, None] for index in range(ope_list_len + 1)]
     entrance_cell = [-1, None, None, None]
     prev_cell = entrance_cell
-    for index in range(ope_list_len):
-        cells_i = cells[index]
-        ope = ope_list[index]
-        if not(ope is not None and ope[0] in VALID_OPS):
+    for index, ope in ope_iter(ope_list):
+        if ope[0] not in VALID_OPS:
             continue
+        cells_i = cells[index]
 
         opecode, operands, comment = ope
         if opecode in _RETURN_OPS:
@@ -202,7 +396,12 @@ def precompile_ope_list_to_cell_array(claz, ope_list, claz_method_tables=None):
             if do_dynamic_dispatch_optimization and is_untracked_method_call(tc, m):
                 pass
             else:
-                cells_i[2:4] = [INVOKE, (tc, m)]
+                arg = (tc, m)
+                if tc is None and claz_hierarchy is not None:
+                    dispatch = claz_hierarchy.dispatch_candidates(c if c is not None else claz, m)
+                    if dispatch is not None:
+                        arg = (tc, m, dispatch)
+                cells_i[2:4] = [INVOKE, arg]
                 prev_cell[1] = index; prev_cell = cells_i
         elif opecode in _INVOKE_STATIC_OPS:
             c, m = get_claz_method_from_comment(comment, context_claz=claz)
@@ -216,20 +415,69 @@ def precompile_ope_list_to_cell_array(claz, ope_list, claz_method_tables=None):
 
     return cells, entrance_cell
 
-def overwrite_goto_and_branch_to_cell(cells, entrance_cell, old_index, new_index):
+def cell_dest_indices(cell):
+    """
+    Returns indices of cells which a cell refers to, as a next cell or as a destination.
+    """
+    dis = []
+    if cell[1] is not None:
+        dis.append(cell[1])
+    if cell[2] == GOTO:
+        dis.append(cell[3])
+    elif cell[2] == BRANCHS:
+        dis.extend(cell[3])
+    return dis
+
+def build_incoming_edge_index(cells):
+    """
+    Returns a dict from index of a cell to a set of indices of the cells referring to it.
+    """
+    incoming_edges = collections.defaultdict(set)
+    for cell in cells:
+        ci = cell[0]
+        for di in cell_dest_indices(cell):
+            incoming_edges[di].add(ci)
+    return incoming_edges
+
+def _unindex_cell(incoming_edges, cell):
+    ci = cell[0]
+    for di in cell_dest_indices(cell):
+        incoming_edges[di].discard(ci)
+
+def _index_cell(incoming_edges, cell):
+    ci = cell[0]
+    for di in cell_dest_indices(cell):
+        incoming_edges[di].add(ci)
+
+def overwrite_goto_and_branch_to_cell(cells, entrance_cell, old_index, new_index, incoming_edges=None):
+    """
+    Redirects references to the cell of old_index to the cell of new_index.
+    With incoming_edges (made by build_incoming_edge_index), only the cells referring 
+    to old_index are visited, and incoming_edges is updated.
+    """
     if entrance_cell[1] == old_index:
         entrance_cell[1] = new_index
-        
-    for cell in cells:
-        if cell[1] == old_index:
-            if cell[0] != old_index:
-                cell[1] = new_index
-        if cell[2] == GOTO:
-            if cell[3] == old_index:
-                cell[3] = new_index
-        elif cell[2] == BRANCHS:
-            if old_index in cell[3]:
-                cell[3] = sort_uniq(map(lambda i: i if i != old_index else new_index, cell[3]))
+    
+    if incoming_edges is None:
+        for cell in cells:
+            _overwrite_goto_and_branch_of_cell(cell, old_index, new_index)
+    else:
+        for ci in sorted(incoming_edges.get(old_index, ())):
+            cell = cells[ci]
+            _unindex_cell(incoming_edges, cell)
+            _overwrite_goto_and_branch_of_cell(cell, old_index, new_index)
+            _index_cell(incoming_edges, cell)
+
+def _overwrite_goto_and_branch_of_cell(cell, old_index, new_index):
+    if cell[1] == old_index:
+        if cell[0] != old_index:
+            cell[1] = new_index
+    if cell[2] == GOTO:
+        if cell[3] == old_index:
+            cell[3] = new_index
+    elif cell[2] == BRANCHS:
+        if old_index in cell[3]:
+            cell[3] = sort_uniq(map(lambda i: i if i != old_index else new_index, cell[3]))
 
 def check_destination_cell_valid(cells, entrance_cell):
     footmarks = [False] * len(cells)
@@ -341,7 +589,7 @@ def get_block_entrance_cells(cells, entrance_cell):
 
 def optmize_gotos_in_cell_array(cells, entrance_cell):
     def next_valid_cell_index(index):
-        for i in range(index, len(cells)):
+        for i in xrange(index, len(cells)):
             if cells[i][2] is not None:
                 return i
         assert False
@@ -369,10 +617,14 @@ def optmize_gotos_in_cell_array(cells, entrance_cell):
                 break  # while True
         return dest_index
 
-    collapsed_branchs_cell_exists = True
-    while collapsed_branchs_cell_exists:
-        collapsed_branchs_cell_exists = False
-        for cell in cells:
+    # a branchs cell collapsed into a goto cell changes final destinations of the cells
+    # referring to it, so such cells are revisited (in the next round), instead of 
+    # rescanning all cells until no branchs cell collapses.
+    incoming_edges = None
+    target_cells = cells
+    while target_cells:
+        collapsed_cell_indices = []
+        for cell in target_cells:
             if cell[1] is not None:
                 cell[1] = get_final_dest_index(cell[1])
             if cell[2] == GOTO:
@@ -383,11 +635,23 @@ def optmize_gotos_in_cell_array(cells, entrance_cell):
                 cell[3] = sort_uniq(dis)
                 if not cell[3] or cell[3] == [cell[1]]:
                     cell[:] = [cell[0], cell[1], GOTO, cell[1]]
-                    collapsed_branchs_cell_exists = True
+                    collapsed_cell_indices.append(cell[0])
+            if incoming_edges is not None:
+                _index_cell(incoming_edges, cell)
+        if not collapsed_cell_indices:
+            break  # while target_cells
+        if incoming_edges is None:
+            incoming_edges = build_incoming_edge_index(cells)
+        revisited_indices = set()
+        for ci in collapsed_cell_indices:
+            revisited_indices.update(incoming_edges.pop(ci, ()))
+        target_cells = [cells[ci] for ci in sorted(revisited_indices)]
 
     entrance_cell[1] = get_final_dest_index(entrance_cell[1])
 
-def remove_repetitions_in_cell_array(cells, entrance_cell):
+def remove_repetitions_in_cell_array(cells, entrance_cell, incoming_edges=None):
+    if incoming_edges is None:
+        incoming_edges = build_incoming_edge_index(cells)
     for cell in cells:
         if cell[2] != INVOKE:
             continue
@@ -399,10 +663,12 @@ def remove_repetitions_in_cell_array(cells, entrance_cell):
             if next_cell[2] != INVOKE:
                 break  # while
             if next_cell[3] == cell[3]:
-                overwrite_goto_and_branch_to_cell(cells, entrance_cell, next_index, next_cell[1])
+                overwrite_goto_and_branch_to_cell(cells, entrance_cell, next_index, next_cell[1], incoming_edges)
             next_index = next_cell[1]
 
-def merge_branches_in_cell_array(cells, entrance_cell):
+def merge_branches_in_cell_array(cells, entrance_cell, incoming_edges=None):
+    if incoming_edges is None:
+        incoming_edges = build_incoming_edge_index(cells)
     for cell in cells:
         if cell[2] != BRANCHS:
             continue
@@ -414,8 +680,10 @@ def merge_branches_in_cell_array(cells, entrance_cell):
             next_cell = cells[next_index]
             if next_cell[2] != BRANCHS:
                 break  # while
+            _unindex_cell(incoming_edges, cell)
             cell[3] = sort_uniq([index for index in cell[3] + next_cell[3] if index != next_index])
-            overwrite_goto_and_branch_to_cell(cells, entrance_cell, next_index, next_cell[1])
+            _index_cell(incoming_edges, cell)
+            overwrite_goto_and_branch_to_cell(cells, entrance_cell, next_index, next_cell[1], incoming_edges)
             next_index = next_cell[1]
 
 def repr_precompiled_cell_array(cells):
@@ -435,17 +703,251 @@ def repr_precompiled_cell_array(cells):
     return "[\n  %s\n]" % ",\n  ".join(buf)
 
 class PrecompData(object):
+    """
+    Precompiled code of a method, a graph of cells stored in arrays.
+    Each node (a cell which has a command, or is referred to by other cells) is numbered 
+    in order of index (offset of the operation), and the graph is represented with 
+    the following arrays, indexed by node number:
+      indices: index of the cell
+      nexts: node number of the next cell (-1 when the cell does not have next cell)
+      cmds: command (THROW, RETURN, BRANCHS, GOTO, INVOKE, or 0 when the cell does not have a command)
+      args: argument of the command, that is,
+        for GOTO, node number of the destination,
+        for BRANCHS, position in branch_targets, where the number of the destinations 
+          and then node numbers of the destinations are stored,
+        for INVOKE, position in invokes, a list of (claz, method), 
+        otherwise -1.
+      bents: 1 when the cell is a block entrance cell, otherwise 0.
+    and dispatches, a list parallel to invokes, of sorted tuples of the classes to which
+    the method call of unknown receiver is dispatched (made by ClazHierarchy), or None when 
+    the method call may be dispatched to any class. dispatches is None when none of 
+    the method calls are restricted.
+    The constructor takes a linked list of cells (made by precompile_cell_array_to_cell_linked_list).
+    """
+    __slots__ = ('indices', 'nexts', 'cmds', 'args', 'branch_targets', 'invokes', 'dispatches', 'bents', 'start_node',
+            '_bent_ordinals', '_bent_reach', '_superblocks')
+
     def __init__(self, cells, start_cell, bent_cells):
-        self.start_cell = start_cell
-        self.cells = cells
-        self.bent_cells = bent_cells
+        node_indices = set([start_cell[0]])
+        for cell in cells:
+            if cell is None or cell[2] is None:
+                continue
+            node_indices.add(cell[0])
+            if cell[1] is not None:
+                node_indices.add(cell[1][0])
+            if cell[2] == GOTO:
+                node_indices.add(cell[3][0])
+            elif cell[2] == BRANCHS:
+                node_indices.update(dest_cell[0] for dest_cell in cell[3])
+        index_to_cell = dict((cell[0], cell) for cell in cells if cell is not None)
+        index_to_node = dict((index, n) for n, index in enumerate(sorted(node_indices)))
+
+        self.indices = indices = array('i')
+        self.nexts = nexts = array('i')
+        self.cmds = cmds = array('b')
+        self.args = args = array('i')
+        self.branch_targets = branch_targets = array('i')
+        self.invokes = invokes = []
+        dispatches = []
+        self.bents = bents = bytearray()
+        for index in sorted(node_indices):
+            _, next_cell, cmd, arg = index_to_cell[index]
+            indices.append(index)
+            nexts.append(index_to_node[next_cell[0]] if next_cell is not None else -1)
+            cmds.append(cmd or 0)
+            bents.append(1 if index in bent_cells else 0)
+            if cmd == GOTO:
+                args.append(index_to_node[arg[0]])
+            elif cmd == BRANCHS:
+                args.append(len(branch_targets))
+                branch_targets.append(len(arg))
+                branch_targets.extend(index_to_node[dest_cell[0]] for dest_cell in arg)
+            elif cmd == INVOKE:
+                args.append(len(invokes))
+                invokes.append(arg[:2])
+                dispatches.append(arg[2] if len(arg) > 2 else None)
+            else:
+                args.append(-1)
+        self.dispatches = dispatches if any(d is not None for d in dispatches) else None
+        self.start_node = index_to_node[start_cell[0]]
+        self._bent_ordinals = None
+        self._bent_reach = None
+        self._superblocks = None
+
+    def node_of(self, index):
+        """
+        Returns node number of the cell of index.
+        """
+        n = bisect_left(self.indices, index)
+        if n < len(self.indices) and self.indices[n] == index:
+            return n
+        raise KeyError(index)
+
+    def branch_dests(self, node):
+        p = self.args[node]
+        return self.branch_targets[p + 1:p + 1 + self.branch_targets[p]]
+
+    def _successors(self, node):
+        cmd = self.cmds[node]
+        succs = [self.nexts[node]] if self.nexts[node] >= 0 else []
+        if cmd == GOTO:
+            succs.append(self.args[node])
+        elif cmd == BRANCHS:
+            succs.extend(self.branch_dests(node))
+        return succs
+
+    def bent_ordinals(self):
+        """
+        Returns an array indexed by node number, of the ordinal of each block entrance cell 
+        (the position in the block entrance cells in order of index), or -1 for the other nodes.
+        A set of block entrance cells is represented by a bit mask of the ordinals.
+        Calculated on the first call.
+        """
+        if self._bent_ordinals is None:
+            ordinals = array('i', [-1]) * len(self.bents)
+            o = 0
+            for n, b in enumerate(self.bents):
+                if b:
+                    ordinals[n] = o
+                    o += 1
+            self._bent_ordinals = ordinals
+        return self._bent_ordinals
+
+    def reachable_bent_mask(self, node):
+        """
+        Returns a bit mask of the ordinals of the block entrance cells reachable from the node
+        (including the node itself, when it is a block entrance cell).
+        Calculated for all nodes on the first call. The masks are calculated for the strongly connected 
+        components of the graph (with Tarjan's algorithm, which finds a component after the components
+        reachable from it), and are shared by the nodes of a component, and by a component and 
+        the one following it when the former has no block entrance cell and no other following component.
+        """
+        if self._bent_reach is None:
+            ordinals = self.bent_ordinals()
+            node_count = len(ordinals)
+            node_scc = array('i', [-1]) * node_count
+            order = array('i', [-1]) * node_count
+            lowlink = array('i', [0]) * node_count
+            scc_masks = []
+            stack = []
+            counter = 0
+            for root in xrange(node_count):
+                if order[root] >= 0:
+                    continue  # for root
+                order[root] = lowlink[root] = counter
+                counter += 1
+                stack.append(root)
+                work = [(root, iter(self._successors(root)))]
+                while work:
+                    n, succ_it = work[-1]
+                    for m in succ_it:
+                        if order[m] < 0:
+                            order[m] = lowlink[m] = counter
+                            counter += 1
+                            stack.append(m)
+                            work.append((m, iter(self._successors(m))))
+                            break  # for m
+                        elif node_scc[m] < 0 and order[m] < lowlink[n]:  # m is on the stack
+                            lowlink[n] = order[m]
+                    else:
+                        work.pop()
+                        if work and lowlink[n] < lowlink[work[-1][0]]:
+                            lowlink[work[-1][0]] = lowlink[n]
+                        if lowlink[n] != order[n]:
+                            continue  # while work
+                        scc = len(scc_masks)
+                        members = []
+                        while True:
+                            m = stack.pop()
+                            node_scc[m] = scc
+                            members.append(m)
+                            if m == n:
+                                break  # while True
+                        mask = 0
+                        for m in members:
+                            if ordinals[m] >= 0:
+                                mask |= 1 << ordinals[m]
+                        for m in members:
+                            for d in self._successors(m):
+                                s = node_scc[d]
+                                if s != scc and scc_masks[s] is not mask:
+                                    mask = scc_masks[s] if mask == 0 else mask | scc_masks[s]
+                        scc_masks.append(mask)
+            self._bent_reach = node_scc, scc_masks
+        node_scc, scc_masks = self._bent_reach
+        return scc_masks[node_scc[node]]
+
+    def reachable_bent_indices(self, node):
+        """
+        Returns a frozenset of the indices of the block entrance cells reachable from the node
+        (including the node itself, when it is a block entrance cell).
+        """
+        mask = self.reachable_bent_mask(node)
+        ordinals = self.bent_ordinals()
+        return frozenset(self.indices[n] for n in xrange(len(ordinals)) if ordinals[n] >= 0 and mask >> ordinals[n] & 1)
+
+    def superblocks(self):
+        """
+        Returns a list indexed by node number, of (superblock, offset) for each node in a superblock,
+        otherwise None. A superblock is a maximal run of two or more INVOKE cells, each of which is
+        followed by the next one, and the following ones of which are not block entrance cells.
+        A superblock is a tuple (node numbers, indices, (claz, method) labels, positions in invokes),
+        and offset is the position of the node in it.
+        Calculated on the first call.
+        """
+        if self._superblocks is None:
+            nexts, cmds, args, bents = self.nexts, self.cmds, self.args, self.bents
+            node_count = len(cmds)
+            followings = set()
+            for n in xrange(node_count):
+                if cmds[n] == INVOKE:
+                    m = nexts[n]
+                    if m >= 0 and cmds[m] == INVOKE and not bents[m]:
+                        followings.add(m)
+            sbs = [None] * node_count
+            for n in xrange(node_count):
+                if cmds[n] != INVOKE or n in followings:
+                    continue  # for n
+                run = [n]
+                m = nexts[n]
+                while m in followings and sbs[m] is None:
+                    sbs[m] = ()  # visited
+                    run.append(m)
+                    m = nexts[m]
+                if len(run) >= 2:
+                    invoke_poss = tuple(args[m] for m in run)
+                    sb = (tuple(run), tuple(self.indices[m] for m in run),
+                            tuple(self.invokes[pos] for pos in invoke_poss), invoke_poss)
+                    for offset, m in enumerate(run):
+                        sbs[m] = (sb, offset)
+            self._superblocks = [sb or None for sb in sbs]
+        return self._superblocks
+
+    def __getstate__(self):
+        # a tuple of strings, lists and ints, which can be serialized with marshal
+        return (self.indices.tostring(), self.nexts.tostring(), self.cmds.tostring(), self.args.tostring(),
+                self.branch_targets.tostring(), self.invokes, self.dispatches, str(self.bents), self.start_node)
+
+    def __setstate__(self, state):
+        indices, nexts, cmds, args, branch_targets, invokes, dispatches, bents, self.start_node = state
+        self.indices = array('i', indices)
+        self.nexts = array('i', nexts)
+        self.cmds = array('b', cmds)
+        self.args = array('i', args)
+        self.branch_targets = array('i', branch_targets)
+        self.invokes = [tuple(ivk) for ivk in invokes]
+        self.dispatches = [tuple(d) if d is not None else None for d in dispatches] if dispatches is not None else None
+        self.bents = bytearray(bents)
+        self._bent_ordinals = None
+        self._bent_reach = None
+        self._superblocks = None
 
 def precompile_cell_array_to_cell_linked_list(cells, entrance_cell):
     ope_list_len = len(cells) - 1
     cell_valid_flags = [False] * len(cells)
 
     def locate_dest_cell(dest_index, cells):
-        for j in range(dest_index, ope_list_len + 1):
+        for j in xrange(dest_index, ope_list_len + 1):
             if cells[j][2] is not None:
                 return j
         assert False
@@ -475,13 +977,54 @@ def precompile_code(claz, ope_list,  claz_method_tables=None, remove_repetition=
     cells, entrance_cell = precompile_ope_list_to_cell_array(claz, ope_list, claz_method_tables)
     optmize_gotos_in_cell_array(cells, entrance_cell)
     check_destination_cell_valid(cells, entrance_cell)
-    merge_branches_in_cell_array(cells, entrance_cell)
+    incoming_edges = build_incoming_edge_index(cells)
+    merge_branches_in_cell_array(cells, entrance_cell, incoming_edges)
     if remove_repetition:
-        remove_repetitions_in_cell_array(cells, entrance_cell)
+        remove_repetitions_in_cell_array(cells, entrance_cell, incoming_edges)
     block_entrance_cells = get_block_entrance_cells(cells, entrance_cell)
     start_cell, valid_cells = precompile_cell_array_to_cell_linked_list(cells, entrance_cell)
     return PrecompData(valid_cells, start_cell, frozenset(block_entrance_cells))
 
+PRECOMP_CACHE_VERSION = 3
+
+def precomp_cache_key(corpus_fingerprint, options):
+    """
+    Returns a key of a cache of precompiled code, made from a fingerprint of 
+    the corpus and options affecting precompilation (a dict).
+    """
+    return hashlib.sha1(repr((PRECOMP_CACHE_VERSION, corpus_fingerprint, sorted(options.iteritems())))).hexdigest()
+
+def _precomp_cache_file(cache_dir, key):
+    return os.path.join(cache_dir, "precomp-%s.marshal" % key)
+
+def load_precomp_cache(cache_dir, key):
+    """
+    Returns method2claz2precomp stored by store_precomp_cache, or None when not cached.
+    """
+    try:
+        with open(_precomp_cache_file(cache_dir, key), "rb") as f:
+            version, method2claz2state = marshal.load(f)
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+    if version != PRECOMP_CACHE_VERSION:
+        return None
+    method2claz2precomp = {}
+    for method, claz2state in method2claz2state.iteritems():
+        claz2precomp = method2claz2precomp[method] = {}
+        for claz, state in claz2state.iteritems():
+            precomp = PrecompData.__new__(PrecompData)
+            precomp.__setstate__(state)
+            claz2precomp[claz] = precomp
+    return method2claz2precomp
+
+def store_precomp_cache(cache_dir, key, method2claz2precomp):
+    method2claz2state = dict((method, dict((claz, precomp.__getstate__()) for claz, precomp in c2p.iteritems())) \
+            for method, c2p in method2claz2precomp.iteritems())
+    fd, temp_file = tempfile.mkstemp(suffix=".tmp", dir=cache_dir)
+    with os.fdopen(fd, "wb") as f:
+        marshal.dump((PRECOMP_CACHE_VERSION, method2claz2state), f)
+    os.rename(temp_file, _precomp_cache_file(cache_dir, key))
+
 def pretty_precompiled(precomp):
     assert precomp is not None
     buf = []
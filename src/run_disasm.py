@@ -4,11 +4,22 @@
 __author__ = 'Toshihiro Kamiya <kamiya@mbj.nifty.com>'
 __status__ = 'experimental'
 
+import hashlib
 import os
 import sys
 import subprocess
+import tempfile
+import threading
+import time
+import urllib
+import zipfile
+from multiprocessing.pool import ThreadPool
+
+import asm_manip as am
+import unzip_jar
 
 JAVAP_COMMAND = "/usr/bin/javap"
+JAVAP_OPTIONS = ["-c", "-p", "-l", "-constants"]
 
 def classname_iter(classlist):
     with open(classlist, "rb") as f:
@@ -17,20 +28,249 @@ def classname_iter(classlist):
             classname = classname.replace('/', '.')
             yield classname
 
-def disassemble(classname, classpath=None):
+def jar_class_target_iter(jar_file, temp_files):
+    """
+    Iterate (classname, javap_argument) of each class in a jar file (including nested jars,
+    e.g. WEB-INF/lib/*.jar), where javap_argument is an URL of the class file in the jar.
+    The class files are not extracted; a nested jar is copied to a temporary jar file,
+    whose path is appended to temp_files (the caller should remove them).
+    """
+    for nested_entries, z, data in unzip_jar.walk_jar(jar_file):
+        if data is None:
+            jar_path = os.path.abspath(jar_file)
+        else:
+            fd, jar_path = tempfile.mkstemp(suffix=".jar")
+            temp_files.append(jar_path)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+        jar_url = "jar:file:%s!/" % urllib.pathname2url(jar_path)
+        for entry in sorted(z.namelist()):
+            class_name = unzip_jar.entry_to_class_name(entry)
+            if class_name is not None:
+                yield class_name.replace('/', '.'), jar_url + urllib.quote(entry)
+
+def to_target(classname):
+    """
+    Returns (classname, javap_argument) from an item of class names, 
+    which is a class name or already a tuple (classname, javap_argument).
+    """
+    if isinstance(classname, tuple):
+        return classname
+    return classname, classname
+
+class DisasmCache(object):
+    """
+    A persistent cache of disassembled texts, in a directory.
+    Each text is stored in a file named with SHA-1 of the javap options and the bytes of the class file,
+    so that a class file is not disassembled again unless it is changed
+    (also, identical class files contained in multiple jar files are disassembled only once).
+    """
+
+    def __init__(self, cache_dir, classpath=None):
+        self.cache_dir = cache_dir
+        self.classpath = classpath
+        self.hit_count = 0
+        self.miss_count = 0
+        self._lock = threading.Lock()
+        self._jars = {}
+        self._keys = {}
+
+    def close(self):
+        for z in self._jars.itervalues():
+            z.close()
+        self._jars.clear()
+
+    def _read_class_file(self, target):
+        classname, javap_arg = target
+        if javap_arg.startswith("jar:file:"):
+            jar_url, entry = javap_arg[len("jar:file:"):].split("!/", 1)
+            with self._lock:
+                z = self._jars.get(jar_url)
+                if z is None:
+                    z = self._jars[jar_url] = zipfile.ZipFile(urllib.url2pathname(jar_url))
+                return z.read(urllib.unquote(entry))
+        class_file = os.path.join(self.classpath or ".", *classname.split('.')) + ".class"
+        if not os.path.isfile(class_file):
+            return None  # e.g. a class in the runtime library
+        with open(class_file, "rb") as f:
+            return f.read()
+
+    def _cache_file(self, key):
+        return os.path.join(self.cache_dir, key[:2], key[2:] + ".asm")
+
+    def fetch(self, target):
+        """
+        Returns the cached text (utf-8 encoded) of a target (classname, javap_argument),
+        or None when the text is not cached.
+        """
+        data = self._read_class_file(target)
+        if data is not None:
+            key = hashlib.sha1(' '.join(JAVAP_OPTIONS) + '\0' + data).hexdigest()
+            cache_file = self._cache_file(key)
+            if os.path.exists(cache_file):
+                with open(cache_file, "rb") as f:
+                    text = f.read()
+                with self._lock:
+                    self.hit_count += 1
+                return text
+        with self._lock:
+            if data is not None:
+                self._keys[target] = key
+            self.miss_count += 1
+        return None
+
+    def store(self, target, text):
+        """
+        Stores the text (utf-8 encoded) to the cache, if the target was fetched and missed.
+        """
+        with self._lock:
+            key = self._keys.pop(target, None)
+        if key is None:
+            return
+        cache_file = self._cache_file(key)
+        d = os.path.dirname(cache_file)
+        if not os.path.isdir(d):
+            try:
+                os.makedirs(d)
+            except OSError:
+                if not os.path.isdir(d):
+                    raise
+        fd, temp_file = tempfile.mkstemp(suffix=".tmp", dir=d)
+        with os.fdopen(fd, "wb") as f:
+            f.write(text)
+        os.rename(temp_file, cache_file)
+
+def run_javap(classnames, classpath=None):
     cmd = [JAVAP_COMMAND]
     if classpath:
         cmd.extend(["-classpath", classpath])
-    cmd.extend(["-c", "-p", "-l", "-constants", classname])
+    cmd.extend(JAVAP_OPTIONS)
+    cmd.extend(classnames)
     text = subprocess.check_output(cmd)
     text = text.decode("utf-8")
     return text
 
+def disassemble(classname, classpath=None):
+    return run_javap([classname], classpath=classpath)
+
+def split_javap_output(text):
+    """
+    Split an output of javap for multiple classes into the texts of each class,
+    at the lines of 'Compiled from "..."'.
+    """
+    texts = []
+    buf = []
+    for L in text.splitlines(True):
+        if L.startswith('Compiled from "') and buf:
+            texts.append(''.join(buf))
+            buf = []
+        buf.append(L)
+    if buf:
+        texts.append(''.join(buf))
+    return texts
+
+def disassemble_batch(classnames, classpath=None):
+    """
+    Disassemble classes with a single javap process and return a list of texts of each class.
+    In case the output can not be split into the classes (e.g. some class file
+    does not have source-file information, or javap fails for some class),
+    each class is disassembled by a javap process of its own.
+    """
+    if len(classnames) == 1:
+        return [disassemble(classnames[0], classpath=classpath)]
+    try:
+        texts = split_javap_output(run_javap(classnames, classpath=classpath))
+    except subprocess.CalledProcessError:
+        texts = None
+    if texts is None or len(texts) != len(classnames) or \
+            not all(t.startswith('Compiled from "') for t in texts):
+        texts = [disassemble(cn, classpath=classpath) for cn in classnames]
+    return texts
+
+def write_asm(output, classname, text):
+    """
+    Writes a disassembled text (utf-8 encoded) to output, 
+    which is a directory or an asm_manip.AsmPackWriter.
+    """
+    if isinstance(output, am.AsmPackWriter):
+        output.write(classname, text)
+    else:
+        with open(os.path.join(output, classname + ".asm"), "wb") as outp:
+            outp.write(text)
+
+def disassemble_to_files(classnames, outputdir, classpath=None, cache=None):
+    targets = [to_target(cn) for cn in classnames]
+    misses = []
+    for target in targets:
+        text = cache.fetch(target) if cache is not None else None
+        if text is not None:
+            write_asm(outputdir, target[0], text)
+        else:
+            misses.append(target)
+    if misses:
+        texts = disassemble_batch([javap_arg for _, javap_arg in misses], classpath=classpath)
+        for target, text in zip(misses, texts):
+            text = text.encode("utf-8")
+            write_asm(outputdir, target[0], text)
+            if cache is not None:
+                cache.store(target, text)
+    return [classname for classname, _ in targets]
+
+def batch_iter(it, batch_size):
+    batch = []
+    for item in it:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def disassemble_to_files_iter(classnames, outputdir, classpath=None, jobs=1, batch_size=1, cache=None):
+    """
+    Disassemble classes and write each result to an .asm file in outputdir
+    (or to a packed asm file, when outputdir is an asm_manip.AsmPackWriter).
+    Each item of classnames is a class name, or a tuple (classname, javap_argument),
+    e.g. a class in a jar file given as an URL (see jar_class_target_iter).
+    When a DisasmCache is given as cache, cached texts are used instead of running javap.
+    Each javap process disassembles up to 'batch_size' classes, 
+    and up to 'jobs' javap processes are kept running at the same time.
+    Yields the name of each class as its .asm file is written (in order of completion when jobs > 1).
+    """
+    batches = batch_iter(classnames, max(1, batch_size))
+    if jobs <= 1:
+        for batch in batches:
+            for classname in disassemble_to_files(batch, outputdir, classpath=classpath, cache=cache):
+                yield classname
+        return
+
+    def disasm(batch):
+        return disassemble_to_files(batch, outputdir, classpath=classpath, cache=cache)
+
+    pool = ThreadPool(jobs)
+    try:
+        for batch in pool.imap_unordered(disasm, batches):
+            for classname in batch:
+                yield classname
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
 def main(argv):
     from argparse import ArgumentParser
     psr = ArgumentParser(description="Disassemble java class(s)")
     psr.add_argument('class_list', nargs='*', action='store')
-    psr.add_argument('-o', '--output-dir', action='store', required=True)
+    grp = psr.add_mutually_exclusive_group(required=True)
+    grp.add_argument('-o', '--output-dir', action='store')
+    grp.add_argument('--pack', action='store',
+            help='write the disassembled texts to a packed asm file (and its index file PACK.idx) in place of a directory. appended when the file exists.')
+    psr.add_argument('-j', '--jobs', action='store', type=int, default=1,
+            help='number of javap processes run in parallel. (default is 1.)')
+    psr.add_argument('-b', '--batch-size', action='store', type=int, default=1,
+            help='number of classes disassembled by a javap process. (default is 1.)')
+    psr.add_argument('--cache-dir', action='store',
+            help='directory of cache of disassembled texts, which are reused for unchanged class files.')
     grp = psr.add_mutually_exclusive_group(required=False)
     grp.add_argument('--classpath', action='store')
     grp.add_argument('--jar', action='store')
@@ -40,19 +280,17 @@ def main(argv):
     classlist = args.class_list
     classpath = args.classpath
     classnames = []
+    temp_files = []
 
-    if not os.path.isdir(outputdir):
+    if args.pack:
+        outputdir = am.AsmPackWriter(args.pack)
+    elif not os.path.isdir(outputdir):
         if os.path.exists(outputdir):
             sys.exit("output directory already exists: %s" % outputdir)
         os.mkdir(outputdir)
     
     if args.jar:
-        sys.stderr.write('> extracting files form jar file\n')
-        import unzip_jar
-        dest_dir = unzip_jar.gen_dest_dir_name(args.jar)
-        classlist.append(os.path.join(dest_dir, "class_list"))
-        classpath = dest_dir
-        unzip_jar.main(["unzip_jar.py", args.jar])
+        classnames = jar_class_target_iter(args.jar, temp_files)
     elif classpath:
         if not classlist:
             class_ext = u".class"
@@ -79,12 +317,31 @@ def main(argv):
             for cn in classnames:
                 yield cn
 
+    cache = None
+    if args.cache_dir:
+        if not os.path.isdir(args.cache_dir):
+            os.makedirs(args.cache_dir)
+        cache = DisasmCache(args.cache_dir, classpath=classpath)
+
     sys.stderr.write('> disassembling class files\n')
-    for classname in classname_it():
-        text = disassemble(classname, classpath=classpath)
-        outputfile = os.path.join(outputdir, classname + ".asm")
-        with open(outputfile, "wb") as outp:
-            outp.write(text.encode("utf-8"))
+    start_time = time.time()
+    count = 0
+    try:
+        for classname in disassemble_to_files_iter(classname_it(), outputdir, classpath=classpath, 
+                jobs=args.jobs, batch_size=args.batch_size, cache=cache):
+            count += 1
+    finally:
+        if args.pack:
+            outputdir.close()
+        if cache is not None:
+            cache.close()
+        for f in temp_files:
+            os.remove(f)
+    elapsed = max(time.time() - start_time, 1e-6)
+    sys.stderr.write('> disassembled %d classes in %.1f seconds (%.1f classes/sec)\n' % \
+            (count, elapsed, count / elapsed))
+    if cache is not None:
+        sys.stderr.write('> cache: %d hits, %d misses\n' % (cache.hit_count, cache.miss_count))
 
 if __name__ == '__main__':
     main(sys.argv)
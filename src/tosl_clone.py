@@ -5,11 +5,15 @@ __author__ = 'Toshihiro Kamiya <kamiya@mbj.nifty.com>'
 __status__ = 'experimental'
 
 from bisect import bisect_right
+import multiprocessing
 import re
 import os
 import sys
 
+from _utilities import stdout_to
+
 import asm_manip as am
+import classfile_manip as cfm
 import clonefile_manip as cm
 
 def scan_linumber_table(text):
@@ -101,9 +105,19 @@ def gen_argpsr():
     from argparse import ArgumentParser
     from _version_data import VERSION
     psr = ArgumentParser(description='(Re)format clone positions in line numbers.')
-    psr.add_argument('-a', '--asm-directory', action='store', required=True)
+    grp = psr.add_mutually_exclusive_group(required=True)
+    grp.add_argument('-a', '--asm-directory', action='store',
+            help='directory of disassembled files, or a packed asm file made by run_disasm.py --pack')
+    grp.add_argument('--classes', action='store',
+            help='directory containing class files, or a jar file. the class files are read directly in place of disassembled files')
     psr.add_argument('clone_file', action='store',
             help="clone-index file (generated by det_clone.py) or clone-trace file (generated by exp_clone.py). specify '-' to read from stdin")
+    psr.add_argument('--asm-cache-dir', action='store',
+            help='directory to cache parsed disassembled files, which are reused while the files are unchanged')
+    psr.add_argument('-j', '--jobs', action='store', type=int, default=1,
+            help='number of worker processes parsing disassembled files. =0 means the number of CPUs. (default is 1.)')
+    psr.add_argument('-o', '--output', action='store',
+            help="output file. compressed when the extension is .gz, .bz2 or .xz. (default is stdout.)")
     psr.add_argument('--version', action='version', version='%(prog)s ' + VERSION)
     return psr
 
@@ -116,15 +130,30 @@ def to_pseudo_source_file_name(claz):
 def main(argv):
     psr = gen_argpsr()
     args = psr.parse_args(argv[1:])
- 
-    if not os.path.isdir(args.asm_directory):
-        sys.exit("error: fail to access asmdir: %s" % args.asm_directory)
+    with stdout_to(args.output):
+        run(args)
+
+def run(args):
+    if args.classes is not None:
+        if not os.path.exists(args.classes):
+            sys.exit("error: fail to access classes: %s" % args.classes)
+        info_it = cfm.get_class_info_iter(args.classes)
+    else:
+        if not (os.path.isdir(args.asm_directory) or am.is_asm_pack(args.asm_directory)):
+            sys.exit("error: fail to access asmdir: %s" % args.asm_directory)
+        jobs = args.jobs if args.jobs > 0 else multiprocessing.cpu_count()
+        info_it = am.get_asm_info_iter(args.asm_directory, jobs=jobs, cache_dir=args.asm_cache_dir)
  
     sig2filename_linenumber_table = {}
-    for typ, values in am.get_asm_info_iter(args.asm_directory):
+    for typ, values in info_it:
         if typ == am.METHOD_CODE:
             claz_sig, code, etbl, ltbl = values
             sig2filename_linenumber_table["%s.%s" % claz_sig] = (to_pseudo_source_file_name(claz_sig[0]), scan_linumber_table(ltbl))
+        elif typ == am.METHOD_OPE_LIST:
+            claz_sig, ope_list, etbl, ltbl = values
+            lineseq = [linenum for linenum, index in ltbl]
+            indexseq = [index for linenum, index in ltbl]
+            sig2filename_linenumber_table["%s.%s" % claz_sig] = (to_pseudo_source_file_name(claz_sig[0]), (lineseq, indexseq))
  
     for L in format_clone_iter(args.clone_file, sig2filename_linenumber_table):
         sys.stdout.write(('%s\n' % L).encode('utf-8'))
@@ -11,6 +11,8 @@ _value_type_table = { 'boolean': 'Z', 'byte': 'B', 'char': 'C',
         'short': 'S', 'int': 'I', 'long': 'J', 'float': 'F', 'double': 'D',
         'void': 'V' }
 
+_format_type_cache = {}
+
 def format_type(typ):
     """
     Format type with Javap's comment style.
@@ -21,6 +23,12 @@ def format_type(typ):
     'I'
     """
 
+    s = _format_type_cache.get(typ)
+    if s is None:
+        s = _format_type_cache[typ] = _format_type(typ)
+    return s
+
+def _format_type(typ):
     if not typ:
         print "typ=", typ
     assert typ # is not None and != ''
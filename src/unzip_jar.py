@@ -5,22 +5,72 @@ __author__ = 'Toshihiro Kamiya <kamiya@mbj.nifty.com>'
 __status__ = 'experimental'
 
 import os.path
-import re
 import sys
 import subprocess
+import zipfile
+from cStringIO import StringIO
 
 UNIZP_COMMAND = "/usr/bin/unzip"
 
+# directories of class files in a war file or a (spring-boot) fat jar
+CLASS_DIR_PREFIXES = ("WEB-INF/classes/", "BOOT-INF/classes/")
+NESTED_JAR_EXTS = (".jar", ".war")
+
 def get_class_names_from_jar(jar_file):
-    class_names = []
-    pat = re.compile(r"^\s*testing:\s*(.+)[.]class\s+OK\s*$")
-    text = subprocess.check_output([UNIZP_COMMAND, "-t", jar_file])
-    for L in text.split('\n'):
-        L = L.rstrip()
-        m = pat.match(L)
-        if m:
-            class_names.append(m.group(1))
-    return class_names
+    with zipfile.ZipFile(jar_file) as z:
+        return [entry[:-len(".class")] for entry in z.namelist() if entry.endswith(".class")]
+
+def entry_to_class_name(entry):
+    """
+    Returns class name (such as 'org/myapp/MyClass') of a class-file entry of a jar file,
+    or None when the entry is not a class file of a class.
+
+    >>> entry_to_class_name('WEB-INF/classes/org/myapp/MyClass.class')
+    'org/myapp/MyClass'
+    """
+
+    if not entry.endswith(".class") or entry.startswith("META-INF/"):
+        return None
+    name = entry[:-len(".class")]
+    if name.endswith("module-info") or name.endswith("package-info"):
+        return None
+    for prefix in CLASS_DIR_PREFIXES:
+        if name.startswith(prefix):
+            return name[len(prefix):]
+    return name
+
+def walk_jar(jar_file):
+    """
+    Iterate a jar file and the jar files nested in it (e.g. WEB-INF/lib/*.jar), recursively.
+    Yielded values are tuple (nested_entries, zip, data), where
+    nested_entries is a tuple of the entry names of the nested jar files (empty for jar_file itself),
+    zip is a zipfile.ZipFile object, and data is content of the nested jar (None for jar_file itself).
+    The nested jar files are read on memory, without being extracted to files.
+    """
+
+    def walk(nested_entries, z, data):
+        yield nested_entries, z, data
+        for entry in sorted(z.namelist()):
+            if entry.endswith(NESTED_JAR_EXTS):
+                inner_data = z.read(entry)
+                with zipfile.ZipFile(StringIO(inner_data)) as inner_z:
+                    for v in walk(nested_entries + (entry,), inner_z, inner_data):
+                        yield v
+
+    with zipfile.ZipFile(jar_file) as z:
+        for v in walk((), z, None):
+            yield v
+
+def class_entry_iter(jar_file):
+    """
+    Iterate class files in a jar file, including the ones in nested jar files.
+    Yielded values are tuple (nested_entries, entry, class_name, data).
+    """
+    for nested_entries, z, _ in walk_jar(jar_file):
+        for entry in sorted(z.namelist()):
+            class_name = entry_to_class_name(entry)
+            if class_name is not None:
+                yield nested_entries, entry, class_name, z.read(entry)
 
 def gen_dest_dir_name(jar_file):
     return jar_file + ".files"
@@ -2,13 +2,18 @@
 
 import unittest
 
+import os
+import shutil
 import sys
+import tempfile
 
 import os.path as p
 sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'src'))
 
 import asm_manip as am
 
+SAMPLE_DIR = p.join(p.dirname(p.abspath(__file__)), "samplecode")
+
 B_asm = """
 Compiled from "Inheritance.java"
 class B extends A {
@@ -62,15 +67,34 @@ class TestAsmManip(unittest.TestCase):
                 elif claz_sig == claz_method_sigs[1]:
                     self.assertSequenceEqual(body_lines, B_calling_foo_body)
             elif typ == am.INHERITANCE:
-                claz, imps, exts = values
+                claz, exts, imps = values
                 self.assertEqual(claz, 'B')
-                self.assertSequenceEqual(imps, ('A',))
-                self.assertSequenceEqual(exts, ())
+                self.assertSequenceEqual(exts, ('A',))
+                self.assertSequenceEqual(imps, ())
             elif typ == am.COMPILED_FROM:
                 self.assertEqual(values, "Inheritance.java")
             else:
                 assert False
     
+    def testSplitIntoMethodIterWithGenericsAndFields(self):
+        lines = """
+Compiled from "G.java"
+public class G<T extends java.lang.Object> extends java.util.ArrayList<T> implements java.lang.Comparable<G<T>> {
+  java.util.Map<java.lang.String, T> table;
+  static final int SIZE;
+  public <E extends java.lang.Object> java.util.List<E> copy(java.util.List<E>, int);
+    Code:
+       0: aconst_null   
+       1: areturn       
+}
+"""[1:-1].split('\n')
+        records = list(am.split_into_method_iter('G.asm', lines))
+        self.assertSequenceEqual(records, [
+            (am.COMPILED_FROM, 'G.java'),
+            (am.INHERITANCE, ('G', ('java.util.ArrayList',), ('java.lang.Comparable',))),
+            (am.METHOD_CODE, (('G', 'copy:(Ljava/util/List;I)Ljava/util/List;'), lines[5:8])),
+        ])
+
     def testSplitMethodBodyToCodeAndTables(self):
         code, exception_table, linenum_table = am.split_method_body_to_code_and_tables(B_init_body)
         self.assertSequenceEqual(code, [
@@ -94,6 +118,64 @@ class TestAsmManip(unittest.TestCase):
         act = am.remove_generics_args(s)
         self.assertEqual(act, "public class j.ffi.Struct$Enum extends j.ffi.Struct$Enum32 {")
 
+    def testParallelAsmInfoIter(self):
+        seq_records = list(am.get_asm_info_iter(SAMPLE_DIR))
+        self.assertTrue(seq_records)
+        self.assertEqual(list(am.get_asm_info_iter(SAMPLE_DIR, jobs=2)), seq_records)
+        self.assertEqual(list(am.parallel_asm_info_iter(SAMPLE_DIR, 2, prefetch_per_job=1)), seq_records)
+
+    def testAsmInfoIterWithCache(self):
+        expected = []
+        for typ, values in am.get_asm_info_iter(SAMPLE_DIR):
+            if typ == am.METHOD_CODE:
+                typ, values = am.METHOD_OPE_LIST, am.method_code_to_ope_list(values)
+            expected.append((typ, values))
+
+        tempdir = tempfile.mkdtemp()
+        try:
+            asm_dir = p.join(tempdir, "asm")
+            cache_dir = p.join(tempdir, "cache")
+            shutil.copytree(SAMPLE_DIR, asm_dir, ignore=shutil.ignore_patterns('reference_data'))
+            expected = [(typ, values.replace(SAMPLE_DIR, asm_dir) if typ == am.ASM_FILE else values) for typ, values in expected]
+
+            self.assertEqual(list(am.get_asm_info_iter(asm_dir, cache_dir=cache_dir)), expected)
+            cache_files = os.listdir(cache_dir)
+            self.assertEqual(len(cache_files), len(list(am.asm_file_iter(asm_dir))))
+            self.assertEqual(list(am.get_asm_info_iter(asm_dir, cache_dir=cache_dir)), expected)
+            self.assertEqual(list(am.get_asm_info_iter(asm_dir, jobs=2, cache_dir=cache_dir)), expected)
+
+            # a changed file is parsed again
+            asmfile = list(am.asm_file_iter(asm_dir))[0]
+            with open(asmfile, "rb") as f:
+                text = f.read()
+            with open(asmfile, "wb") as f:
+                f.write(text.replace('Compiled from "', 'Compiled from "Changed'))
+            records = list(am.get_asm_info_iter(asm_dir, cache_dir=cache_dir))
+            self.assertTrue(any(typ == am.COMPILED_FROM and values.startswith("Changed") for typ, values in records))
+            self.assertEqual(os.listdir(cache_dir), cache_files)
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testAsmPack(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            pack_file = p.join(tempdir, "samplecode.pack")
+            writer = am.AsmPackWriter(pack_file)
+            for asmfile in reversed(list(am.asm_file_iter(SAMPLE_DIR))):
+                with open(asmfile, "rb") as f:
+                    writer.write(p.basename(asmfile)[:-len(".asm")], f.read())
+            writer.close()
+
+            def strip_asm_file_names(records):
+                return [(typ, None if typ == am.ASM_FILE else values) for typ, values in records]
+            dir_records = list(am.get_asm_info_iter(SAMPLE_DIR))
+            pack_records = list(am.get_asm_info_iter(pack_file))
+            self.assertEqual(strip_asm_file_names(pack_records), strip_asm_file_names(dir_records))
+            self.assertTrue(pack_records[0][1].startswith(pack_file + "!/"))
+            self.assertEqual(list(am.get_asm_info_iter(pack_file, jobs=2)), pack_records)
+        finally:
+            shutil.rmtree(tempdir)
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
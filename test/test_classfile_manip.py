@@ -0,0 +1,142 @@
+#coding: utf-8
+
+import unittest
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import zipfile
+
+import os.path as p
+sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'src'))
+
+import asm_manip as am
+import classfile_manip as cfm
+import ope_manip as om
+
+DATA_DIR = p.join(p.dirname(p.abspath(__file__)), "deligatingsample")
+
+def read_records(info_it):
+    sig2ope_list_and_linenums = {}
+    other_records = []
+    for typ, values in info_it:
+        if typ == am.METHOD_CODE:
+            claz_sig, code, etbl, ltbl = values
+            ope_list = om.body_text_to_ope_list(code, claz_sig)
+            linenums = [tuple(int(f) for f in L.replace('line', '').split(':')) for L in ltbl]
+            sig2ope_list_and_linenums[claz_sig] = ope_list, linenums
+        elif typ == am.METHOD_OPE_LIST:
+            claz_sig, ope_list, etbl, ltbl = values
+            sig2ope_list_and_linenums[claz_sig] = ope_list, ltbl
+        elif typ in (am.INHERITANCE, am.COMPILED_FROM):
+            other_records.append((typ, values))
+    return sig2ope_list_and_linenums, other_records
+
+def strip_operands(ope_list):
+    # opecodes and the references in invoke instructions are compared
+    r = []
+    for ope in ope_list:
+        if ope is None:
+            r.append(None)
+        else:
+            opecode, operands, comment = ope
+            if opecode.startswith('invoke'):
+                r.append((opecode, comment.split()))
+            else:
+                r.append((opecode, None))
+    return r
+
+def make_class_file(claz, super_claz, interfaces, access_flags=0x0021):
+    # a class file without fields, methods and attributes
+    cp = []
+    def class_entry(name):
+        cp.append(struct.pack('>BH', 1, len(name)) + name)
+        cp.append(struct.pack('>BH', 7, len(cp)))
+        return len(cp)
+    this_index = class_entry(claz)
+    super_index = class_entry(super_claz) if super_claz else 0
+    interface_indices = [class_entry(i) for i in interfaces]
+    return struct.pack('>IHHH', 0xCAFEBABE, 0, 50, len(cp) + 1) + ''.join(cp) + \
+            struct.pack('>HHHH', access_flags, this_index, super_index, len(interface_indices)) + \
+            struct.pack('>%dH' % len(interface_indices), *interface_indices) + struct.pack('>HHH', 0, 0, 0)
+
+class TestClassfileManip(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def assertSameRecordsAsAsm(self, class_info_it):
+        asm_s2ol, asm_others = read_records(am.get_asm_info_iter(DATA_DIR))
+        cls_s2ol, cls_others = read_records(class_info_it)
+        self.assertEqual(sorted(cls_s2ol.iterkeys()), sorted(asm_s2ol.iterkeys()))
+        for claz_sig, (asm_ol, asm_linenums) in asm_s2ol.iteritems():
+            cls_ol, cls_linenums = cls_s2ol[claz_sig]
+            self.assertEqual(strip_operands(cls_ol), strip_operands(asm_ol))
+            self.assertEqual(cls_linenums, asm_linenums)
+        self.assertEqual(cls_others, asm_others)
+
+    def testClassFilesInDirectory(self):
+        self.assertSameRecordsAsAsm(cfm.get_class_info_iter(DATA_DIR))
+
+    def testClassFilesInJar(self):
+        jar_file = p.join(self.tempdir, "sample.jar")
+        with zipfile.ZipFile(jar_file, "w") as z:
+            for f in sorted(os.listdir(DATA_DIR)):
+                if f.endswith(".class"):
+                    z.write(p.join(DATA_DIR, f), f)
+        self.assertSameRecordsAsAsm(cfm.get_class_info_iter(jar_file))
+
+    def testClassFilesInNestedJar(self):
+        inner_jar = p.join(self.tempdir, "inner.jar")
+        with zipfile.ZipFile(inner_jar, "w") as z:
+            for f in sorted(os.listdir(DATA_DIR)):
+                if f.endswith(".class"):
+                    z.write(p.join(DATA_DIR, f), f)
+        war_file = p.join(self.tempdir, "sample.war")
+        with zipfile.ZipFile(war_file, "w") as z:
+            z.writestr("META-INF/MANIFEST.MF", "Manifest-Version: 1.0\n")
+            z.write(inner_jar, "WEB-INF/lib/inner.jar")
+        names = [name for name, _ in cfm.class_file_data_iter(war_file)]
+        self.assertTrue(names)
+        for name in names:
+            self.assertTrue(name.startswith(war_file + "!/WEB-INF/lib/inner.jar!/"))
+        self.assertSameRecordsAsAsm(cfm.get_class_info_iter(war_file))
+
+    def testReceiverThisLoad(self):
+        with open(p.join(DATA_DIR, "B.class"), "rb") as f:
+            data = f.read()
+        for typ, values in cfm.split_into_method_iter(data):
+            if typ == am.METHOD_OPE_LIST and values[0] == ('B', 'boo:()V'):
+                ope_list = values[1]
+                self.assertEqual(ope_list[0], ('aload_0', (), None))
+                self.assertEqual(ope_list[4], ('invokevirtual', ('#5',), '// Method A.foo:()V'))
+
+    def testInheritance(self):
+        for claz, super_claz, interfaces, decl in [
+                ('p/A', 'java/lang/Object', [], 'public class p.A {'),
+                ('p/B', 'p/A', [], 'public class p.B extends p.A {'),
+                ('p/C', 'java/lang/Object', ['java/lang/Runnable'], 'public class p.C implements java.lang.Runnable {'),
+                ('p/D', 'java/lang/Object', ['java/lang/Runnable', 'p/I'], 'public class p.D implements java.lang.Runnable, p.I {'),
+                ('p/E', 'p/A', ['p/I'], 'public class p.E extends p.A implements p.I {'),
+                ('p/I', 'java/lang/Object', [], 'public interface p.I {'),
+                ('p/J', 'java/lang/Object', ['p/I', 'p/K'], 'public interface p.J extends p.I, p.K {')]:
+            access_flags = 0x0601 if ' interface ' in decl else 0x0021
+            asm_records = list(am.split_into_method_iter('X.asm', [decl, '}']))
+            records = list(cfm.split_into_method_iter(make_class_file(claz, super_claz, interfaces, access_flags)))
+            self.assertEqual(records, asm_records)
+            self.assertEqual(records[0][0], am.INHERITANCE)
+        self.assertEqual(records, [(am.INHERITANCE, ('p/J', (), ('p.I', 'p.K')))])
+
+    def testBrokenClassFile(self):
+        with open(p.join(DATA_DIR, "B.class"), "rb") as f:
+            data = f.read()
+        self.assertRaises(cfm.ClassFileFormatError, list, cfm.split_into_method_iter(data[:100]))
+        self.assertRaises(cfm.ClassFileFormatError, list, cfm.split_into_method_iter('not a class file'))
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -2,14 +2,18 @@
 
 import unittest
 
+import random
 import sys
 
 import os.path as p
 sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'src'))
 
+import asm_manip as am
 import gen_ngram as gn
 import precomp_manip as pm
 
+SAMPLE_DIR = p.join(p.dirname(p.abspath(__file__)), "samplecode")
+
 method_sig_and_precomp_cell_arrays = [
     ('"<init>":()V', [-1, 1, None, None],
         [
@@ -62,6 +66,25 @@ method_sig_and_precomp_cell_arrays = [
     ),
 ]
 
+def random_program(rnd, method_count, size):
+    methods = ['m%d:()I' % i for i in range(method_count)]
+    method2claz2precomp = {}
+    for m in methods:
+        ope_list = []
+        for index in range(size - 1):
+            r = rnd.random()
+            if r < 0.5:
+                ope_list.append(('invokestatic', ('#1',), '// Method A.%s' % rnd.choice(methods + ['x:()I', 'y:()I'])))
+            elif r < 0.7:
+                ope_list.append(('ifeq', (str(rnd.randrange(size)),), None))
+            elif r < 0.8:
+                ope_list.append(('goto', (str(rnd.randrange(size)),), None))
+            else:
+                ope_list.append(('iload_1', (), None))
+        ope_list.append(('ireturn', (), None))
+        method2claz2precomp[m] = {'A': pm.precompile_code('A', ope_list, pm.ClazMethodTables({}, {}, lambda c, m: False))}
+    return method2claz2precomp
+
 class TestGenNgram(unittest.TestCase):
     def testGenNgram(self):
         asmfile = "ShowWeekday.Rasm"
@@ -93,6 +116,69 @@ class TestGenNgram(unittest.TestCase):
                 else:
                     self.assertTrue(len(code_ngrams) == 0)
 
+    def testPrecompileMethodsWithJobs(self):
+        sig2oplist, claz2deriving = gn.read_sig2oplist_and_claz2deriving(am.get_asm_info_iter(SAMPLE_DIR))
+        method2claz2code = gn.make_method2claz2code(sig2oplist)
+        claz_method_tables = pm.ClazMethodTables(gn.make_claz2methods(method2claz2code), claz2deriving, 
+                gn.is_untracked_method_call)
+        def states(method2claz2precomp):
+            return dict((method, dict((claz, precomp.__getstate__()) for claz, precomp in c2p.iteritems())) \
+                    for method, c2p in method2claz2precomp.iteritems())
+        serial = gn.precompile_methods(method2claz2code, claz_method_tables, remove_repetition=True)
+        parallel = gn.precompile_methods(method2claz2code, claz_method_tables, remove_repetition=True, jobs=2)
+        self.assertTrue(serial)
+        self.assertEqual(states(parallel), states(serial))
+
+    def assertSameNgramsRandomized(self, seed, ref_options):
+        # n-grams of random programs are the same as the ones generated with ref_options, 
+        # which turn an optimization off
+        rnd = random.Random(seed)
+        for _ in range(30):
+            method2claz2precomp = random_program(rnd, 4, rnd.choice([8, 12, 20]))
+            for method in sorted(method2claz2precomp.iterkeys()):
+                for ngram_size, max_call_depth, allow_repetitive_ngram in ((3, 4, False), (4, -2, False), (3, 4, True)):
+                    options = dict(max_call_depth=max_call_depth, allow_repetitive_ngram=allow_repetitive_ngram)
+                    ref_text = gn.format_ngrams(gn.gen_code_ngrams('A', method, method2claz2precomp, ngram_size,
+                            **dict(options, **ref_options)))
+                    text = gn.format_ngrams(gn.gen_code_ngrams('A', method, method2claz2precomp, ngram_size, **options))
+                    self.assertEqual(text, ref_text)
+
+    def testSeenStatePruningRandomized(self):
+        self.assertSameNgramsRandomized(2, dict(prune_seen_states=False))
+
+    def testSuperblocksRandomized(self):
+        self.assertSameNgramsRandomized(4, dict(use_superblocks=False))
+
+    def testStackFrame(self):
+        f0 = gn.StackFrame(('A', 'm:()V'), 3, None)
+        f1 = gn.StackFrame(('B', 'n:()V'), 5, f0)
+        self.assertIs(gn.StackFrame(('A', 'm:()V'), 3, None), f0)
+        self.assertIs(gn.StackFrame(('B', 'n:()V'), 5, gn.StackFrame(('A', 'm:()V'), 3, None)), f1)
+        self.assertIs(f1.copy(), f1)
+        self.assertEqual(f1.depth, 1)
+        self.assertTrue(gn.CodeNgramGenerator.is_recursion(('C', 'm:()V'), f1))
+        self.assertFalse(gn.CodeNgramGenerator.is_recursion(('A', 'o:()V'), f1))
+        self.assertFalse(gn.CodeNgramGenerator.is_recursion(('A', 'm:()V'), None))
+        f2 = gn.StackFrame(('B', 'n:()V'), 5, gn.StackFrame(('A', 'm:()V'), 4, None))
+        self.assertNotEqual(f1, f2)
+        self.assertEqual(sorted([f2, f1, f0]), [f0, f1, f2])
+
+    def testDeepCallChain(self):
+        # each method calls the next one, which is expanded deeper than the recursion limit of Python
+        chain_length = sys.getrecursionlimit() + 100
+        claz_method_tables = pm.ClazMethodTables({}, {}, lambda c, m: False)
+        method2claz2precomp = {}
+        for i in range(chain_length):
+            ope_list = [('invokestatic', ('#1',), '// Method A.log:()V')]
+            if i + 1 < chain_length:
+                ope_list.append(('invokestatic', ('#1',), '// Method A.m%d:()V' % (i + 1)))
+            ope_list.append(('invokestatic', ('#1',), '// Method A.x%d:()V' % i))
+            ope_list.append(('return', (), None))
+            method2claz2precomp['m%d:()V' % i] = {'A': pm.precompile_code('A', ope_list, claz_method_tables)}
+        found_ngrams = gn.gen_code_ngrams('A', 'm0:()V', method2claz2precomp, 3, max_call_depth=chain_length)
+        ngrams = set(tuple(s for s, _, _ in ngram) for ngrams in gn.to_ngram_tuples_iter(found_ngrams) for ngram in ngrams)
+        self.assertIn(('A.log:()V', 'A.x%d:()V' % (chain_length - 1), 'A.x%d:()V' % (chain_length - 2)), ngrams)
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
\ No newline at end of file
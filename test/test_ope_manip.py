@@ -202,6 +202,25 @@ class TestOpeManip(unittest.TestCase):
         formatted_seq = [re.sub(r'\s+', ' ', L.rstrip()) for L in lines]
         self.assertSequenceEqual(formatted_seq, original_seq)
 
+    def testOpeList(self):
+        for body in [body_if_branch, body_for_loop, body_table_switch, body_lookup_switch]:
+            ope_list = om.body_text_to_ope_list(body)
+            compact = om.OpeList(ope_list)
+            self.assertEqual(len(compact), len(ope_list))
+            self.assertEqual(list(compact), ope_list)
+            self.assertEqual(compact, ope_list)
+            for index in range(-len(ope_list), len(ope_list)):
+                self.assertEqual(compact[index], ope_list[index])
+            self.assertEqual(compact[3:20], ope_list[3:20])
+            self.assertEqual(list(compact.ope_iter()), [(i, ope) for i, ope in enumerate(ope_list) if ope is not None])
+            self.assertRaises(IndexError, compact.__getitem__, len(ope_list))
+            self.assertEqual(om.format_ope_list(compact), om.format_ope_list(ope_list))
+            om.verify_branch_ope(compact)
+
+        compact = om.OpeList([('if_icmpge', ('1',), None), None])
+        with self.assertRaises(om.InvalidOpe):
+            om.verify_branch_ope(compact)
+
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
@@ -1,11 +1,127 @@
 import unittest
 
+import random
 import sys
 
 import os.path as p
 sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'src'))
 
 import precomp_manip as pm
+from _utilities import sort_uniq
+
+def reference_claz2indirect_deriving(claz2deriving):
+    # recursive version, which expects an acyclic hierarchy
+    claz2indd = {}
+    def add(cindd, d):
+        cindd.add(d)
+        for dd in claz2deriving.get(d, ()):
+            add(cindd, dd)
+    for c, ds in claz2deriving.iteritems():
+        for d in ds:
+            add(claz2indd.setdefault(c, set()), d)
+    return claz2indd
+
+def random_claz_hierarchy(rnd, size):
+    clazs = ['C%d' % i for i in range(size)]
+    claz2deriving = {}
+    for i, c in enumerate(clazs):
+        if i > 0:
+            for _ in range(rnd.choice([1, 1, 1, 2, 3])):  # classes and interfaces
+                claz2deriving.setdefault(rnd.choice(clazs[:i]), []).append(c)
+    methods = ['m%d' % i for i in range(8)]
+    claz2methods = dict((c, rnd.sample(methods, rnd.randint(0, 4))) for c in clazs if rnd.random() < 0.8)
+    return claz2deriving, claz2methods
+
+def random_cell_array(rnd, size):
+    ope_list = []
+    for index in range(size - 1):
+        r = rnd.random()
+        if r < 0.3:
+            ope_list.append(('invokestatic', ('#1',), '// Method A.m%d:()V' % rnd.randrange(2)))
+        elif r < 0.55:
+            ope_list.append(('ifeq', (str(rnd.randrange(size)),), None))
+        elif r < 0.75:
+            ope_list.append(('goto', (str(rnd.randrange(size)),), None))
+        elif r < 0.85:
+            dests = [rnd.randrange(size) for _ in range(3)]
+            ope_list.append(('lookupswitch', tuple((str(v), str(d)) for v, d in enumerate(dests)), None))
+        else:
+            ope_list.append(('iload_1', (), None))
+    ope_list.append(('return', (), None))
+    return pm.precompile_ope_list_to_cell_array('A', ope_list, pm.ClazMethodTables({}, {}, lambda c, m: False))
+
+def reference_optmize_gotos_in_cell_array(cells, entrance_cell):
+    # rescans all cells until no branchs cell collapses
+    def next_valid_cell_index(index):
+        for i in range(index, len(cells)):
+            if cells[i][2] is not None:
+                return i
+        assert False
+
+    def get_final_dest_index(dest_index):
+        dest_indices = set()
+        while True:
+            dest_cell = cells[dest_index]
+            if dest_cell[2] is None:
+                dest_index = next_valid_cell_index(dest_index)
+                dest_cell = cells[dest_index]
+            dest_indices.add(dest_index)
+            if dest_cell[2] == pm.GOTO:
+                dest_index = next_valid_cell_index(dest_cell[3])
+                if dest_index in dest_indices:
+                    return sorted(dest_indices)[-1]
+                dest_indices.add(dest_index)
+            else:
+                return dest_index
+
+    collapsed_branchs_cell_exists = True
+    while collapsed_branchs_cell_exists:
+        collapsed_branchs_cell_exists = False
+        for cell in cells:
+            if cell[1] is not None:
+                cell[1] = get_final_dest_index(cell[1])
+            if cell[2] == pm.GOTO:
+                cell[3] = get_final_dest_index(cell[3])
+            elif cell[2] == pm.BRANCHS:
+                dis = [get_final_dest_index(di) for di in cell[3]]
+                cell[3] = sort_uniq([di for di in dis if di != cell[0] + 1])
+                if not cell[3] or cell[3] == [cell[1]]:
+                    cell[:] = [cell[0], cell[1], pm.GOTO, cell[1]]
+                    collapsed_branchs_cell_exists = True
+    entrance_cell[1] = get_final_dest_index(entrance_cell[1])
+
+def reference_merge_branches_and_remove_repetitions(cells, entrance_cell):
+    # redirects edges by scanning all cells
+    for cell in cells:
+        if cell[2] != pm.BRANCHS:
+            continue
+        cell[3] = sort_uniq(cell[3])
+        next_index = cell[1]
+        done_cell_indices = set([cell[0]])
+        while next_index is not None and next_index not in done_cell_indices:
+            done_cell_indices.add(next_index)
+            next_cell = cells[next_index]
+            if next_cell[2] != pm.BRANCHS:
+                break
+            cell[3] = sort_uniq([index for index in cell[3] + next_cell[3] if index != next_index])
+            pm.overwrite_goto_and_branch_to_cell(cells, entrance_cell, next_index, next_cell[1])
+            next_index = next_cell[1]
+    for cell in cells:
+        if cell[2] != pm.INVOKE:
+            continue
+        next_index = cell[1]
+        done_cell_indices = set([cell[0]])
+        while next_index is not None and next_index not in done_cell_indices:
+            done_cell_indices.add(next_index)
+            next_cell = cells[next_index]
+            if next_cell[2] != pm.INVOKE:
+                break
+            if next_cell[3] == cell[3]:
+                pm.overwrite_goto_and_branch_to_cell(cells, entrance_cell, next_index, next_cell[1])
+            next_index = next_cell[1]
+
+def copy_cells(cells, entrance_cell):
+    return [[c[0], c[1], c[2], c[3][:] if isinstance(c[3], list) else c[3]] for c in cells], entrance_cell[:]
 
 class PrecompManipTest(unittest.TestCase):
     def testClaz2IndirectDeriving(self):
@@ -25,6 +141,29 @@ class PrecompManipTest(unittest.TestCase):
         self.assertEqual(sorted(claz2modins.get('ACD')), ['n'])
         self.assertEqual(sorted(claz2modins.get('E')), ['p'])
 
+    def testClaz2IndirectDerivingDeepAndCyclic(self):
+        claz2deriving = dict(('C%d' % i, ['C%d' % (i + 1)]) for i in range(1500))
+        c2indd = pm.claz2indirect_deriving(claz2deriving)
+        self.assertEqual(len(c2indd['C0']), 1500)
+        self.assertEqual(c2indd['C1499'], set(['C1500']))
+
+        claz2deriving = {'A': ['B'], 'B': ['C', 'D'], 'C': ['B'], 'E': ['E']}
+        c2indd = pm.claz2indirect_deriving(claz2deriving)
+        self.assertEqual(sorted(c2indd.get('A')), ['B', 'C', 'D'])
+        self.assertEqual(sorted(c2indd.get('B')), ['C', 'D'])
+        self.assertEqual(sorted(c2indd.get('C')), ['B', 'D'])
+        self.assertEqual(c2indd.get('E'), set())
+
+    def testClazHierarchyClosureRandomized(self):
+        rnd = random.Random(3)
+        for _ in range(100):
+            claz2deriving, claz2methods = random_claz_hierarchy(rnd, rnd.randint(1, 60))
+            ref_c2indd = reference_claz2indirect_deriving(claz2deriving)
+            self.assertEqual(pm.claz2indirect_deriving(claz2deriving), ref_c2indd)
+            ref_claz2modins = pm.claz2methods_defined_in_the_class_but_not_in_its_derivings(claz2methods, ref_c2indd)
+            claz2modins = pm.claz2methods_defined_in_the_class_but_not_in_its_derivings_w_closure(claz2methods, claz2deriving)
+            self.assertEqual(claz2modins, ref_claz2modins)
+
     def testGetBlockEntranceCellsNoBranchNoLoop(self):
         cells = [ 
              [0, 1, pm.INVOKE, ('A', 'm:()V')],
@@ -87,6 +226,146 @@ class PrecompManipTest(unittest.TestCase):
         self.assertEqual(ec, [-1, 0, None, None])
         self.assertEqual(cs[0], [0, 1, pm.GOTO, 0])
 
+    def testOptmizeGotosInCellArrayRandomized(self):
+        rnd = random.Random(1)
+        for _ in range(300):
+            cells, entrance_cell = random_cell_array(rnd, rnd.randint(2, 40))
+            cs, ec = copy_cells(cells, entrance_cell)
+            reference_optmize_gotos_in_cell_array(cells, entrance_cell)
+            pm.optmize_gotos_in_cell_array(cs, ec)
+            self.assertEqual((cs, ec), (cells, entrance_cell))
+
+    def testMergeBranchesAndRemoveRepetitionsRandomized(self):
+        rnd = random.Random(2)
+        for _ in range(300):
+            cells, entrance_cell = random_cell_array(rnd, rnd.randint(2, 40))
+            pm.optmize_gotos_in_cell_array(cells, entrance_cell)
+            cs, ec = copy_cells(cells, entrance_cell)
+            reference_merge_branches_and_remove_repetitions(cells, entrance_cell)
+            incoming_edges = pm.build_incoming_edge_index(cs)
+            pm.merge_branches_in_cell_array(cs, ec, incoming_edges)
+            pm.remove_repetitions_in_cell_array(cs, ec, incoming_edges)
+            self.assertEqual((cs, ec), (cells, entrance_cell))
+            for index, srcs in incoming_edges.iteritems():
+                for ci in srcs:
+                    self.assertTrue(index in pm.cell_dest_indices(cs[ci]))
+            for cell in cs:
+                for di in pm.cell_dest_indices(cell):
+                    self.assertTrue(cell[0] in incoming_edges[di])
+
+    def testPrecompData(self):
+        cells = [
+             [0, 1, pm.BRANCHS, [3, 4]],
+             [1, 2, pm.GOTO, 4],
+             [2, None, None, None],
+             [3, 4, pm.INVOKE, ('A', 'm:()V')],
+             [4, None, pm.RETURN, None],
+        ]
+        entrance_cell = [-1, 0, None, None]
+        block_entrance_cells = pm.get_block_entrance_cells(cells, entrance_cell)
+        start_cell, valid_cells = pm.precompile_cell_array_to_cell_linked_list(cells, entrance_cell)
+        p = pm.PrecompData(valid_cells, start_cell, block_entrance_cells)
+        self.assertEqual(list(p.indices), [0, 1, 2, 3, 4])
+        self.assertEqual(p.start_node, 0)
+        self.assertEqual(list(p.cmds), [pm.BRANCHS, pm.GOTO, 0, pm.INVOKE, pm.RETURN])
+        self.assertEqual(list(p.nexts), [1, 2, -1, 4, -1])
+        self.assertEqual(list(p.branch_dests(0)), [3, 4])
+        self.assertEqual(p.args[1], 4)
+        self.assertEqual(p.invokes[p.args[3]], ('A', 'm:()V'))
+        self.assertEqual([i for i, b in enumerate(p.bents) if b], [4])
+        self.assertEqual(p.node_of(3), 3)
+        self.assertRaises(KeyError, p.node_of, 5)
+        self.assertEqual(p.dispatches, None)
+
+    def testReachableBentIndices(self):
+        ope_list = [
+            ('iload_1', (), None),
+            ('ifeq', ('4',), None),  # if (..) { A.m(); } 
+            ('invokestatic', ('#1',), '// Method A.m:()V'),
+            ('goto', ('1',), None),  # loop back
+            ('invokestatic', ('#1',), '// Method A.n:()V'),
+            ('return', (), None),
+        ]
+        p = pm.precompile_code('A', ope_list, pm.ClazMethodTables({}, {}, lambda c, m: False))
+        bent_indices = [p.indices[n] for n in range(len(p.indices)) if p.bents[n]]
+        self.assertEqual(bent_indices, [1])
+        self.assertEqual(p.reachable_bent_indices(p.node_of(1)), frozenset([1]))
+        self.assertEqual(p.reachable_bent_indices(p.node_of(2)), frozenset([1]))  # through the loop
+        self.assertEqual(p.reachable_bent_indices(p.node_of(4)), frozenset())
+        self.assertEqual(p.bent_ordinals()[p.node_of(1)], 0)
+        self.assertEqual(p.bent_ordinals()[p.node_of(2)], -1)
+        self.assertEqual(p.reachable_bent_mask(p.node_of(2)), 1)
+        self.assertEqual(p.reachable_bent_mask(p.node_of(4)), 0)
+
+    def testSuperblocks(self):
+        ope_list = [
+            ('invokestatic', ('#1',), '// Method A.a:()V'),
+            ('invokestatic', ('#1',), '// Method A.b:()V'),
+            ('iload_1', (), None),
+            ('ifeq', ('7',), None),
+            ('invokestatic', ('#1',), '// Method A.c:()V'),
+            ('invokestatic', ('#1',), '// Method A.d:()V'),
+            ('invokestatic', ('#1',), '// Method A.e:()V'),
+            ('invokestatic', ('#1',), '// Method A.f:()V'),  # a block entrance cell
+            ('return', (), None),
+        ]
+        p = pm.precompile_code('A', ope_list, pm.ClazMethodTables({}, {}, lambda c, m: False))
+        sbs = p.superblocks()
+        sb, offset = sbs[p.node_of(0)]
+        self.assertEqual(offset, 0)
+        self.assertEqual(sb[1], (0, 1))
+        self.assertEqual(sb[2], (('A', 'a:()V'), ('A', 'b:()V')))
+        sb, offset = sbs[p.node_of(6)]
+        self.assertEqual(offset, 2)
+        self.assertEqual(sb[1], (4, 5, 6))
+        self.assertEqual(sbs[p.node_of(7)], None)  # a block entrance cell heads a run of one cell
+        self.assertEqual(sbs[p.node_of(3)], None)
+
+    def testClazHierarchyDispatchCandidates(self):
+        # B extends A, C extends B, D extends A and implements I, E implements I
+        claz2supers = {'A': ((), ()), 'B': (('A',), ()), 'C': (('B',), ()), 'D': (('A',), ('I',)), 'E': ((), ('I',)), 
+                'I': ((), ())}
+        claz2methods = {'A': ['m', 'n'], 'C': ['m'], 'D': ['n'], 'E': ['m', 'n'], 'F': ['m']}
+        ch = pm.ClazHierarchy(claz2supers, claz2methods)
+        self.assertEqual(ch.dispatch_candidates('A', 'm'), ('A', 'C'))
+        self.assertEqual(ch.dispatch_candidates('B', 'm'), ('A', 'C'))  # B inherits A.m
+        self.assertEqual(ch.dispatch_candidates('C', 'm'), ('C',))
+        self.assertEqual(ch.dispatch_candidates('I', 'm'), ('A', 'E'))  # D inherits A.m
+        self.assertEqual(ch.dispatch_candidates('I', 'n'), ('D', 'E'))
+        self.assertEqual(ch.dispatch_candidates('C', 'x'), ())
+        self.assertEqual(ch.dispatch_candidates('F', 'm'), None)  # not in the hierarchy
+        self.assertEqual(ch.dispatch_candidates('java/lang/Object', 'm'), None)
+        self.assertTrue(ch.dispatch_candidates('A', 'm') is ch.dispatch_candidates('A', 'm'))
+
+    def testClazHierarchyDispatchCandidatesOfSuperInterface(self):
+        # interface J extends I, A implements I, B implements J, C implements L (not recorded, e.g. of a library)
+        claz2supers = {'I': ((), ()), 'J': ((), ('I',)), 'A': ((), ('I',)), 'B': ((), ('J',)), 'C': ((), ('L',))}
+        claz2methods = {'A': ['m'], 'B': ['m'], 'C': ['m']}
+        ch = pm.ClazHierarchy(claz2supers, claz2methods)
+        self.assertEqual(ch.dispatch_candidates('I', 'm'), ('A', 'B'))
+        self.assertEqual(ch.dispatch_candidates('J', 'm'), ('B',))
+        self.assertEqual(ch.dispatch_candidates('L', 'm'), None)
+
+    def testPrecompileCodeWithClazHierarchy(self):
+        claz2supers = {'A': ((), ()), 'B': (('A',), ())}
+        claz2methods = {'A': ['m:()I', 'run:()V'], 'B': ['m:()I']}
+        tables = pm.ClazMethodTables(claz2methods, {'A': ['B']}, lambda c, m: False, 
+                claz_hierarchy=pm.ClazHierarchy(claz2supers, claz2methods))
+        ope_list = [
+            ('aload_1', (), None),
+            ('invokevirtual', ('#1',), '// Method A.m:()I'),
+            ('aload_1', (), None),
+            ('invokevirtual', ('#2',), '// Method X.m:()I'),
+            ('return', (), None),
+        ]
+        p = pm.precompile_code('B', ope_list, claz_method_tables=tables)
+        self.assertEqual(p.invokes, [(None, 'm:()I'), ('X', 'm:()I')])
+        self.assertEqual(p.dispatches, [('A', 'B'), None])
+        q = pm.PrecompData.__new__(pm.PrecompData)
+        q.__setstate__(p.__getstate__())
+        self.assertEqual(q.invokes, p.invokes)
+        self.assertEqual(q.dispatches, p.dispatches)
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,159 @@
+#coding: utf-8
+
+import unittest
+
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import zipfile
+
+import os.path as p
+sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'src'))
+
+import run_disasm as rd
+
+# a stub of javap, which prints a canned disassembled text for each class given as argument.
+# classes whose name starts with "NoSource" are printed without 'Compiled from' line,
+# and a class named "Missing" makes it fail.
+STUB_JAVAP = """#!/bin/sh
+status=0
+for a in "$@"; do
+  case "$a" in
+    -*) ;;
+    Missing) echo "Error: class not found: $a" 1>&2; status=1 ;;
+    NoSource*) printf 'class %s {\\n  %s();\\n}\\n' "$a" "$a" ;;
+    *) printf 'Compiled from "%s.java"\\nclass %s {\\n  %s();\\n}\\n' "$a" "$a" "$a" ;;
+  esac
+done
+exit $status
+"""
+
+class TestRunDisasm(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        stub = p.join(self.tempdir, "javap")
+        with open(stub, "wb") as f:
+            f.write(STUB_JAVAP)
+        os.chmod(stub, stat.S_IRWXU)
+        self.saved_javap_command = rd.JAVAP_COMMAND
+        rd.JAVAP_COMMAND = stub
+
+    def tearDown(self):
+        rd.JAVAP_COMMAND = self.saved_javap_command
+        shutil.rmtree(self.tempdir)
+
+    def testSplitJavapOutput(self):
+        text = rd.run_javap(["a.A", "b.B"])
+        texts = rd.split_javap_output(text)
+        self.assertSequenceEqual(texts, [rd.disassemble("a.A"), rd.disassemble("b.B")])
+
+    def testDisassembleBatch(self):
+        classnames = ["a.A", "b.B", "c.C"]
+        self.assertSequenceEqual(rd.disassemble_batch(classnames),
+                [rd.disassemble(cn) for cn in classnames])
+
+    def testDisassembleBatchFallback(self):
+        classnames = ["a.A", "NoSource", "c.C"]
+        self.assertSequenceEqual(rd.disassemble_batch(classnames),
+                [rd.disassemble(cn) for cn in classnames])
+
+    def testDisassembleBatchFailure(self):
+        import subprocess
+        self.assertRaises(subprocess.CalledProcessError, rd.disassemble_batch, ["a.A", "Missing"])
+
+    def testDisassembleToFilesIter(self):
+        outputdir = p.join(self.tempdir, "out")
+        os.mkdir(outputdir)
+        classnames = ["a.A", "b.B", "c.C", "d.D", "e.E"]
+        done = list(rd.disassemble_to_files_iter(classnames, outputdir, jobs=2, batch_size=2))
+        self.assertEqual(sorted(done), classnames)
+        for cn in classnames:
+            with open(p.join(outputdir, cn + ".asm"), "rb") as f:
+                self.assertEqual(f.read().decode("utf-8"), rd.disassemble(cn))
+
+    def testJarClassTargets(self):
+        inner_jar = p.join(self.tempdir, "inner.jar")
+        with zipfile.ZipFile(inner_jar, "w") as z:
+            z.writestr("b/B.class", "dummy")
+        jar_file = p.join(self.tempdir, "app.war")
+        with zipfile.ZipFile(jar_file, "w") as z:
+            z.writestr("META-INF/MANIFEST.MF", "Manifest-Version: 1.0\n")
+            z.writestr("WEB-INF/classes/a/A.class", "dummy")
+            z.write(inner_jar, "WEB-INF/lib/inner.jar")
+        temp_files = []
+        targets = list(rd.jar_class_target_iter(jar_file, temp_files))
+        self.assertEqual([cn for cn, _ in targets], ["a.A", "b.B"])
+        self.assertEqual(targets[0][1], "jar:file:%s!/WEB-INF/classes/a/A.class" % jar_file)
+        self.assertEqual(len(temp_files), 1)
+        self.assertEqual(targets[1][1], "jar:file:%s!/b/B.class" % temp_files[0])
+        with zipfile.ZipFile(temp_files[0]) as z:
+            self.assertEqual(z.namelist(), ["b/B.class"])
+
+        outputdir = p.join(self.tempdir, "out")
+        os.mkdir(outputdir)
+        done = list(rd.disassemble_to_files_iter(targets, outputdir, batch_size=2))
+        self.assertEqual(done, ["a.A", "b.B"])
+        for cn, javap_arg in targets:
+            with open(p.join(outputdir, cn + ".asm"), "rb") as f:
+                self.assertEqual(f.read().decode("utf-8"), rd.disassemble(javap_arg))
+        for f in temp_files:
+            os.remove(f)
+
+    def testDisasmCache(self):
+        classpath = p.join(self.tempdir, "classes")
+        os.makedirs(p.join(classpath, "a"))
+        for cn in ["a.A", "a.B"]:
+            with open(p.join(classpath, *cn.split('.')) + ".class", "wb") as f:
+                f.write("class file of %s" % cn)
+        classnames = ["a.A", "a.B"]
+        cache_dir = p.join(self.tempdir, "cache")
+        os.mkdir(cache_dir)
+
+        outputdir1 = p.join(self.tempdir, "out1")
+        os.mkdir(outputdir1)
+        cache = rd.DisasmCache(cache_dir, classpath=classpath)
+        list(rd.disassemble_to_files_iter(classnames, outputdir1, classpath=classpath, cache=cache))
+        self.assertEqual((cache.hit_count, cache.miss_count), (0, 2))
+
+        # the second run does not invoke javap
+        rd.JAVAP_COMMAND = p.join(self.tempdir, "no-such-javap")
+        outputdir2 = p.join(self.tempdir, "out2")
+        os.mkdir(outputdir2)
+        cache = rd.DisasmCache(cache_dir, classpath=classpath)
+        list(rd.disassemble_to_files_iter(classnames, outputdir2, classpath=classpath, cache=cache, jobs=2))
+        self.assertEqual((cache.hit_count, cache.miss_count), (2, 0))
+        for cn in classnames:
+            with open(p.join(outputdir1, cn + ".asm"), "rb") as f1:
+                with open(p.join(outputdir2, cn + ".asm"), "rb") as f2:
+                    self.assertEqual(f2.read(), f1.read())
+
+        # a changed class file is disassembled again
+        with open(p.join(classpath, "a", "A.class"), "wb") as f:
+            f.write("changed class file of a.A")
+        cache = rd.DisasmCache(cache_dir, classpath=classpath)
+        self.assertEqual(cache.fetch(("a.A", "a.A")), None)
+        with open(p.join(outputdir1, "a.B.asm"), "rb") as f:
+            self.assertEqual(cache.fetch(("a.B", "a.B")), f.read())
+
+    def testDisassembleToPack(self):
+        import asm_manip as am
+        pack_file = p.join(self.tempdir, "corpus.pack")
+        writer = am.AsmPackWriter(pack_file)
+        list(rd.disassemble_to_files_iter(["b.B", "a.A", "c.C"], writer, jobs=2))
+        writer.close()
+        writer = am.AsmPackWriter(pack_file)  # appended
+        list(rd.disassemble_to_files_iter(["d.D"], writer))
+        writer.close()
+
+        self.assertTrue(am.is_asm_pack(pack_file))
+        asmfiles = list(am.asm_file_iter(pack_file))
+        self.assertEqual(asmfiles, [pack_file + "!/" + cn + ".asm" for cn in ["a.A", "b.B", "c.C", "d.D"]])
+        for asmfile in asmfiles:
+            cn = asmfile[len(pack_file + "!/"):-len(".asm")]
+            self.assertEqual(am.read_asm_file_data(asmfile).decode("utf-8"), rd.disassemble(cn))
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,100 @@
+#coding: utf-8
+
+import unittest
+
+import bz2
+import gzip
+import os
+import sys
+import tempfile
+
+import os.path as p
+sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'src'))
+
+import _utilities as u
+
+TEXT = '\n'.join([
+    "ngram-count 6",
+    "  trailing spaces and tab \t ",
+    "percent % sign",
+    "crlf line\r",
+    "\xe3\x81\x82 non-ascii \xe3\x80\x80",
+    "control \x1f char\x1c",
+    "",
+    "last line without newline  ",
+])
+
+class TestUtilities(unittest.TestCase):
+    def setUp(self):
+        fd, self.tempfile = tempfile.mkstemp()
+        with os.fdopen(fd, "wb") as f:
+            f.write(TEXT)
+
+    def tearDown(self):
+        os.remove(self.tempfile)
+
+    def testReadlineIter(self):
+        with open(self.tempfile, "rb") as f:
+            expected = [u._quote_line(L) for L in f]
+        self.assertEqual(expected[2], "percent %25 sign")
+        self.assertEqual(expected[4], "%E3%81%82 non-ascii")
+
+        saved_block_size = u.READ_BLOCK_SIZE
+        try:
+            for block_size in [1, 2, 3, 7, 1 << 20]:
+                u.READ_BLOCK_SIZE = block_size
+                self.assertEqual(list(u.readline_iter(self.tempfile)), expected)
+        finally:
+            u.READ_BLOCK_SIZE = saved_block_size
+
+    def testReadlineIterCompressed(self):
+        expected = list(u.readline_iter(self.tempfile))
+        gz_file = self.tempfile + ".gz"
+        bz2_file = self.tempfile + ".bz2"
+        try:
+            half = len(TEXT) // 2
+            for part in [TEXT[:half], TEXT[half:]]:  # two gzip members
+                f = gzip.open(gz_file, "ab")
+                f.write(part)
+                f.close()
+            with open(bz2_file, "wb") as f:
+                f.write(bz2.compress(TEXT))
+            saved_block_size = u.READ_BLOCK_SIZE
+            try:
+                for block_size in [1, 5, 1 << 20]:
+                    u.READ_BLOCK_SIZE = block_size
+                    self.assertEqual(list(u.readline_iter(gz_file)), expected)
+                    self.assertEqual(list(u.readline_iter(bz2_file)), expected)
+            finally:
+                u.READ_BLOCK_SIZE = saved_block_size
+        finally:
+            for f in [gz_file, bz2_file]:
+                if os.path.exists(f):
+                    os.remove(f)
+
+    def testReadlineIterTextLikeMagicBytes(self):
+        with open(self.tempfile, "wb") as f:
+            f.write("BZh91AY is not a bz2 stream\n")
+        self.assertEqual(list(u.readline_iter(self.tempfile)), ["BZh91AY is not a bz2 stream"])
+        with open(self.tempfile, "wb") as f:
+            f.write(bz2.compress(""))
+        self.assertEqual(list(u.readline_iter(self.tempfile)), [])
+
+    def testCompressingWriter(self):
+        text = ''.join("line %d\n" % i for i in xrange(10000))
+        for ext, decompress in [(".gz", lambda f: gzip.open(f).read()), (".bz2", lambda f: bz2.BZ2File(f).read())]:
+            output_file = self.tempfile + ext
+            try:
+                f = u.open_output(output_file)
+                self.assertTrue(isinstance(f, u.CompressingWriter))
+                f._chunk_size = 1000
+                for i in xrange(0, len(text), 77):
+                    f.write(text[i:i + 77])
+                f.close()
+                self.assertEqual(decompress(output_file), text)
+            finally:
+                os.remove(output_file)
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -14,8 +14,11 @@ In some case of implementation change, these tests will fail.
 
 import unittest
 
+import os
 import os.path as p
+import shutil
 import subprocess
+import tempfile
 
 #sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'src'))
 
@@ -53,6 +56,21 @@ class TestWithDeligatingSample(unittest.TestCase):
         self.assertSequenceEqual(text_blocks[0], ref_text_blocks[0])
         self.assertSequenceEqual(text_blocks[1], ref_text_blocks[1])
 
+    def testPrecompCacheOfAsmAndClasses(self):
+        # the directory contains both disassembled files and class files, which are cached separately
+        tempdir = tempfile.mkdtemp()
+        try:
+            cache_dir = J(tempdir, "cache")
+            gen_ngram = ["python", J(PROG_DIR, "gen_ngram.py"), "-n", "6"]
+            subprocess.check_output(gen_ngram + ["-a", DATA_DIR, "--precomp-cache-dir", cache_dir])
+            text = subprocess.check_output(gen_ngram + ["--classes", DATA_DIR, "--precomp-cache-dir", cache_dir]).decode('utf-8')
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+        finally:
+            shutil.rmtree(tempdir)
+        ref_text = subprocess.check_output(gen_ngram + ["--classes", DATA_DIR]).decode('utf-8')
+        self.assertSequenceEqual(sorted(map(tuple, split_by_empty_line(text.split('\n')))), 
+                sorted(map(tuple, split_by_empty_line(ref_text.split('\n')))))
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
@@ -14,8 +14,11 @@ In some case of implementation change, these tests will fail.
 
 import unittest
 
+import os
 import os.path as p
+import shutil
 import subprocess
+import tempfile
 
 #sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'src'))
 
@@ -52,6 +55,11 @@ class TestWithSampleCode(unittest.TestCase):
         ref_text_blocks = sorted(map(tuple, split_by_empty_line(ref_text.split('\n'))))
         self.assertSequenceEqual(text_blocks, ref_text_blocks)
     
+    def testGenNgramWithJobs(self):
+        text = subprocess.check_output(["python", J(PROG_DIR, "gen_ngram.py"), "-n", "6", "-a", DATA_DIR, "--allow-repetitive-ngram", "-j", "2"]).decode('utf-8')
+        ref_text = subprocess.check_output(["python", J(PROG_DIR, "gen_ngram.py"), "-n", "6", "-a", DATA_DIR, "--allow-repetitive-ngram"]).decode('utf-8')
+        self.assertEqual(text, ref_text)
+    
     def testDetCodeClone(self):
         text = subprocess.check_output(["python", J(PROG_DIR, "det_clone.py"), J(REF_DATA_DIR, "ngram.txt")]).decode('utf-8')
         text_blocks = sorted(map(tuple, split_by_empty_line(text.split('\n'))))
@@ -83,6 +91,45 @@ class TestWithSampleCode(unittest.TestCase):
         ref_text_blocks = sorted(map(tuple, split_by_empty_line(ref_text.split('\n'))))
         self.assertSequenceEqual(text_blocks, ref_text_blocks)
 
+    def testDoDetectionWithCompressedFiles(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            ngram_file = J(tempdir, "ngram.txt.gz")
+            clone_file = J(tempdir, "clone-index.txt.bz2")
+            subprocess.check_call(["python", J(PROG_DIR, "gen_ngram.py"), "-n", "6", "-a", DATA_DIR, "--allow-repetitive-ngram", "-o", ngram_file])
+            subprocess.check_call(["python", J(PROG_DIR, "det_clone.py"), ngram_file, "-o", clone_file])
+            text = subprocess.check_output(' '.join(["cat", clone_file, "|", "python", J(PROG_DIR, "tosl_clone.py"), "-a", DATA_DIR, '-']), shell=True).decode('utf-8')
+        finally:
+            shutil.rmtree(tempdir)
+        text_blocks = sorted(map(tuple, split_by_empty_line(text.split('\n'))))
+        ref_text = read_text(J(REF_DATA_DIR, "clone-linenum.txt"))
+        ref_text_blocks = sorted(map(tuple, split_by_empty_line(ref_text.split('\n'))))
+        self.assertSequenceEqual(text_blocks, ref_text_blocks)
+
+    def testGenNgramAndExpCloneWithPrecompCache(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            cache_dir = J(tempdir, "cache", "precomp")  # made by gen_ngram.py
+            gen_ngram_cmd = ["python", J(PROG_DIR, "gen_ngram.py"), "-n", "6", "-a", DATA_DIR, "--allow-repetitive-ngram",
+                    "--precomp-cache-dir", cache_dir]
+            text = subprocess.check_output(gen_ngram_cmd).decode('utf-8')
+            cache_files = os.listdir(cache_dir)
+            self.assertEqual(len(cache_files), 1)
+            self.assertEqual(subprocess.check_output(gen_ngram_cmd).decode('utf-8'), text)
+            exp_clone_text = subprocess.check_output(["python", J(PROG_DIR, "exp_clone.py"), "-cdt", "-a", DATA_DIR,
+                    "--precomp-cache-dir", cache_dir, J(REF_DATA_DIR, "clone-index.txt")]).decode('utf-8')
+            self.assertEqual(os.listdir(cache_dir), cache_files)  # shared with gen_ngram.py
+        finally:
+            shutil.rmtree(tempdir)
+        text_blocks = sorted(map(tuple, split_by_empty_line(text.split('\n'))))
+        ref_text = read_text(J(REF_DATA_DIR, "ngram.txt"))
+        ref_text_blocks = sorted(map(tuple, split_by_empty_line(ref_text.split('\n'))))
+        self.assertSequenceEqual(text_blocks, ref_text_blocks)
+        text_blocks = sorted(map(tuple, split_by_empty_line(exp_clone_text.split('\n'))))
+        ref_text = read_text(J(REF_DATA_DIR, "clone-cdt-index.txt"))
+        ref_text_blocks = sorted(map(tuple, split_by_empty_line(ref_text.split('\n'))))
+        self.assertSequenceEqual(text_blocks, ref_text_blocks)
+
     def testGenNgramWoAllowRepetition(self):
         text = subprocess.check_output(["python", J(PROG_DIR, "gen_ngram.py"), "-n", "6", "-a", DATA_DIR]).decode('utf-8')
         text_blocks = sorted(map(tuple, split_by_empty_line(text.split('\n'))))